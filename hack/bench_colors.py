@@ -0,0 +1,32 @@
+# Microbenchmark: per-row ROI color payload vs the vectorized LUT path
+# run from the repo root: python -m hack.bench_colors
+
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from src.light_minded.light_minded import map_to_colors, prepare_roi_json
+from src.light_minded.colors import values_to_rgb8, roi_payload
+
+
+def per_row(roi_df):
+    rgb_values = map_to_colors(roi_df['z_score'].values, cmap_name='RdBu_r', vmin=-5, vmax=5)
+    return prepare_roi_json(roi_df, rgb_values)
+
+
+def vectorized(roi_df):
+    rgb_values = values_to_rgb8(roi_df['z_score'].values, cmap_name='RdBu_r', vmin=-5, vmax=5)
+    return roi_payload(roi_df['roi_id'].values, rgb_values)
+
+
+rng = np.random.default_rng(0)
+for n_rois in (218, 246, 368):
+    roi_df = pd.DataFrame({
+        'roi_id': np.arange(1, n_rois + 1),
+        'z_score': rng.normal(scale=3, size=n_rois),
+    })
+    n = 200
+    old = min(timeit.repeat(lambda: per_row(roi_df), number=n, repeat=3)) / n * 1e6
+    new = min(timeit.repeat(lambda: vectorized(roi_df), number=n, repeat=3)) / n * 1e6
+    print(f"{n_rois} ROIs: per-row {old:8.1f} us | vectorized {new:6.1f} us | {old / new:5.1f}x")
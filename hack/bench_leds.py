@@ -0,0 +1,71 @@
+# LED driver throughput/latency against the local stand-in receiver
+# run from the repo root: python -m hack.bench_leds [--protocol sacn] [--rois 246]
+# a producer submits colors faster than the output rate; the first ROI's color
+# carries a frame counter so latency is measured submit -> packet arrival
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, "src")
+from led_driver import FrameScheduler, LedMap, UdpReceiver, make_transport  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LED output path.")
+    parser.add_argument("--protocol", choices=["artnet", "sacn"], default="artnet")
+    parser.add_argument("--rois", type=int, default=246)
+    parser.add_argument("--leds-per-roi", type=int, default=10)
+    parser.add_argument("--fps", type=float, default=40)
+    parser.add_argument("--submit-hz", type=float, default=120, help="producer rate")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    roi_ids = np.arange(1, args.rois + 1)
+    led_map = LedMap.sequential(roi_ids, leds_per_roi=args.leds_per_roi)
+    submitted = {}
+    latencies = []
+
+    def on_packet(universe, sequence, data, arrival):
+        # universe holding the first ROI: its first channel is the frame counter
+        if universe == first_universe and data[0] in submitted:
+            latencies.append(arrival - submitted.pop(data[0]))
+
+    with UdpReceiver(on_packet=on_packet) as receiver:
+        transport = make_transport({"type": args.protocol, "host": "127.0.0.1",
+                                    "port": receiver.port}, led_map)
+        first_universe = transport.first_universe
+        rgb = np.random.default_rng(0).integers(0, 256, size=(len(roi_ids), 3)).astype(np.uint8)
+        with FrameScheduler(led_map, transport, fps=args.fps) as scheduler:
+            start = time.perf_counter()
+            n_submitted = 0
+            while time.perf_counter() - start < args.seconds:
+                counter = n_submitted % 256
+                rgb[0] = counter
+                submitted[counter] = time.perf_counter()
+                scheduler.submit(roi_ids, rgb)
+                n_submitted += 1
+                time.sleep(1 / args.submit_hz)
+            elapsed = time.perf_counter() - start
+            time.sleep(0.2)
+        metrics = scheduler.metrics()
+        received = receiver.metrics()
+
+    latencies = np.asarray(latencies) * 1000
+    print(f"{args.protocol}: {len(roi_ids)} ROIs, {led_map.n_leds} LEDs, "
+          f"{led_map.n_universes} universes, {args.fps:.0f} fps target")
+    print(f"  submitted {n_submitted} ({n_submitted / elapsed:.0f}/s), sent {metrics['frames_sent']} "
+          f"({metrics['frames_sent'] / elapsed:.1f} fps), dropped {metrics['frames_dropped']}, "
+          f"ticks missed {metrics['ticks_missed']}")
+    print(f"  received {received['packets']} packets ({received['bytes'] / elapsed / 1024:.0f} KiB/s), "
+          f"lost {received['lost']}")
+    print(f"  send time {metrics['send_ms']} ms, interval {metrics['interval_ms']} ms")
+    if len(latencies):
+        print(f"  submit -> arrival latency: p50 {np.percentile(latencies, 50):.2f} ms, "
+              f"p95 {np.percentile(latencies, 95):.2f} ms, max {latencies.max():.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Load test: requests/second of POST /set (pydantic ROIData) vs POST /set/packed
+# run from the repo root: python -m hack.load_test_set [--url http://localhost:8000]
+# without --url a server is started on a free port (colors only, no model)
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, "src")
+from light_minded.atlases import DEFAULT_ATLAS, get_atlas  # noqa: E402
+
+
+def start_server():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # the app mounts web/webgl_output relative to its working directory
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "web", "webgl_output"))
+    env = dict(os.environ, LIGHT_MINDED_LOAD_MODEL="0",
+               PYTHONPATH=os.path.abspath("src"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_server.main:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=root, env=env,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(url, timeout=30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(f"{url}/get")
+                return
+            except httpx.TransportError:
+                if time.perf_counter() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+def make_cases(url):
+    roi_ids = get_atlas(os.environ.get("LIGHT_MINDED_ATLAS", DEFAULT_ATLAS)).region_ids
+    rgb = np.random.default_rng(0).integers(0, 256, size=(len(roi_ids), 3))
+    return len(roi_ids), {
+        "/set (ROIData)": dict(url=f"{url}/set", json={"data": [
+            {"id": int(i), "r": int(r), "g": int(g), "b": int(b)} for i, (r, g, b) in zip(roi_ids, rgb)
+        ]}),
+        "/set/packed (JSON list)": dict(url=f"{url}/set/packed", json=rgb.ravel().tolist()),
+        "/set/packed (binary)": dict(url=f"{url}/set/packed", content=rgb.astype(np.uint8).tobytes(),
+                                     headers={"content-type": "application/octet-stream"}),
+    }
+
+
+async def post_many(request, n_requests, concurrency):
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency), timeout=30) as client:
+        async def worker(count):
+            for _ in range(count):
+                response = await client.post(**request)
+                response.raise_for_status()
+
+        await asyncio.gather(*(worker(n_requests // concurrency) for _ in range(concurrency)))
+    return n_requests // concurrency * concurrency
+
+
+def client_process(args):
+    # httpx is slower than the server, so load comes from several processes
+    request, n_requests, concurrency = args
+    return asyncio.run(post_many(request, n_requests, concurrency))
+
+
+def run(url, n_requests, concurrency, n_processes):
+    n_rois, cases = make_cases(url)
+    asyncio.run(wait_ready(url))
+    with multiprocessing.Pool(n_processes) as pool:
+        for name, request in cases.items():
+            pool.map(client_process, [(request, 20, 4)] * n_processes)  # warm up
+            start = time.perf_counter()
+            n_done = sum(pool.map(client_process, [(request, n_requests // n_processes, concurrency)]
+                                  * n_processes))
+            seconds = time.perf_counter() - start
+            print(f"{name:26s} {n_done / seconds:8.0f} req/s ({n_rois} ROIs, "
+                  f"{n_processes} x {concurrency} concurrent)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /set endpoints.")
+    parser.add_argument("--url", default=None, help="running server (default: start one)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8, help="connections per client process")
+    parser.add_argument("--processes", type=int, default=4, help="client processes")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server()
+    try:
+        run(url, args.requests, args.concurrency, args.processes)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from src.light_minded import config, launch
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python main_caller.py [config|launch]")
+        print("Usage: python main_caller.py [config|launch|batch <prompts_file> [output_dir]]")
         sys.exit(1)
 
     print("Welcome to light-minded!")
@@ -15,6 +15,13 @@ def main():
     elif command == "launch":
         #print("Launching...")
         launch.run()
+    elif command == "batch":
+        if len(sys.argv) < 3:
+            print("Usage: python main_caller.py batch <prompts_file> [output_dir]")
+            sys.exit(1)
+        from src.light_minded import batch
+        output_dir = sys.argv[3] if len(sys.argv) > 3 else "hack/batch_outputs"
+        batch.run_batch(batch.read_prompts(sys.argv[2]), output_dir)
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
@@ -0,0 +1,167 @@
+# Shared marching-cubes helpers for simulator.py and nii2stl.py
+
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import ndimage, sparse
+from skimage import measure
+
+# the scripts run from a checkout; the atlas registry lives in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+from light_minded.atlases import get_atlas  # noqa: E402
+
+
+def load_labels(atlas):
+    """
+    Integer label volume of an atlas, through the atlas registry (loaded once,
+    memory-mapped from the label cache).
+
+    Parameters:
+    - atlas: registry name (e.g. "bna_246_1mm") or path to a label .nii(.gz)
+    """
+    return get_atlas(atlas).labels
+
+
+def label_boxes(labels):
+    """
+    Bounding box of every non-zero label, from one find_objects pass.
+
+    The box is grown by one voxel where the volume allows it, so marching
+    cubes on the crop sees the same zero border as on the full volume.
+
+    Returns:
+    - dict of label id -> tuple of slices
+    """
+    boxes = {}
+    for i, box in enumerate(ndimage.find_objects(labels), start=1):
+        if box is None:
+            continue
+        boxes[i] = tuple(
+            slice(max(s.start - 1, 0), min(s.stop + 1, dim))
+            for s, dim in zip(box, labels.shape)
+        )
+    return boxes
+
+
+def label_hashes(labels, boxes=None):
+    """
+    Content hash of every label's voxel mask (its bounding box and packed bits).
+
+    Returns:
+    - dict of label id -> hex digest
+    """
+    boxes = label_boxes(labels) if boxes is None else boxes
+    hashes = {}
+    for label_id, box in boxes.items():
+        digest = hashlib.sha1(repr([(s.start, s.stop) for s in box]).encode())
+        digest.update(np.packbits(labels[box] == label_id).tobytes())
+        hashes[label_id] = digest.hexdigest()
+    return hashes
+
+
+def vertex_normals(verts, faces):
+    """Area-weighted vertex normals from face normals."""
+    face_normals = np.cross(verts[faces[:, 1]] - verts[faces[:, 0]],
+                            verts[faces[:, 2]] - verts[faces[:, 0]])
+    normals = np.zeros_like(verts)
+    for k in range(3):
+        np.add.at(normals, faces[:, k], face_normals)
+    # skimage's face winding gives inward cross products, flip to match its normals
+    normals *= -1
+    return normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+
+def smooth_mesh(verts, faces, iterations=5, lam=0.5, mu=-0.53):
+    """
+    Taubin smoothing (Laplacian steps alternating lam/mu, so the mesh does
+    not shrink). Returns new vertices and recomputed normals.
+    """
+    n = len(verts)
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    adjacency = sparse.coo_matrix(
+        (np.ones(len(edges) * 2), (np.r_[edges[:, 0], edges[:, 1]], np.r_[edges[:, 1], edges[:, 0]])),
+        shape=(n, n),
+    ).tocsr()
+    adjacency.data[:] = 1.0
+    degree = np.maximum(np.asarray(adjacency.sum(axis=1)), 1)
+
+    verts = verts.astype(np.float64)
+    for _ in range(iterations):
+        for factor in (lam, mu):
+            verts = verts + factor * (adjacency @ verts / degree - verts)
+    verts = verts.astype(np.float32)
+    return verts, vertex_normals(verts, faces)
+
+
+def _mesh_crop(task):
+    label_id, mask, offset, step_sizes, smooth_iterations = task
+    meshes, error = [], None
+    for step_size in step_sizes:
+        try:
+            verts, faces, normals, values = measure.marching_cubes(mask, 0, step_size=step_size)
+        except Exception as e:
+            # coarse steps can miss very small regions entirely
+            meshes.append(None)
+            error = error or e
+            continue
+        if smooth_iterations:
+            verts, normals = smooth_mesh(verts, faces, smooth_iterations)
+        # back to full-volume voxel coordinates
+        verts += offset
+        meshes.append((verts, faces, normals))
+    if all(mesh is None for mesh in meshes):
+        return label_id, None, error
+    return label_id, meshes, None
+
+
+def mesh_labels(labels, label_ids=None, n_jobs=None, step_sizes=(1,), smooth_iterations=0,
+                crop=True):
+    """
+    Run marching cubes per label on its bounding box, across a process pool.
+
+    Parameters:
+    - labels: integer label volume
+    - label_ids: labels to mesh (defaults to every non-zero label)
+    - n_jobs: worker processes (defaults to the CPU count, 1 runs inline)
+    - step_sizes: marching cubes step sizes, one mesh per entry; >1 gives
+      coarser meshes (used for level-of-detail tiers)
+    - smooth_iterations: Taubin smoothing iterations applied to every mesh
+    - crop: mesh each label on its bounding box (False runs every label on
+      the full volume, for checking the crop)
+
+    Returns:
+    - iterator of (label_id, [(verts, faces, normals) or None per step size]
+      or None, exception or None), in label order
+
+    Raises ValueError (before any meshing) for requested labels that are not
+    in the volume.
+    """
+    boxes = label_boxes(labels)
+    if label_ids is None:
+        label_ids = sorted(boxes)
+    unknown = sorted(set(label_ids) - set(boxes))
+    if unknown:
+        raise ValueError(f"Labels not in the volume: {unknown}")
+    if not crop:
+        full = tuple(slice(0, dim) for dim in labels.shape)
+        boxes = dict.fromkeys(label_ids, full)
+    return _mesh_boxes(labels, boxes, label_ids, n_jobs, step_sizes, smooth_iterations)
+
+
+def _mesh_boxes(labels, boxes, label_ids, n_jobs, step_sizes, smooth_iterations):
+    def tasks():
+        for label_id in label_ids:
+            box = boxes[label_id]
+            mask = (labels[box] == label_id).astype(np.uint8)
+            offset = np.array([s.start for s in box], dtype=np.float32)
+            yield label_id, mask, offset, tuple(step_sizes), smooth_iterations
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1:
+        yield from map(_mesh_crop, tasks())
+        return
+    with ProcessPoolExecutor(n_jobs) as pool:
+        yield from pool.map(_mesh_crop, tasks(), chunksize=4)
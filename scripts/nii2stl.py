@@ -1,31 +1,113 @@
 # Based on the work here https://github.com/amine0110/nifti-to-stl
 
-import nibabel as nib
+import argparse
+import os
+import time
+
 import numpy as np
-from stl import mesh
-from skimage import measure
+from stl import Mode, mesh
+
+from meshing import load_labels, mesh_labels
 
 # Path to the nifti file (.nii, .nii.gz)
 file_path = "hack/BN_Atlas_246_1mm.nii.gz"
 
-# Extract the numpy array
-nifti_file = nib.load(file_path)
-np_array = nifti_file.get_fdata()
 
-unique_vals = np.unique(np_array)
-print(f"Distinct values in array: {unique_vals}")
+def to_stl(vectors):
+    """STL mesh from an (n_faces, 3, 3) array of triangle corners."""
+    obj_3d = mesh.Mesh(np.zeros(len(vectors), dtype=mesh.Mesh.dtype))
+    obj_3d.vectors[:] = vectors
+    return obj_3d
+
+
+def export_stl(atlas=file_path, output_dir=".", label_ids=None, combined=None,
+               separate=True, n_jobs=None, step_size=1, smooth_iterations=0, crop=True):
+    """
+    Export atlas regions as STL files.
+
+    Each label (background excluded) is meshed on its bounding box across a
+    process pool.
+
+    Parameters:
+    - atlas: label atlas (.nii/.nii.gz)
+    - output_dir: directory for `segmentation_<label>.stl` files
+    - label_ids: labels to export (defaults to every non-zero label)
+    - combined: optional path of one binary STL holding every exported label
+    - separate: write one STL per label
+    - n_jobs: worker processes (defaults to the CPU count)
+    - step_size: marching cubes step size, >1 gives coarser meshes
+    - smooth_iterations: Taubin smoothing iterations (0 for raw voxel surfaces)
+    - crop: mesh each label on its bounding box instead of the full volume
+
+    Returns:
+    - list of written file paths
+
+    Raises ValueError for label_ids that are not in the atlas.
+    """
+    labels = load_labels(atlas)
+    # checks label_ids before anything is written
+    results = mesh_labels(labels, label_ids, n_jobs=n_jobs, step_sizes=(step_size,),
+                          smooth_iterations=smooth_iterations, crop=crop)
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    combined_vectors = []
+
+    for i, meshes, error in results:
+        if error is not None:
+            print(f"  Error processing value {int(i)}: {error}")
+            continue
+        verts, faces, normals = meshes[0]
+        # all triangle corners in one fancy-indexing step
+        vectors = verts[faces]
+        if combined:
+            combined_vectors.append(vectors)
+        if separate:
+            output_file = os.path.join(output_dir, f"segmentation_{int(i)}.stl")
+            # Save the STL file with the name and the path
+            to_stl(vectors).save(output_file, mode=Mode.BINARY)
+            written.append(output_file)
+            print(f"  Created {output_file} ({len(faces)} triangles)")
+
+    if combined:
+        vectors = np.concatenate(combined_vectors) if combined_vectors else np.zeros((0, 3, 3))
+        to_stl(vectors).save(combined, mode=Mode.BINARY)
+        written.append(combined)
+        print(f"  Created {combined} ({len(vectors)} triangles, {len(combined_vectors)} regions)")
+    return written
 
-for i in unique_vals:
-    output_file = f"segmentation_{int(i)}.stl"
-    print(f"Creating mask for value: {int(i)} file: {output_file}")
 
-    masked_array = (np_array == i).astype(np.uint8)
+def main():
+    parser = argparse.ArgumentParser(description="Export atlas regions as STL meshes.")
+    parser.add_argument("--atlas", default=file_path,
+                        help="label atlas: registry name (e.g. bna_218) or .nii/.nii.gz path")
+    parser.add_argument("--output-dir", default=".", help="directory for per-region STL files")
+    parser.add_argument("--labels", type=int, nargs="+", default=None,
+                        help="labels to export (default: every non-zero label)")
+    parser.add_argument("--combined", default=None,
+                        help="also write every region into this single binary STL file")
+    parser.add_argument("--combined-only", action="store_true",
+                        help="only write the combined STL, no per-region files")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--step-size", type=int, default=1,
+                        help="marching cubes step size, >1 gives coarser meshes")
+    parser.add_argument("--smooth", type=int, default=0,
+                        help="Taubin smoothing iterations applied to every mesh (default: none)")
+    parser.add_argument("--no-crop", action="store_true",
+                        help="mesh every label on the full volume instead of its bounding box")
+    args = parser.parse_args()
+    if args.combined_only and not args.combined:
+        parser.error("--combined-only requires --combined")
 
-    verts, faces, normals, values = measure.marching_cubes(masked_array, 0)
-    obj_3d = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
+    start = time.perf_counter()
+    try:
+        written = export_stl(args.atlas, args.output_dir, label_ids=args.labels,
+                             combined=args.combined, separate=not args.combined_only,
+                             n_jobs=args.jobs, step_size=args.step_size,
+                             smooth_iterations=args.smooth, crop=not args.no_crop)
+    except ValueError as e:
+        parser.error(f"--labels: {e}")
+    print(f"Wrote {len(written)} STL files in {time.perf_counter() - start:.1f}s")
 
-    for i, f in enumerate(faces):
-        obj_3d.vectors[i] = verts[f]
 
-    # Save the STL file with the name and the path
-    obj_3d.save(output_file)
+if __name__ == "__main__":
+    main()
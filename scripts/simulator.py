@@ -1,20 +1,21 @@
 # Based on the work here https://github.com/amine0110/nifti-to-stl
 
-import nibabel as nib
-import numpy as np
-from skimage import measure
+import argparse
 import colorsys
+import hashlib
 import json
 import os
 import re
+import time
+
+import numpy as np
+
+from meshing import label_hashes, load_labels, mesh_labels
 
 # Path to the nifti file (.nii, .nii.gz)
 file_path = "hack/BN_Atlas_246_1mm.nii.gz"
 table_path = "hack/bn_246_table.md"
 
-# Create output directory for the WebGL data
-os.makedirs("web/webgl_output", exist_ok=True)
-
 
 # Parse the bn_246_table.md file to extract metadata
 def parse_brain_regions_table(file_path):
@@ -68,58 +69,177 @@ def parse_brain_regions_table(file_path):
     return region_metadata
 
 
-# Load the brain region metadata
-region_metadata = parse_brain_regions_table(table_path)
-print(f"Loaded metadata for {len(region_metadata)} brain regions")
+def region_color(idx, n_values):
+    # Calculate HSL color based on the value's position in the range
+    # Map the index to a hue value between 0 and 360 degrees
+    hue = (idx / (n_values - 1)) * 360
+    # Convert HSL to RGB (saturation=1.0, lightness=0.5)
+    rgb = colorsys.hls_to_rgb(hue / 360, 0.5, 1.0)
+
+    # Scale RGB values to 0-255 range and convert to hex
+    color_hex = "#{:02x}{:02x}{:02x}".format(
+        int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255)
+    )
+    return hue, color_hex
+
+
+def write_mesh_bin(path, verts, faces, normals):
+    """
+    Write one region as a flat little-endian buffer:
+    float32 positions | float32 normals | uint16/uint32 indices.
+
+    Returns the manifest entry describing the layout.
+    """
+    positions = np.ascontiguousarray(verts, dtype="<f4")
+    normals = np.ascontiguousarray(normals, dtype="<f4")
+    index_type = "uint16" if len(verts) < 2 ** 16 else "uint32"
+    indices = np.ascontiguousarray(faces, dtype="<u2" if index_type == "uint16" else "<u4")
+
+    with open(path, "wb") as f:
+        f.write(positions.tobytes())
+        f.write(normals.tobytes())
+        f.write(indices.tobytes())
 
-# Extract the numpy array
-nifti_file = nib.load(file_path)
-np_array = nifti_file.get_fdata()
+    return {
+        "file": os.path.basename(path),
+        "vertex_count": len(positions),
+        "index_count": indices.size,
+        "index_type": index_type,
+        "positions_offset": 0,
+        "normals_offset": positions.nbytes,
+        "indices_offset": positions.nbytes + normals.nbytes,
+    }
 
-unique_vals = np.unique(np_array)
-print(f"Distinct values in array: {unique_vals}")
-print(f"Number of unique values: {len(unique_vals)}")
 
-# Create a list to store all mesh data for the viewer
-all_meshes = []
+# Level-of-detail tiers: marching cubes step size and the camera distance
+# from which the viewer switches to that tier
+LOD_TIERS = [
+    {"step_size": 1, "distance": 0},
+    {"step_size": 2, "distance": 220},
+    {"step_size": 4, "distance": 350},
+]
 
-# Process each unique value
-for idx, i in enumerate(unique_vals):
-    if i == 0:  # Skip background value (typically 0)
-        continue
 
-    print(f"Processing value: {int(i)} ({idx}/{len(unique_vals)})")
+# Per-region content hashes and manifest entries of the last build
+build_cache_path = "web/webgl_output/build_cache.json"
 
-    # Create a binary mask for this value
-    masked_array = (np_array == i).astype(np.uint8)
 
-    # Generate mesh using marching cubes
+def load_build_cache(path=build_cache_path):
     try:
-        verts, faces, normals, values = measure.marching_cubes(masked_array, 0)
-
-        # Calculate HSL color based on the value's position in the range
-        # Map the index to a hue value between 0 and 360 degrees
-        hue = (idx / (len(unique_vals) - 1)) * 360
-        # Convert HSL to RGB (saturation=1.0, lightness=0.5)
-        rgb = colorsys.hls_to_rgb(hue / 360, 0.5, 1.0)
-
-        # Scale RGB values to 0-255 range and convert to hex
-        color_hex = "#{:02x}{:02x}{:02x}".format(
-            int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255)
-        )
-
-        # Create a mesh object for Three.js
-        mesh_data = {
-            "id": int(i),
-            "color": color_hex,
-            "hue": hue,
-            "vertices": verts.tolist(),
-            "faces": faces.tolist(),
-            "normals": normals.tolist(),
+        with open(path) as f:
+            return json.load(f)["regions"]
+    except (FileNotFoundError, KeyError, ValueError):
+        return {}
+
+
+def region_key(mask_hash, metadata, lod_tiers, smooth_iterations):
+    """Cache key of one region: its voxel mask, its metadata row and the mesh settings."""
+    payload = json.dumps([mask_hash, metadata, lod_tiers, smooth_iterations], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def write_if_changed(path, content):
+    """Write a text file only if its content differs; returns whether it was written."""
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "w") as f:
+        f.write(content)
+    return True
+
+
+def build_meshes(labels, region_metadata, n_jobs=None, legacy_json=False,
+                 lod_tiers=LOD_TIERS, smooth_iterations=0, force=False):
+    """
+    Mesh every region (cropped to its bounding box) at each LOD tier and write its binary buffers.
+
+    Regions whose voxel mask, metadata row and mesh settings match the build
+    cache keep their existing buffers; `force` re-meshes everything.
+
+    Returns the manifest entries and the mean vertex position used to center the viewer.
+    """
+    region_ids = np.unique(labels)
+    region_ids = region_ids[region_ids != 0].tolist()
+    # hue index counts the background value, as in the original viewer colors
+    n_values = len(region_ids) + 1
+
+    previous = load_build_cache()
+    cache = {} if force else previous
+    mask_hashes = label_hashes(labels)
+    keys = {
+        i: region_key(mask_hashes[i], region_metadata.get(i), lod_tiers, smooth_iterations)
+        for i in region_ids
+    }
+    built = {}
+    for i in region_ids:
+        entry = cache.get(str(i))
+        if (entry is not None and entry["key"] == keys[i]
+                and all(os.path.exists(f"web/webgl_output/{lod['file']}") for lod in entry["lods"])):
+            built[i] = entry
+    stale = [i for i in region_ids if i not in built]
+    print(f"Number of regions: {len(region_ids)} ({len(stale)} to mesh, {len(built)} unchanged)")
+
+    step_sizes = [tier["step_size"] for tier in lod_tiers]
+    for idx, (i, meshes, error) in enumerate(
+        mesh_labels(labels, stale, n_jobs=n_jobs, step_sizes=step_sizes,
+                    smooth_iterations=smooth_iterations),
+        start=1,
+    ):
+        if error is not None:
+            print(f"  Error processing value {int(i)}: {error}")
+            continue
+
+        # Write each tier as one flat binary buffer, described in the manifest;
+        # a tier too coarse for a small region reuses the previous one
+        lods = []
+        for level, (tier, mesh) in enumerate(zip(lod_tiers, meshes)):
+            if mesh is None:
+                if lods:
+                    lods.append(dict(lods[-1], distance=tier["distance"]))
+                continue
+            verts, faces, normals = mesh
+            lods.append({
+                "distance": tier["distance"],
+                **write_mesh_bin(f"web/webgl_output/mesh_{int(i)}_lod{level}.bin",
+                                 verts, faces, normals),
+            })
+        lods[0]["distance"] = 0
+
+        verts, faces, normals = next(mesh for mesh in meshes if mesh is not None)
+        built[i] = {
+            "key": keys[i],
+            "lods": lods,
+            "vertex_sum": verts.sum(axis=0, dtype=np.float64).tolist(),
+            "vertex_count": len(verts),
         }
 
+        if legacy_json:
+            # Old text format of the full-detail mesh, only to compare size and load time
+            with open(f"web/webgl_output/mesh_{int(i)}.json", "w") as f:
+                json.dump({"id": int(i), "vertices": verts.tolist(), "faces": faces.tolist(),
+                           "normals": normals.tolist()}, f)
+
+        triangles = "/".join(str(lod["index_count"] // 3) for lod in lods)
+        print(f"  Created mesh for value {int(i)} ({idx}/{len(stale)}), triangles per tier {triangles}")
+
+    # Create a list to store all mesh data for the viewer; colors follow the
+    # region's position in the atlas, so they are assigned here and never cached
+    all_meshes = []
+    vertex_sum = np.zeros(3)
+    vertex_count = 0
+    for idx, region_id in enumerate(region_ids, start=1):
+        if region_id not in built:
+            continue
+        entry = built[region_id]
+        hue, color_hex = region_color(idx, n_values)
+        mesh_data = {"id": region_id, "color": color_hex, "hue": hue, "lods": entry["lods"]}
+        vertex_sum += entry["vertex_sum"]
+        vertex_count += entry["vertex_count"]
+
         # Add the metadata from the table if available
-        region_id = int(i)
         if region_id in region_metadata:
             mesh_data.update(
                 {
@@ -132,23 +252,22 @@ for idx, i in enumerate(unique_vals):
                 }
             )
 
-        # Save individual mesh data to a JSON file
-        with open(f"web/webgl_output/mesh_{int(i)}.json", "w") as f:
-            json.dump(mesh_data, f)
-
         # Add to the collection of all meshes
         all_meshes.append(mesh_data)
 
-        print(f"  Created mesh for value {int(i)} with color {color_hex}")
+    # Remove the buffers of regions that are no longer in the atlas
+    for region_id, entry in previous.items():
+        if int(region_id) not in built:
+            for lod in entry["lods"]:
+                if os.path.exists(f"web/webgl_output/{lod['file']}"):
+                    os.remove(f"web/webgl_output/{lod['file']}")
 
-    except Exception as e:
-        print(f"  Error processing value {int(i)}: {e}")
+    with open(build_cache_path, "w") as f:
+        json.dump({"regions": {str(i): entry for i, entry in built.items()}}, f)
 
-# Save the index file with references to all meshes
-with open("web/webgl_output/mesh_index.json", "w") as f:
-    json.dump({"meshes": all_meshes}, f)
+    center = (vertex_sum / max(vertex_count, 1)).tolist()
+    return all_meshes, center
 
-print(f"Processed {len(all_meshes)} meshes")
 
 # Create an HTML file with Three.js for visualization
 html_content = """<!DOCTYPE html>
@@ -374,8 +493,13 @@ html_content = """<!DOCTYPE html>
         directionalLight.position.set(1, 1, 1);
         scene.add(directionalLight);
         
-        // Meshes collection
+        // Meshes collection (one THREE.LOD per region) and their shared materials
         const meshes = [];
+        const regionMaterials = [];
+        
+        // Finest LOD tier to download: ?lod=N overrides, low-core devices skip full detail
+        const lodParam = parseInt(new URLSearchParams(window.location.search).get('lod'), 10);
+        const minLevel = Number.isNaN(lodParam) ? (navigator.hardwareConcurrency <= 4 ? 1 : 0) : lodParam;
         let loadedCount = 0;
         let totalCount = 0;
         
@@ -486,7 +610,7 @@ html_content = """<!DOCTYPE html>
                     // Create color indicator
                     const colorSpan = document.createElement('span');
                     colorSpan.className = 'region-color';
-                    colorSpan.style.backgroundColor = mesh.material.color.getStyle();
+                    colorSpan.style.backgroundColor = mesh.userData.color;
                     
                     // Create region label
                     const label = document.createElement('span');
@@ -517,99 +641,98 @@ html_content = """<!DOCTYPE html>
             if (this.checked) populateRegionList('network');
         });
         
-        // Load the index file
+        // Load the manifest, then each region's binary buffer straight into typed arrays
+        const loadStart = performance.now();
         fetch('./webgl_output/mesh_index.json')
             .then(response => response.json())
-            .then(data => {
-                totalCount = data.meshes.length;
+            .then(manifest => {
+                totalCount = manifest.meshes.length;
                 document.getElementById('loading').textContent = `Loading brain regions... (0/${totalCount})`;
                 
-                // Center point calculation
-                let centerX = 0, centerY = 0, centerZ = 0;
-                let vertexCount = 0;
-                
-                // First pass to calculate center
-                data.meshes.forEach(meshData => {
-                    meshData.vertices.forEach(vertex => {
-                        centerX += vertex[0];
-                        centerY += vertex[1];
-                        centerZ += vertex[2];
-                        vertexCount++;
-                    });
-                });
+                // Center point is precomputed by simulator.py
+                const [centerX, centerY, centerZ] = manifest.center;
                 
-                // Calculate average center
-                if (vertexCount > 0) {
-                    centerX /= vertexCount;
-                    centerY /= vertexCount;
-                    centerZ /= vertexCount;
+                // Build one geometry per tier from views on its downloaded buffer
+                function loadGeometry(lodData) {
+                    return fetch('./webgl_output/' + lodData.file)
+                        .then(response => response.arrayBuffer())
+                        .then(buffer => {
+                            const geometry = new THREE.BufferGeometry();
+                            const positions = new Float32Array(buffer, lodData.positions_offset,
+                                                               lodData.vertex_count * 3);
+                            const normals = new Float32Array(buffer, lodData.normals_offset, lodData.vertex_count * 3);
+                            const IndexArray = lodData.index_type === 'uint16' ? Uint16Array : Uint32Array;
+                            const indices = new IndexArray(buffer, lodData.indices_offset, lodData.index_count);
+                            
+                            geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+                            geometry.setAttribute('normal', new THREE.BufferAttribute(normals, 3));
+                            geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+                            geometry.translate(-centerX, -centerY, -centerZ);
+                            return geometry;
+                        });
                 }
                 
-                // Second pass to create meshes
-                data.meshes.forEach(meshData => {
-                    // Create geometry
-                    const geometry = new THREE.BufferGeometry();
-                    
-                    // Extract vertices and adjust to center
-                    const vertices = [];
-                    meshData.vertices.forEach(vertex => {
-                        vertices.push(
-                            vertex[0] - centerX,
-                            vertex[1] - centerY,
-                            vertex[2] - centerZ
-                        );
-                    });
-                    
-                    // Extract faces (indices)
-                    const indices = [];
-                    meshData.faces.forEach(face => {
-                        indices.push(face[0], face[1], face[2]);
-                    });
-                    
-                    // Set attributes
-                    geometry.setAttribute('position', new THREE.Float32BufferAttribute(vertices, 3));
-                    geometry.setIndex(indices);
-                    geometry.computeVertexNormals();
-                    
-                    // Create material with the HSL-derived color
-                    const material = new THREE.MeshPhongMaterial({
-                        color: new THREE.Color(meshData.color),
-                        transparent: true,
-                        opacity: 0.8,
-                        side: THREE.DoubleSide
+                return Promise.all(manifest.meshes.map(meshData => {
+                    // Tiers below minLevel are never downloaded; tiers sharing a file share a geometry
+                    const lods = meshData.lods.slice(Math.min(minLevel, meshData.lods.length - 1));
+                    const geometries = {};
+                    lods.forEach(lodData => {
+                        if (!geometries[lodData.file]) geometries[lodData.file] = loadGeometry(lodData);
                     });
-                    
-                    // Create mesh
-                    const mesh = new THREE.Mesh(geometry, material);
-                    mesh.userData = {
-                        id: meshData.id,
-                        hue: meshData.hue
-                    };
-                    
-                    // Add additional metadata if available
-                    if (meshData.lobe) {
-                        mesh.userData.lobe = meshData.lobe;
-                        mesh.userData.gyrus = meshData.gyrus;
-                        mesh.userData.hemisphere = meshData.hemisphere;
-                        mesh.userData.hemisphere_name = meshData.hemisphere_name;
-                        mesh.userData.network = meshData.network;
-                        mesh.userData.network_id = meshData.network_id;
-                    }
-                    
-                    scene.add(mesh);
-                    meshes.push(mesh);
-                    
-                    loadedCount++;
-                    document.getElementById('loading').textContent = 
-                        `Loading brain regions... (${loadedCount}/${totalCount})`;
-                        
-                    if (loadedCount === totalCount) {
-                        document.getElementById('loading').style.display = 'none';
-                        
-                        // Initialize the region list with the default grouping (lobe)
-                        populateRegionList('lobe');
-                    }
-                });
+                    return Promise.all(lods.map(lodData => geometries[lodData.file]))
+                        .then(lodGeometries => {
+                            // Create material with the HSL-derived color, shared by every tier
+                            const material = new THREE.MeshPhongMaterial({
+                                color: new THREE.Color(meshData.color),
+                                transparent: true,
+                                opacity: 0.8,
+                                side: THREE.DoubleSide
+                            });
+                            regionMaterials.push(material);
+                            
+                            const userData = {
+                                id: meshData.id,
+                                hue: meshData.hue,
+                                color: meshData.color
+                            };
+                            
+                            // Add additional metadata if available
+                            if (meshData.lobe) {
+                                userData.lobe = meshData.lobe;
+                                userData.gyrus = meshData.gyrus;
+                                userData.hemisphere = meshData.hemisphere;
+                                userData.hemisphere_name = meshData.hemisphere_name;
+                                userData.network = meshData.network;
+                                userData.network_id = meshData.network_id;
+                            }
+                            
+                            // The renderer switches tiers by camera distance every frame
+                            const mesh = new THREE.LOD();
+                            mesh.userData = userData;
+                            lodGeometries.forEach((geometry, level) => {
+                                const levelMesh = new THREE.Mesh(geometry, material);
+                                levelMesh.userData = userData;
+                                mesh.addLevel(levelMesh, level === 0 ? 0 : lods[level].distance);
+                            });
+                            
+                            scene.add(mesh);
+                            meshes.push(mesh);
+                            
+                            loadedCount++;
+                            document.getElementById('loading').textContent = 
+                                `Loading brain regions... (${loadedCount}/${totalCount})`;
+                                
+                            if (loadedCount === totalCount) {
+                                document.getElementById('loading').style.display = 'none';
+                                
+                                // Initialize the region list with the default grouping (lobe)
+                                populateRegionList('lobe');
+                            }
+                        });
+                }));
+            })
+            .then(() => {
+                console.log(`Loaded ${totalCount} brain regions in ${(performance.now() - loadStart).toFixed(0)} ms`);
             })
             .catch(error => {
                 console.error('Error loading mesh data:', error);
@@ -630,8 +753,8 @@ html_content = """<!DOCTYPE html>
         
         document.getElementById('opacity').addEventListener('input', function() {
             const opacity = parseFloat(this.value);
-            meshes.forEach(mesh => {
-                mesh.material.opacity = opacity;
+            regionMaterials.forEach(material => {
+                material.opacity = opacity;
             });
         });
         
@@ -651,7 +774,7 @@ html_content = """<!DOCTYPE html>
             raycaster.setFromCamera(mouse, camera);
             
             // Find intersections
-            const intersects = raycaster.intersectObjects(meshes);
+            const intersects = raycaster.intersectObjects(meshes, false);
             
             // Reset previously hovered object
             if (hoveredObject && (!intersects.length || intersects[0].object !== hoveredObject)) {
@@ -680,7 +803,7 @@ html_content = """<!DOCTYPE html>
             raycaster.setFromCamera(mouse, camera);
             
             // Find intersections
-            const intersects = raycaster.intersectObjects(meshes);
+            const intersects = raycaster.intersectObjects(meshes, false);
             
             // Reset previously selected object
             if (selectedObject) {
@@ -746,8 +869,88 @@ html_content = """<!DOCTYPE html>
 </html>
 """
 
-# Write the HTML file
-with open("web/brain_regions_3d.html", "w") as f:
-    f.write(html_content)
 
-print("Created WebGL visualization HTML file: web/brain_regions_3d.html")
+def report_sizes(all_meshes, compare_json=False):
+    """Print on-disk size and read/parse time of the binary meshes (and the JSON ones)."""
+    out_dir = "web/webgl_output"
+    start = time.perf_counter()
+    binary_bytes = os.path.getsize(f"{out_dir}/mesh_index.json")
+    tier_bytes = {}
+    for mesh_data in all_meshes:
+        files = set()
+        for level, lod in enumerate(mesh_data["lods"]):
+            if lod["file"] in files:
+                continue
+            files.add(lod["file"])
+            with open(f"{out_dir}/{lod['file']}", "rb") as f:
+                buffer = f.read()
+            np.frombuffer(buffer, dtype="<f4", count=lod["vertex_count"] * 6)
+            binary_bytes += len(buffer)
+            tier_bytes[level] = tier_bytes.get(level, 0) + len(buffer)
+    binary_seconds = time.perf_counter() - start
+    print(f"Binary meshes: {binary_bytes / 2 ** 20:.1f} MiB, loaded in {binary_seconds:.2f}s")
+    for level, n_bytes in sorted(tier_bytes.items()):
+        print(f"  LOD {level}: {n_bytes / 2 ** 20:.1f} MiB")
+
+    if compare_json:
+        start = time.perf_counter()
+        json_bytes = 0
+        for mesh_data in all_meshes:
+            path = f"{out_dir}/mesh_{mesh_data['id']}.json"
+            with open(path) as f:
+                json.load(f)
+            json_bytes += os.path.getsize(path)
+        json_seconds = time.perf_counter() - start
+        # the old viewer downloaded every vertex a second time in mesh_index.json
+        print(f"JSON meshes:   {2 * json_bytes / 2 ** 20:.1f} MiB (per-region + index), "
+              f"parsed in {json_seconds:.2f}s for one copy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the WebGL brain region viewer.")
+    parser.add_argument("--atlas", default=file_path,
+                        help="label atlas: registry name (e.g. bna_218) or .nii/.nii.gz path")
+    parser.add_argument("--table", default=table_path, help="region metadata table (markdown)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--compare-json", action="store_true",
+                        help="also write the old per-region JSON meshes and report size/load time")
+    parser.add_argument("--smooth", type=int, default=0,
+                        help="Taubin smoothing iterations applied to every mesh (default: none)")
+    parser.add_argument("--force", action="store_true",
+                        help="re-mesh every region, ignoring the build cache")
+    args = parser.parse_args()
+
+    # Create output directory for the WebGL data
+    os.makedirs("web/webgl_output", exist_ok=True)
+
+    # Load the brain region metadata
+    region_metadata = parse_brain_regions_table(args.table)
+    print(f"Loaded metadata for {len(region_metadata)} brain regions")
+
+    # Integer label volume, each region is meshed on its bounding box only
+    labels = load_labels(args.atlas)
+
+    start = time.perf_counter()
+    all_meshes, center = build_meshes(labels, region_metadata, n_jobs=args.jobs,
+                                      legacy_json=args.compare_json,
+                                      smooth_iterations=args.smooth,
+                                      # the JSON comparison needs every region re-meshed
+                                      force=args.force or args.compare_json)
+
+    # Save the manifest: metadata and buffer layout only, no geometry
+    manifest = json.dumps({"center": center, "lod_tiers": LOD_TIERS, "meshes": all_meshes})
+    if not write_if_changed("web/webgl_output/mesh_index.json", manifest):
+        print("Manifest unchanged")
+
+    print(f"Processed {len(all_meshes)} meshes in {time.perf_counter() - start:.1f}s")
+    report_sizes(all_meshes, compare_json=args.compare_json)
+
+    # Write the HTML file
+    if write_if_changed("web/brain_regions_3d.html", html_content):
+        print("Created WebGL visualization HTML file: web/brain_regions_3d.html")
+    else:
+        print("WebGL visualization HTML file unchanged: web/brain_regions_3d.html")
+
+
+if __name__ == "__main__":
+    main()
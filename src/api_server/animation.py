@@ -0,0 +1,161 @@
+"""
+Tick-based animation of ROI colors.
+
+Instead of snapping from one query's colors to the next, the server
+crossfades between color vectors with an easing curve and can pulse each
+ROI's brightness by its z-score magnitude. Frames are computed as one NumPy
+blend into preallocated buffers and emitted at a fixed rate; late ticks are
+dropped rather than queued. Frame-time jitter and CPU time per frame are
+kept for the last few seconds of frames.
+"""
+import asyncio
+import collections
+import time
+
+import numpy as np
+
+from light_minded.ticks import TickClock, timing_summary
+
+
+EASINGS = {
+    "linear": lambda p: p,
+    "ease_in": lambda p: p * p,
+    "ease_out": lambda p: 1 - (1 - p) * (1 - p),
+    "ease_in_out": lambda p: p * p * (3 - 2 * p),
+}
+
+
+class Animator:
+    """
+    Crossfade/pulse engine for one ROI color vector.
+
+    Parameters:
+    - fps: frame rate while a transition or pulse is running
+    - pulse_hz: pulse frequency
+    - pulse_depth: brightness swing of the strongest ROI (0.3 = +/-30%)
+    - history: frames kept for the metrics
+    """
+
+    def __init__(self, fps=30.0, pulse_hz=0.5, pulse_depth=0.3, history=300):
+        self.fps = fps
+        self.pulse_hz = pulse_hz
+        self.pulse_depth = pulse_depth
+        self.frames = 0
+        self._ticks = TickClock(fps, clock=time.monotonic)
+        self._intervals = collections.deque(maxlen=history)
+        self._compute = collections.deque(maxlen=history)
+        self._cpu = collections.deque(maxlen=history)
+        self._wake = asyncio.Event()
+        self._allocate(0)
+        self.active = False
+
+    def _allocate(self, n_rois):
+        self._start = np.zeros((n_rois, 3), dtype=np.float32)
+        self._delta = np.zeros((n_rois, 3), dtype=np.float32)
+        self._target = np.zeros((n_rois, 3), dtype=np.uint8)
+        self._blend = np.zeros((n_rois, 3), dtype=np.float32)
+        self._pulse = None
+
+    @property
+    def target(self):
+        """Colors the running animation ends on (None when idle)."""
+        return self._target.copy() if self.active else None
+
+    def start(self, current, target, duration=1.0, easing="ease_in_out", z_scores=None,
+              z_max=5.0, now=None):
+        """
+        Start a transition from `current` to `target` colors.
+
+        Parameters:
+        - current, target: (n_rois, 3) uint8 colors
+        - duration: crossfade seconds (0 jumps straight to the target)
+        - easing: one of EASINGS
+        - z_scores: optional per-ROI values; ROIs pulse with |z| / z_max
+          after (and during) the crossfade until the next transition
+        """
+        if easing not in EASINGS:
+            raise ValueError(f"Unknown easing {easing!r}, expected one of {list(EASINGS)}")
+        if len(target) != len(self._target):
+            self._allocate(len(target))
+        self._start[:] = current
+        np.subtract(target, self._start, out=self._delta)
+        self._target[:] = target
+        self._pulse = None
+        if z_scores is not None:
+            weights = np.clip(np.abs(np.asarray(z_scores, dtype=np.float32)) / z_max, 0, 1)
+            self._pulse = (self.pulse_depth * weights)[:, None]
+        self._t0 = time.monotonic() if now is None else now
+        self._duration = max(float(duration), 0.0)
+        self._easing = EASINGS[easing]
+        self.active = True
+        self._wake.set()
+
+    def stop(self):
+        self.active = False
+
+    def render(self, now, out):
+        """
+        Write the frame at time `now` into `out` ((n_rois, 3) uint8).
+
+        Returns:
+        - False once a transition without pulse has finished
+        """
+        elapsed = now - self._t0
+        progress = 1.0 if elapsed >= self._duration else max(elapsed, 0.0) / self._duration
+        # start + delta * eased progress, in place
+        np.multiply(self._delta, self._easing(progress), out=self._blend)
+        self._blend += self._start
+        if self._pulse is not None:
+            self._blend *= 1 + self._pulse * np.sin(2 * np.pi * self.pulse_hz * elapsed)
+        np.clip(self._blend, 0, 255, out=self._blend)
+        np.rint(self._blend, out=self._blend)
+        out[:] = self._blend
+        return progress < 1.0 or self._pulse is not None
+
+    async def run(self, on_frame, get_buffer):
+        """
+        Emit frames at `fps` while animating, sleep while idle.
+
+        Parameters:
+        - on_frame: called after each frame is written
+        - get_buffer: returns the (n_rois, 3) uint8 array frames are written to
+        """
+        self._ticks.reset()
+        last_frame = None
+        while True:
+            if not self.active:
+                self._wake.clear()
+                await self._wake.wait()
+                self._ticks.reset()
+                last_frame = None
+            start, cpu_start = time.monotonic(), time.process_time()
+            if last_frame is not None:
+                self._intervals.append(start - last_frame)
+            last_frame = start
+
+            buffer = get_buffer()
+            if len(buffer) == len(self._target):
+                self.active = self.render(start, buffer)
+                on_frame()
+                self.frames += 1
+            else:
+                # the ROI set changed under a running animation
+                self.active = False
+            self._compute.append(time.monotonic() - start)
+            self._cpu.append(time.process_time() - cpu_start)
+
+            await asyncio.sleep(self._ticks.advance())
+
+    def metrics(self):
+        """Frame rate, jitter and per-frame compute/CPU time over the recent frames."""
+        intervals = np.asarray(self._intervals)
+        return {
+            "fps_target": self.fps,
+            "fps_actual": round(float(1 / intervals.mean()), 2) if len(intervals) else None,
+            "active": self.active,
+            "frames": self.frames,
+            "dropped": self._ticks.missed,
+            "jitter_ms": timing_summary(np.abs(intervals - 1.0 / self.fps)),
+            "compute_ms": timing_summary(self._compute),
+            "cpu_ms": timing_summary(self._cpu),
+        }
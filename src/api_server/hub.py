@@ -0,0 +1,97 @@
+"""
+Server-Sent Events broadcast hub.
+
+Every connected client (viewer page, LED controller, dashboards) gets its own
+bounded queue. A published update is framed once and appended to every
+queue; when a slow client's queue is full its oldest pending message is
+dropped, so it catches up on the latest state instead of stalling the
+publisher or the other clients.
+"""
+import asyncio
+
+
+HEARTBEAT_SECONDS = 15.0
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def format_sse(data, event=None, event_id=None):
+    """Frame one SSE message; multi-line data becomes one `data:` line per line."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in str(data).splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+class BroadcastHub:
+    """
+    Fan-out of SSE messages to per-client queues.
+
+    Parameters:
+    - max_queue: messages buffered per client before the oldest is dropped
+    """
+
+    def __init__(self, max_queue=8):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def n_clients(self):
+        return len(self._subscribers)
+
+    def publish(self, data, event=None, event_id=None):
+        """
+        Frame a message once and queue it for every client (non-blocking).
+
+        Returns:
+        - number of clients the message was queued for
+        """
+        message = format_sse(data, event=event, event_id=event_id)
+        for queue in self._subscribers:
+            if queue.full():
+                # latest wins: a slow client skips its oldest pending update
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+        self.published += 1
+        return len(self._subscribers)
+
+    async def stream(self, queue, initial=None, heartbeat=HEARTBEAT_SECONDS):
+        """
+        Async generator of framed messages for one client.
+
+        Parameters:
+        - queue: the client's queue from `subscribe`, taken before `initial`
+          is read so no update published in between is missed
+        - initial: already framed message sent first (e.g. the current state)
+        - heartbeat: seconds of silence before a keep-alive comment is sent
+        """
+        try:
+            if initial is not None:
+                yield initial
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            self.unsubscribe(queue)
+
+    def stats(self):
+        return {
+            "clients": self.n_clients,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
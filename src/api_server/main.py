@@ -1,17 +1,103 @@
-from fastapi import FastAPI, WebSocket
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 import dataformat
+from light_minded import encoder
+from light_minded.atlases import DEFAULT_ATLAS, get_atlas
+from light_minded.cache import QueryCache
 import asyncio
+import functools
+import numpy as np
+import orjson
+import os
 
-app = FastAPI()
+from .animation import EASINGS, Animator
+from .frames import FrameEncoder
+from .hub import BroadcastHub, format_sse
+from .queries import QueryRunner
+from .state import Snapshot
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the shared NeuroQuery model once at startup, off the event loop;
+    # set LIGHT_MINDED_LOAD_MODEL=0 to serve colors only
+    if os.environ.get("LIGHT_MINDED_LOAD_MODEL", "1") != "0":
+        await asyncio.to_thread(encoder.load_encoder, True)
+    # every animation frame is published like a /set update
+    animation = asyncio.create_task(animator.run(publish_colors, lambda: gRgb))
+    yield
+    animation.cancel()
+    query_runner.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.mount(
     "/webgl_output", StaticFiles(directory="web/webgl_output"), name="webgl_output"
 )
-event = asyncio.Event()
-lock = asyncio.Lock()
+hub = BroadcastHub()
+# default crossfade seconds for color updates (0 snaps, as before)
+TRANSITION_SECONDS = float(os.environ.get("LIGHT_MINDED_TRANSITION", "0"))
+animator = Animator(fps=float(os.environ.get("LIGHT_MINDED_FPS", "30")))
+query_runner = QueryRunner(
+    max_workers=int(os.environ.get("LIGHT_MINDED_QUERY_WORKERS", "4")),
+    atlas=os.environ.get("LIGHT_MINDED_ATLAS", DEFAULT_ATLAS),
+    query_cache=QueryCache(),
+)
+
+# writers' working arrays (ROI ids ascending, preallocated colors) and the
+# published snapshot readers use; writes run on the event loop without
+# awaiting, so each update is atomic and needs no lock
+gIds = np.zeros(0, dtype=np.uint16)
+gRgb = np.zeros((0, 3), dtype=np.uint8)
+gSnapshot = Snapshot(0, gIds, gRgb)
+
+
+@functools.lru_cache(maxsize=1)
+def atlas_ids():
+    """Sorted ROI ids of the served atlas (LIGHT_MINDED_ATLAS, default BN 218)."""
+    atlas = get_atlas(os.environ.get("LIGHT_MINDED_ATLAS", DEFAULT_ATLAS))
+    return atlas.region_ids.astype(np.uint16)
+
 
-gData: dataformat.ROIData
+def publish_colors():
+    """Swap in a snapshot of the working colors and fan it out."""
+    global gSnapshot
+    gSnapshot = snapshot = Snapshot(gSnapshot.version + 1, gIds, gRgb)
+    if hub.n_clients:
+        hub.publish(snapshot.json().decode(), event="colors", event_id=snapshot.version)
+
+
+def use_rois(roi_ids):
+    """Switch the working arrays to another ROI set, starting from black."""
+    global gIds, gRgb
+    if not np.array_equal(gIds, roi_ids):
+        animator.stop()
+        gIds = roi_ids
+        gRgb = np.zeros((len(roi_ids), 3), dtype=np.uint8)
+
+
+def show_colors(target, transition=None, easing="ease_in_out", z_scores=None):
+    """
+    Move the state to new colors, snapping or through the animator.
+
+    Parameters:
+    - target: (n_rois, 3) uint8 colors for the current ROI set
+    - transition: crossfade seconds (defaults to LIGHT_MINDED_TRANSITION)
+    - easing: one of animation.EASINGS
+    - z_scores: optional per-ROI values to pulse by
+    """
+    if easing not in EASINGS:
+        raise HTTPException(422, f"Unknown easing {easing!r}, expected one of {list(EASINGS)}")
+    duration = TRANSITION_SECONDS if transition is None else transition
+    if duration <= 0 and z_scores is None:
+        animator.stop()
+        gRgb[:] = target
+        publish_colors()
+    else:
+        animator.start(gRgb, target, duration, easing, z_scores=z_scores)
 
 
 @app.get("/")
@@ -20,26 +106,193 @@ async def index():
 
 
 @app.post("/set")
-async def set(data: dataformat.ROIData):
-    async with lock:
-        global gData
-        gData = data
-        event.set()
+async def set(data: dataformat.ROIData, transition: float | None = None, easing: str = "ease_in_out"):
+    values = np.array([(c.id, c.r, c.g, c.b) for c in data.data], dtype=np.int64).reshape(-1, 4)
+    values = values[np.argsort(values[:, 0], kind="stable")]
+    use_rois(values[:, 0].astype(np.uint16))
+    show_colors(np.clip(values[:, 1:], 0, 255).astype(np.uint8), transition, easing)
+
+
+def _int_array(values, name):
+    try:
+        array = np.asarray(values if values is not None else [])
+    except ValueError:
+        array = None
+    if array is None or array.ndim != 1 or (array.size and array.dtype.kind not in "iu"):
+        raise HTTPException(422, f"{name} must be a flat list of integers")
+    return array.astype(np.int64)
+
+
+def parse_packed(body, content_type, roi_ids):
+    """
+    Validate a packed color update against the atlas ROI set.
+
+    The body is either raw bytes (application/octet-stream) with r, g, b for
+    every ROI in ascending id order, or JSON: a flat [r, g, b, ...] list, or
+    {"rgb": [...], "ids": [...]} to update only some ROIs.
+
+    Returns:
+    - (columns into roi_ids or None for all ROIs, (n, 3) uint8 colors)
+    """
+    ids = None
+    if content_type.startswith("application/json"):
+        try:
+            payload = orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise HTTPException(422, f"Invalid JSON: {e}")
+        if isinstance(payload, dict):
+            ids = payload.get("ids")
+            payload = payload.get("rgb")
+        rgb = _int_array(payload, "rgb")
+        if rgb.size and (rgb.min() < 0 or rgb.max() > 255):
+            raise HTTPException(422, "rgb values must be in [0, 255]")
+    else:
+        rgb = np.frombuffer(body, dtype=np.uint8)
+    if rgb.size % 3:
+        raise HTTPException(422, f"rgb length {rgb.size} is not a multiple of 3")
+    rgb = rgb.reshape(-1, 3).astype(np.uint8)
+
+    if ids is None:
+        if len(rgb) != len(roi_ids):
+            raise HTTPException(422, f"Expected {len(roi_ids)} ROIs, got {len(rgb)}")
+        return None, rgb
+    ids = _int_array(ids, "ids")
+    if ids.shape != (len(rgb),):
+        raise HTTPException(422, f"Got {ids.size} ids for {len(rgb)} colors")
+    columns = np.searchsorted(roi_ids, ids)
+    known = (columns < len(roi_ids)) & (roi_ids[np.minimum(columns, len(roi_ids) - 1)] == ids)
+    if not known.all():
+        raise HTTPException(422, f"Unknown ROI ids: {ids[~known][:10].tolist()}")
+    return columns, rgb
+
+
+@app.post("/set/packed")
+async def set_packed(request: Request, transition: float | None = None, easing: str = "ease_in_out"):
+    """Fast path for /set: packed colors written into one preallocated array."""
+    roi_ids = atlas_ids()
+    columns, rgb = parse_packed(await request.body(), request.headers.get("content-type", ""), roi_ids)
+    # first packed update (or after a /set with other ROIs) allocates the state once
+    use_rois(roi_ids)
+    if columns is not None:
+        # partial updates apply to where a running animation is heading
+        target = animator.target if animator.active else gRgb.copy()
+        target[columns] = rgb
+        rgb = target
+    show_colors(rgb, transition, easing)
+    return {"version": gSnapshot.version}
+
+
+@app.post("/query")
+async def query(request: dataformat.QueryRequest):
+    """Run a prompt through the pipeline and show its colors on every client."""
+    if not request.query.strip():
+        raise HTTPException(422, "Empty query")
+    if request.easing not in EASINGS:
+        raise HTTPException(422, f"Unknown easing {request.easing!r}, expected one of {list(EASINGS)}")
+    result, shared = await query_runner.submit(request.query)
+    roi_ids = np.asarray(result["roi_id"], dtype=np.uint16)
+    order = np.argsort(roi_ids, kind="stable")
+    use_rois(roi_ids[order])
+    show_colors(result["rgb"][order], request.transition, request.easing,
+                z_scores=result["z_score"][order] if request.pulse else None)
+    return {
+        "query": request.query,
+        "cached": bool(result["cached"]),
+        "shared": shared,
+        "seconds": round(result["seconds"], 3),
+        "version": gSnapshot.version,
+        "roi_id": roi_ids.tolist(),
+        "z_score": np.round(np.asarray(result["z_score"], dtype=float), 3).tolist(),
+    }
 
 
 @app.get("/get")
-async def get():
-    return gData
+async def get(request: Request, since: int | None = None):
+    """
+    Current colors. Clients poll with If-None-Match (the ETag of their last
+    response) or ?since=<version> and get 304 when nothing changed.
+    """
+    snapshot = gSnapshot
+    headers = {"ETag": snapshot.etag, "X-State-Version": str(snapshot.version),
+               "Cache-Control": "no-cache"}
+    if snapshot.matches(request.headers.get("if-none-match")) or (
+            since is not None and since >= snapshot.version):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.json(), media_type="application/json", headers=headers)
+
+
+@app.get("/stats/encoder")
+async def encoder_stats():
+    return encoder.latency_report()
 
 
-async def event_generator():
-    await event.wait()
-    async with lock:
-        for i in gData.data:
-            yield f"{i}"
-    await event.clear()
+@app.get("/stats/animation")
+async def animation_stats():
+    return animator.metrics()
+
+
+@app.get("/stats/queries")
+async def query_stats():
+    return query_runner.stats()
+
+
+@app.get("/stats/events")
+async def event_stats():
+    return hub.stats()
 
 
 @app.get("/events")
 async def streamEvents():
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    # new clients start from the current colors, then get every update;
+    # subscribe before reading the snapshot so nothing published in between
+    # is lost (as /ws does)
+    updates = hub.subscribe()
+    snapshot = gSnapshot
+    initial = None if snapshot.version == 0 else format_sse(
+        snapshot.json().decode(), event="colors", event_id=snapshot.version)
+    return StreamingResponse(
+        hub.stream(updates, initial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # also drops the queue if the stream never started
+        background=BackgroundTask(hub.unsubscribe, updates),
+    )
+
+
+async def _until_disconnect(websocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@app.websocket("/ws")
+async def colors_socket(websocket: WebSocket):
+    """Binary color frames (see frames.py): full state first, then deltas."""
+    await websocket.accept()
+    frame_encoder = FrameEncoder()
+    updates = hub.subscribe()
+    closed = asyncio.create_task(_until_disconnect(websocket))
+    try:
+        version = 0
+        while True:
+            snapshot = gSnapshot
+            if snapshot.version != version:
+                version = snapshot.version
+                for message in frame_encoder.encode(version, snapshot.ids, snapshot.rgb):
+                    if isinstance(message, bytes):
+                        await websocket.send_bytes(message)
+                    else:
+                        await websocket.send_json(message)
+            # the hub queue only wakes us up; whatever piled up is coalesced
+            # into one frame against the latest state
+            update = asyncio.ensure_future(updates.get())
+            await asyncio.wait({update, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed.done():
+                update.cancel()
+                break
+            while not updates.empty():
+                updates.get_nowait()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        hub.unsubscribe(updates)
@@ -0,0 +1,113 @@
+"""
+Query-to-light pipeline for the API server.
+
+Prompts submitted over HTTP run through the same steps as the interactive
+loop (query cache, NeuroQuery encoder, img_mod, colors) on a thread pool, so
+the event loop keeps serving frames while a query is computed. Identical
+prompts that arrive while one is already running share its result instead
+of running the model again (single flight).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+from light_minded import encoder
+from light_minded.atlases import get_atlas
+from light_minded.cache import normalize_query
+from light_minded.light_minded import colorize_rois, img_mod
+
+
+def run_query(query, atlas=None, threshold=3.1, query_cache=None, statistic="mean"):
+    """
+    Blocking pipeline for one prompt.
+
+    `statistic` is the ROI statistic used for the colors (see roi_stats.py).
+
+    Returns:
+    - dict with roi_id, z_score, uint8 rgb and whether the cache answered
+    """
+    atlas = get_atlas(atlas)
+    cached = None if query_cache is None else query_cache.get(
+        query, atlas.name, threshold, statistic=statistic)
+    if cached is not None:
+        roi_ids, z_scores = cached["roi_id"], cached["z_score"]
+        rgb = colorize_rois(roi_ids, z_scores)["rgb_values"]
+    else:
+        result = encoder.encode_query(query)
+        processed = img_mod(result["z_map"], threshold=threshold, atlas_path=atlas,
+                            statistic=statistic)
+        roi_ids, z_scores, rgb = processed["roi_id"], processed["z_score"], processed["rgb_values"]
+        if query_cache is not None:
+            query_cache.put(query, atlas.name, threshold, roi_ids, z_scores, statistic=statistic)
+    return {
+        "roi_id": roi_ids,
+        "z_score": z_scores,
+        "rgb": rgb,
+        "cached": cached is not None,
+    }
+
+
+class QueryRunner:
+    """
+    Single-flight front of `run_query` on a thread pool.
+
+    Parameters:
+    - max_workers: pipeline threads (model calls are serialized by the
+      encoder, resampling and colors overlap)
+    - atlas, threshold: passed to run_query
+    - query_cache: QueryCache shared with the interactive loop (None disables)
+    - pipeline: replaces run_query (used by tests)
+    """
+
+    def __init__(self, max_workers=4, atlas=None, threshold=3.1, query_cache=None, pipeline=None):
+        self.atlas = atlas
+        self.threshold = threshold
+        self.query_cache = query_cache
+        self._pipeline = pipeline or run_query
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="query")
+        self._in_flight = {}
+        self.runs = 0
+        self.shared = 0
+        self.errors = 0
+
+    def _run(self, query):
+        start = time.perf_counter()
+        result = self._pipeline(query, atlas=self.atlas, threshold=self.threshold,
+                                query_cache=self.query_cache)
+        return dict(result, seconds=time.perf_counter() - start)
+
+    async def submit(self, query):
+        """
+        Run a prompt, or join the identical one already running.
+
+        Returns:
+        - (result dict, whether it was shared with an earlier request)
+        """
+        key = normalize_query(query)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._run, query)
+        self._in_flight[key] = future
+        self.runs += 1
+        try:
+            return await asyncio.shield(future), False
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "shared": self.shared,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,61 @@
+"""
+Immutable, versioned snapshots of the current colors.
+
+Writers fill their working arrays and publish by swapping one module-level
+reference to a new Snapshot; readers take that reference once and use it
+without any lock, so a slow reader never holds up /set. The JSON body of a
+snapshot is built at most once, on first request.
+"""
+import uuid
+
+import numpy as np
+import orjson
+
+
+# distinguishes versions of different server runs in ETags
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def colors_json(ids, rgb):
+    """ROIData-shaped JSON of id/RGB arrays."""
+    return orjson.dumps({"data": [
+        {"id": i, "r": r, "g": g, "b": b}
+        for i, (r, g, b) in zip(ids.tolist(), rgb.tolist())
+    ]})
+
+
+class Snapshot:
+    """
+    Colors at one version (arrays are read-only copies).
+
+    Attributes:
+    - version: increases by one with every published update
+    - ids: (n_rois,) uint16 ROI ids, ascending
+    - rgb: (n_rois, 3) uint8 colors
+    """
+
+    __slots__ = ("version", "ids", "rgb", "_json")
+
+    def __init__(self, version, ids, rgb):
+        self.version = version
+        self.ids = np.array(ids, dtype=np.uint16)
+        self.rgb = np.array(rgb, dtype=np.uint8)
+        self.ids.flags.writeable = False
+        self.rgb.flags.writeable = False
+        self._json = None if version else b"null"
+
+    @property
+    def etag(self):
+        return f'"{BOOT_ID}-{self.version}"'
+
+    def json(self):
+        if self._json is None:
+            self._json = colors_json(self.ids, self.rgb)
+        return self._json
+
+    def matches(self, if_none_match):
+        """Whether an If-None-Match header names this snapshot."""
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 
 class ROIColor(BaseModel):
@@ -11,3 +11,10 @@ class ROIColor(BaseModel):
 
 class ROIData(BaseModel):
     data: List[ROIColor]
+
+
+class QueryRequest(BaseModel):
+    query: str
+    transition: Optional[float] = None
+    easing: str = "ease_in_out"
+    pulse: bool = False
@@ -0,0 +1,5 @@
+"""LED output: ROI colors -> DMX universes -> Art-Net/sACN/serial."""
+from .mapping import LedMap
+from .receiver import UdpReceiver, parse_packet
+from .scheduler import FrameScheduler
+from .transports import ArtNetTransport, SacnTransport, SerialTransport, make_transport
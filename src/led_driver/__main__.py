@@ -0,0 +1,108 @@
+"""
+Drive the LEDs from the API server's WebSocket color stream.
+
+    python -m led_driver --init                  # write config/leds.json for the atlas
+    python -m led_driver                         # stream ws://127.0.0.1:8000/ws to the LEDs
+    python -m led_driver --simulate              # same, into a local stand-in receiver
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+from api_server.frames import FULL, decode_frame
+from light_minded.atlases import DEFAULT_ATLAS, get_atlas
+
+from .mapping import LedMap
+from .receiver import UdpReceiver
+from .scheduler import FrameScheduler
+from .transports import make_transport
+
+
+def write_default_config(path, atlas=None, leds_per_roi=10):
+    atlas = get_atlas(atlas)
+    led_map = LedMap.sequential(atlas.region_ids, leds_per_roi=leds_per_roi)
+    config = dict(led_map.to_config(), fps=40,
+                  transport={"type": "artnet", "host": "127.0.0.1"})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+    print(f"Wrote {len(led_map.roi_ids)} regions ({led_map.n_leds} LEDs, "
+          f"{led_map.n_universes} universes) for {atlas.name} to {path}")
+
+
+def stream(url, scheduler, report_every=10.0):
+    """Apply full/delta frames from the server to the scheduler until interrupted."""
+    ids, rgb = np.zeros(0, dtype=np.int64), np.zeros((0, 3), dtype=np.uint8)
+    last_report = time.perf_counter()
+    while True:
+        try:
+            with connect(url) as websocket:
+                print(f"Connected to {url}")
+                for message in websocket:
+                    if isinstance(message, str):
+                        ids = np.array(json.loads(message)["ids"], dtype=np.int64)
+                        rgb = np.zeros((len(ids), 3), dtype=np.uint8)
+                        continue
+                    frame_type, _, changed, colors = decode_frame(message)
+                    if frame_type == FULL:
+                        rgb[:] = colors
+                    else:
+                        rgb[np.searchsorted(ids, changed)] = colors
+                    scheduler.submit(ids, rgb)
+                    if time.perf_counter() - last_report > report_every:
+                        print(scheduler.metrics())
+                        last_report = time.perf_counter()
+        except (OSError, ConnectionClosed) as e:
+            print(f"Connection to {url} failed ({e}), retrying in 1s")
+            time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send ROI colors from the API server to the LEDs.")
+    parser.add_argument("--config", default="config/leds.json", help="LED mapping config")
+    parser.add_argument("--server", default="ws://127.0.0.1:8000/ws", help="API server WebSocket")
+    parser.add_argument("--fps", type=float, default=None, help="output frame rate (default: config)")
+    parser.add_argument("--simulate", action="store_true",
+                        help="send to a local stand-in receiver instead of the configured device")
+    parser.add_argument("--init", action="store_true", help="write a default config and exit")
+    parser.add_argument("--atlas", default=os.environ.get("LIGHT_MINDED_ATLAS", DEFAULT_ATLAS),
+                        help="atlas for --init")
+    parser.add_argument("--leds-per-roi", type=int, default=10, help="LEDs per region for --init")
+    args = parser.parse_args()
+
+    if args.init:
+        write_default_config(args.config, args.atlas, args.leds_per_roi)
+        return
+
+    with open(args.config) as f:
+        config = json.load(f)
+    led_map = LedMap.load(args.config)
+    transport_config = config.get("transport", {"type": "artnet"})
+    receiver = None
+    if args.simulate:
+        receiver = UdpReceiver().start()
+        transport_config = {"type": transport_config.get("type", "artnet"),
+                            "host": "127.0.0.1", "port": receiver.port}
+        if transport_config["type"] == "serial":
+            transport_config["type"] = "artnet"
+    transport = make_transport(transport_config, led_map)
+
+    with FrameScheduler(led_map, transport, fps=args.fps or config.get("fps", 40)) as scheduler:
+        try:
+            stream(args.server, scheduler)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print(scheduler.metrics())
+            if receiver is not None:
+                print(receiver.metrics())
+                receiver.close()
+
+
+if __name__ == "__main__":
+    main()
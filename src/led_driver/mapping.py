@@ -0,0 +1,139 @@
+"""
+ROI -> LED channel mapping.
+
+A JSON config assigns every atlas ROI a run of LEDs in a DMX universe:
+
+    {
+        "universe_size": 510,
+        "color_order": "GRB",
+        "gamma": 2.2,
+        "brightness": 0.8,
+        "regions": [
+            {"roi_id": 1, "universe": 0, "start": 0, "count": 12},
+            ...
+        ]
+    }
+
+`start` and `count` are in LEDs (3 channels each). All index arithmetic is
+done once at load time, so packing a frame is one gamma lookup and one
+fancy-indexed copy into a preallocated (n_universes, 512) buffer.
+"""
+import json
+
+import numpy as np
+
+
+DMX_CHANNELS = 512
+
+
+class LedMap:
+    """
+    Packs per-ROI colors into DMX universe buffers.
+
+    Parameters:
+    - regions: list of {"roi_id", "universe", "start", "count"} dicts
+    - universe_size: channels used per universe (a multiple of 3, <= 512)
+    - color_order: channel order of the strips, e.g. "RGB" or "GRB"
+    - gamma, brightness: applied through a 256-entry lookup table
+    """
+
+    def __init__(self, regions, universe_size=510, color_order="RGB", gamma=1.0, brightness=1.0):
+        if universe_size % 3 or not 0 < universe_size <= DMX_CHANNELS:
+            raise ValueError(f"universe_size must be a multiple of 3 up to {DMX_CHANNELS}")
+        if sorted(color_order.upper()) != ["B", "G", "R"]:
+            raise ValueError(f"Invalid color_order {color_order!r}")
+        self.universe_size = universe_size
+        self.color_order = color_order.upper()
+        self.gamma = gamma
+        self.brightness = brightness
+        self.regions = [dict(region) for region in regions]
+        self.roi_ids = np.array(sorted({r["roi_id"] for r in self.regions}), dtype=np.int64)
+
+        levels = np.arange(256) / 255.0
+        self.lut = np.rint(255 * brightness * levels ** gamma).clip(0, 255).astype(np.uint8)
+
+        # one (source ROI column, source channel) -> destination channel entry per LED channel
+        component = np.array(["RGB".index(c) for c in self.color_order])
+        src, dst = [], []
+        for region in self.regions:
+            start, count = region["start"], region["count"]
+            if start < 0 or count < 0 or (start + count) * 3 > universe_size:
+                raise ValueError(f"Region {region} does not fit a {universe_size}-channel universe")
+            column = np.searchsorted(self.roi_ids, region["roi_id"])
+            leds = np.arange(start, start + count)
+            dst.append((region["universe"] * DMX_CHANNELS + 3 * leds[:, None] + np.arange(3)).ravel())
+            src.append(np.broadcast_to(3 * column + component, (count, 3)).ravel())
+        self._src = np.concatenate(src) if src else np.zeros(0, dtype=np.int64)
+        self._dst = np.concatenate(dst) if dst else np.zeros(0, dtype=np.int64)
+        if len(np.unique(self._dst)) != len(self._dst):
+            raise ValueError("Regions overlap")
+        self.n_universes = max((r["universe"] for r in self.regions), default=-1) + 1
+        self.n_leds = sum(r["count"] for r in self.regions)
+        self.buffer = np.zeros((self.n_universes, DMX_CHANNELS), dtype=np.uint8)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config["regions"], universe_size=config.get("universe_size", 510),
+                   color_order=config.get("color_order", "RGB"),
+                   gamma=config.get("gamma", 1.0), brightness=config.get("brightness", 1.0))
+
+    @classmethod
+    def sequential(cls, roi_ids, leds_per_roi=10, universe_size=510, **kwargs):
+        """Default layout: each ROI gets `leds_per_roi` LEDs, filling universes in id order."""
+        per_universe = universe_size // 3 // leds_per_roi
+        regions = [
+            {"roi_id": int(roi_id), "universe": i // per_universe,
+             "start": i % per_universe * leds_per_roi, "count": leds_per_roi}
+            for i, roi_id in enumerate(sorted(roi_ids))
+        ]
+        return cls(regions, universe_size=universe_size, **kwargs)
+
+    def to_config(self):
+        return {
+            "universe_size": self.universe_size,
+            "color_order": self.color_order,
+            "gamma": self.gamma,
+            "brightness": self.brightness,
+            "regions": self.regions,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_config(), f, indent=2)
+
+    def pack(self, rgb, out=None):
+        """
+        Write one frame into the universe buffers.
+
+        Parameters:
+        - rgb: (n_rois, 3) uint8 colors ordered like `roi_ids`
+
+        Returns:
+        - the (n_universes, 512) uint8 buffer (`self.buffer` unless `out` is given)
+        """
+        out = self.buffer if out is None else out
+        out.reshape(-1)[self._dst] = self.lut[np.asarray(rgb, dtype=np.uint8).reshape(-1)[self._src]]
+        return out
+
+    def align(self, roi_ids, rgb, out=None):
+        """
+        Reorder colors given for any ROI set into this map's ROI order.
+
+        ROIs without LEDs are ignored; mapped ROIs missing from `roi_ids` are black.
+
+        Returns:
+        - (len(self.roi_ids), 3) uint8 colors
+        """
+        out = np.zeros((len(self.roi_ids), 3), dtype=np.uint8) if out is None else out
+        roi_ids = np.asarray(roi_ids, dtype=np.int64)
+        if np.array_equal(roi_ids, self.roi_ids):
+            out[:] = rgb
+            return out
+        out[:] = 0
+        if len(self.roi_ids):
+            columns = np.minimum(np.searchsorted(self.roi_ids, roi_ids), len(self.roi_ids) - 1)
+            known = self.roi_ids[columns] == roi_ids
+            out[columns[known]] = np.asarray(rgb)[known]
+        return out
@@ -0,0 +1,111 @@
+"""
+Local stand-in for an LED controller.
+
+Listens for Art-Net or sACN packets on a UDP port and records what a real
+controller would see (packets, universes, lost sequence numbers, arrival
+times), so throughput and latency can be measured without hardware.
+"""
+import collections
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+def parse_packet(packet):
+    """
+    Decode an ArtDmx or E1.31 data packet.
+
+    Returns:
+    - (universe, sequence, data memoryview), or None for other packets
+    """
+    if packet[:8] == b"Art-Net\x00" and struct.unpack_from("<H", packet, 8)[0] == 0x5000:
+        universe, = struct.unpack_from("<H", packet, 14)
+        length, = struct.unpack_from(">H", packet, 16)
+        return universe, packet[12], memoryview(packet)[18:18 + length]
+    if packet[4:16] == b"ASC-E1.17\x00\x00\x00" and len(packet) >= 126:
+        universe, = struct.unpack_from(">H", packet, 113)
+        n_values, = struct.unpack_from(">H", packet, 123)
+        return universe, packet[111], memoryview(packet)[126:125 + n_values]
+    return None
+
+
+class UdpReceiver:
+    """
+    Background UDP listener.
+
+    Parameters:
+    - port: UDP port (0 picks a free one, see `.port`)
+    - host: interface to bind
+    - on_packet: optional callback(universe, sequence, data, arrival_time)
+    - history: arrival times kept for the metrics
+    """
+
+    def __init__(self, port=0, host="127.0.0.1", on_packet=None, history=1000):
+        self.on_packet = on_packet
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0
+        self.universes = collections.Counter()
+        self.last_data = {}
+        self._last_sequence = {}
+        self._arrivals = collections.deque(maxlen=history)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.1)
+        self.port = self._socket.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="led-receiver", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                packet = self._socket.recv(2048)
+            except socket.timeout:
+                continue
+            arrival = time.perf_counter()
+            parsed = parse_packet(packet)
+            if parsed is None:
+                continue
+            universe, sequence, data = parsed
+            self.packets += 1
+            self.bytes += len(packet)
+            self.universes[universe] += 1
+            previous = self._last_sequence.get(universe)
+            if previous is not None:
+                # sequence numbers run 1..255; count the ones that never arrived
+                self.lost += (sequence - previous - 1) % 255
+            self._last_sequence[universe] = sequence
+            self.last_data[universe] = bytes(data)
+            self._arrivals.append(arrival)
+            if self.on_packet is not None:
+                self.on_packet(universe, sequence, data, arrival)
+
+    def metrics(self):
+        arrivals = np.asarray(self._arrivals)
+        seconds = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else 0.0
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "lost": self.lost,
+            "universes": len(self.universes),
+            "packets_per_second": round((len(arrivals) - 1) / seconds, 1) if seconds else None,
+        }
@@ -0,0 +1,120 @@
+"""
+Fixed-rate LED frame scheduler.
+
+Colors can be submitted at any rate from any thread; a dedicated thread
+packs and sends the latest one at the configured frame rate. A frame that
+is replaced before its tick is dropped (latest wins), ticks missed because
+a send was slow are skipped rather than sent in a burst, and the last frame
+is re-sent periodically because DMX receivers expect a steady refresh.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+from light_minded.ticks import TickClock, timing_summary
+
+
+class FrameScheduler:
+    """
+    Parameters:
+    - led_map: LedMap used to pack frames
+    - transport: object with send(universes) and close()
+    - fps: output frame rate
+    - keepalive: seconds after which an unchanged frame is re-sent
+    - history: frames kept for the metrics
+    """
+
+    def __init__(self, led_map, transport, fps=40.0, keepalive=1.0, history=300):
+        self.led_map = led_map
+        self.transport = transport
+        self.fps = fps
+        self.keepalive = keepalive
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.errors = 0
+        n_rois = len(led_map.roi_ids)
+        self._staging = np.zeros((n_rois, 3), dtype=np.uint8)
+        self._frame = np.zeros((n_rois, 3), dtype=np.uint8)
+        self._pending = False
+        self._submitted_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ticks = TickClock(fps)
+        self._send_times = collections.deque(maxlen=history)
+        self._latencies = collections.deque(maxlen=history)
+        self._intervals = collections.deque(maxlen=history)
+
+    def submit(self, roi_ids, rgb):
+        """Queue colors for the next tick, replacing any frame not yet sent."""
+        with self._lock:
+            if self._pending:
+                self.frames_dropped += 1
+            self.led_map.align(roi_ids, rgb, out=self._staging)
+            self._pending = True
+            self._submitted_at = time.perf_counter()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="led-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.transport.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        self._ticks.reset()
+        last_sent = None
+        while not self._stop.is_set():
+            with self._lock:
+                pending, submitted_at = self._pending, self._submitted_at
+                if pending:
+                    self._frame[:] = self._staging
+                    self._pending = False
+
+            now = time.perf_counter()
+            if pending or last_sent is None or now - last_sent >= self.keepalive:
+                try:
+                    self.transport.send(self.led_map.pack(self._frame))
+                except OSError as e:
+                    self.errors += 1
+                    print(f"LED transport error: {e}")
+                sent = time.perf_counter()
+                self._send_times.append(sent - now)
+                if pending:
+                    self._latencies.append(sent - submitted_at)
+                if last_sent is not None:
+                    self._intervals.append(sent - last_sent)
+                last_sent = sent
+                self.frames_sent += 1
+
+            self._stop.wait(self._ticks.advance())
+
+    def metrics(self):
+        """Frame counts and send time/latency/interval summaries (ms) over recent frames."""
+        return {
+            "fps_target": self.fps,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "ticks_missed": self._ticks.missed,
+            "errors": self.errors,
+            "send_ms": timing_summary(self._send_times),
+            "latency_ms": timing_summary(self._latencies),
+            "interval_ms": timing_summary(self._intervals),
+        }
@@ -0,0 +1,187 @@
+"""
+LED frame transports.
+
+Every transport takes the (n_universes, 512) uint8 buffer packed by
+LedMap and sends it. Packets are preallocated once per universe and only
+their data section and sequence number are rewritten per frame.
+
+- ArtNetTransport: ArtDmx packets over UDP (port 6454)
+- SacnTransport: E1.31 (streaming ACN) data packets over UDP (port 5568)
+- SerialTransport: Adalight framing over a serial port (needs pyserial)
+"""
+from abc import ABC, abstractmethod
+import socket
+import struct
+import uuid
+
+import numpy as np
+
+
+ARTNET_PORT = 6454
+SACN_PORT = 5568
+
+
+class UdpTransport(ABC):
+    """
+    Base for DMX-over-UDP protocols: one preallocated packet per universe.
+
+    Subclasses build the packet of a universe (`_packet`) and write the
+    sequence number into it (`_set_sequence`).
+    """
+
+    header_size = 0
+
+    def __init__(self, host, port, n_universes, universe_size=512, first_universe=0):
+        self.address = (host, port)
+        self.universe_size = universe_size
+        self.first_universe = first_universe
+        self.sequence = 0
+        self.packets_sent = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._packets = [self._packet(first_universe + u) for u in range(n_universes)]
+        self._views = [np.frombuffer(packet, dtype=np.uint8) for packet in self._packets]
+        self._addresses = [self._address(first_universe + u) for u in range(n_universes)]
+
+    def _address(self, universe):
+        return self.address
+
+    @abstractmethod
+    def _packet(self, universe):
+        """Preallocated packet of one universe, header filled in."""
+
+    @abstractmethod
+    def _set_sequence(self, packet):
+        """Write `self.sequence` into a packet."""
+
+    def send(self, universes):
+        """Send every universe of a packed frame; returns the sequence number used."""
+        self.sequence = self.sequence % 255 + 1
+        for packet, view, address, data in zip(self._packets, self._views, self._addresses, universes):
+            view[self.header_size:self.header_size + self.universe_size] = data[:self.universe_size]
+            self._set_sequence(packet)
+            self._socket.sendto(packet, address)
+        self.packets_sent += len(self._packets)
+        return self.sequence
+
+    def close(self):
+        self._socket.close()
+
+
+class ArtNetTransport(UdpTransport):
+    """ArtDmx (Art-Net 4) packets, universes numbered from `first_universe` (port address)."""
+
+    header_size = 18
+
+    def __init__(self, host="127.0.0.1", port=ARTNET_PORT, n_universes=1, universe_size=512,
+                 first_universe=0):
+        # ArtDmx data length must be even
+        super().__init__(host, port, n_universes, universe_size + universe_size % 2, first_universe)
+
+    def _packet(self, universe):
+        packet = bytearray(self.header_size + self.universe_size)
+        packet[:8] = b"Art-Net\x00"
+        struct.pack_into("<H", packet, 8, 0x5000)           # OpDmx
+        struct.pack_into(">H", packet, 10, 14)              # protocol version
+        struct.pack_into("<H", packet, 14, universe & 0x7FFF)
+        struct.pack_into(">H", packet, 16, self.universe_size)
+        return packet
+
+    def _set_sequence(self, packet):
+        packet[12] = self.sequence
+
+
+class SacnTransport(UdpTransport):
+    """
+    E1.31 data packets, universes numbered from `first_universe` (1 and up).
+
+    With no host, packets go to each universe's multicast group.
+    """
+
+    header_size = 126
+
+    def __init__(self, host=None, port=SACN_PORT, n_universes=1, universe_size=512,
+                 first_universe=1, source_name="light-minded", priority=100):
+        self.source_name = source_name.encode()[:63]
+        self.priority = priority
+        self.cid = uuid.uuid4().bytes
+        self._multicast = host is None
+        super().__init__(host or "239.255.0.1", port, n_universes, universe_size, first_universe)
+        if self._multicast:
+            self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+    def _packet(self, universe):
+        n_values = self.universe_size + 1  # start code + slots
+        size = self.header_size + self.universe_size
+        packet = bytearray(size)
+        # root layer
+        struct.pack_into(">HH12s", packet, 0, 0x0010, 0x0000, b"ASC-E1.17\x00\x00\x00")
+        struct.pack_into(">HI16s", packet, 16, 0x7000 | (size - 16), 0x00000004, self.cid)
+        # framing layer
+        struct.pack_into(">HI64sBHBBH", packet, 38, 0x7000 | (size - 38), 0x00000002,
+                         self.source_name, self.priority, 0, 0, 0, universe)
+        # DMP layer, start code 0
+        struct.pack_into(">HBBHHHB", packet, 115, 0x7000 | (size - 115), 0x02, 0xA1,
+                         0x0000, 0x0001, n_values, 0x00)
+        return packet
+
+    def _address(self, universe):
+        if not self._multicast:
+            return self.address
+        # one multicast group per universe: 239.255.<hi>.<lo>
+        return (f"239.255.{universe >> 8}.{universe & 0xFF}", self.address[1])
+
+    def _set_sequence(self, packet):
+        packet[111] = self.sequence
+
+
+class SerialTransport:
+    """
+    Adalight frames ("Ada", LED count - 1, checksum, then GRB/RGB bytes) for
+    microcontroller-driven strips on a serial port. The universes are
+    chained: LED i of universe u is strip position u * universe_size / 3 + i.
+    """
+
+    def __init__(self, port, n_leds, baudrate=1_000_000, universe_size=510):
+        try:
+            import serial
+        except ImportError as e:
+            raise ImportError("SerialTransport needs pyserial: pip install pyserial") from e
+        self.n_leds = n_leds
+        self.universe_size = universe_size
+        self.sequence = 0
+        self.packets_sent = 0
+        self._serial = serial.Serial(port, baudrate, write_timeout=0.1)
+        hi, lo = (n_leds - 1) >> 8, (n_leds - 1) & 0xFF
+        self._packet = bytearray(b"Ada" + bytes([hi, lo, hi ^ lo ^ 0x55]) + bytes(3 * n_leds))
+        self._view = np.frombuffer(self._packet, dtype=np.uint8)[6:]
+
+    def send(self, universes):
+        self._view[:] = universes[:, :self.universe_size].reshape(-1)[:3 * self.n_leds]
+        self._serial.write(self._packet)
+        self.sequence = self.sequence % 255 + 1
+        self.packets_sent += 1
+        return self.sequence
+
+    def close(self):
+        self._serial.close()
+
+
+def make_transport(config, led_map):
+    """
+    Build a transport from the "transport" section of an LED config.
+
+    Example: {"type": "artnet", "host": "192.168.1.50"}, {"type": "sacn"},
+    {"type": "serial", "port": "/dev/ttyACM0", "baudrate": 1000000}
+    """
+    config = dict(config)
+    kind = config.pop("type", "artnet")
+    if kind == "artnet":
+        return ArtNetTransport(n_universes=led_map.n_universes,
+                               universe_size=led_map.universe_size, **config)
+    if kind == "sacn":
+        return SacnTransport(n_universes=led_map.n_universes,
+                             universe_size=led_map.universe_size, **config)
+    if kind == "serial":
+        return SerialTransport(n_leds=led_map.n_universes * led_map.universe_size // 3,
+                               universe_size=led_map.universe_size, **config)
+    raise ValueError(f"Unknown transport type {kind!r}, expected artnet, sacn or serial")
@@ -0,0 +1,172 @@
+"""
+Atlas registry.
+
+Each atlas under `atlases/mni/` is loaded once per process. The label volume
+is converted to a compact integer array and cached uncompressed next to the
+other build artifacts, so later loads are a memory-map instead of a gunzip +
+float64 `get_fdata()`. Sorted region ids and voxel counts are computed once
+at load time.
+"""
+from pathlib import Path
+import hashlib
+import threading
+
+import nibabel as nib
+import numpy as np
+
+from .roi_stats import RegionGroups
+
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+ATLAS_DIR = PROJECT_ROOT / "atlases" / "mni"
+CACHE_DIR = PROJECT_ROOT / "cache" / "atlases"
+
+ATLASES = {
+    "bna_218": "bna/BN_218_combined_1mm.nii.gz",
+    "bna_246_1mm": "bna/BN_Atlas_246_1mm.nii.gz",
+    "bna_246_2mm": "bna/BN_Atlas_246_2mm.nii.gz",
+    "bna_246_3mm": "bna/BN_Atlas_246_3mm.nii.gz",
+    "shen_368": "shen_368/Shen_1mm_368_parcellation.nii.gz",
+}
+DEFAULT_ATLAS = "bna_218"
+
+_atlases = {}
+_lock = threading.Lock()
+
+
+class Atlas:
+    """
+    A label atlas loaded once.
+
+    Attributes:
+    - name: registry name, or the file stem for atlases given by path
+    - path: path to the source .nii.gz
+    - labels: integer label volume (read-only memory-map)
+    - affine: voxel -> MNI affine
+    - region_ids: sorted non-zero labels
+    - label_counts: number of voxels per region, aligned with region_ids
+    - roi_column: dense label id -> column in region_ids (-1 for ids that
+      are not regions), so id lookups are one indexing operation
+    - voxel_index, groups: labelled voxels and their region runs, built on
+      first use for grouped ROI statistics (see roi_stats.py)
+    """
+
+    def __init__(self, name, path, labels, affine):
+        self.name = name
+        self.path = Path(path)
+        self.labels = labels
+        self.affine = affine
+        self.shape = labels.shape
+
+        counts = np.bincount(labels.reshape(-1))
+        region_ids = np.flatnonzero(counts)
+        self.region_ids = region_ids[region_ids != 0]
+        self.label_counts = counts[self.region_ids]
+        self.roi_column = np.full(len(counts), -1, dtype=np.int32)
+        self.roi_column[self.region_ids] = np.arange(len(self.region_ids))
+        self._img = None
+        self._groups = None
+        self._voxel_index = None
+
+    @property
+    def n_regions(self):
+        return len(self.region_ids)
+
+    @property
+    def img(self):
+        """Nifti image wrapping the cached integer labels, for nilearn maskers."""
+        if self._img is None:
+            self._img = nib.Nifti1Image(self.labels, self.affine)
+        return self._img
+
+    @property
+    def voxel_index(self):
+        """Flat indices of the labelled voxels."""
+        if self._voxel_index is None:
+            self._voxel_index = np.flatnonzero(np.asarray(self.labels).reshape(-1))
+        return self._voxel_index
+
+    @property
+    def groups(self):
+        """Labelled voxels grouped by region (see roi_stats.RegionGroups), built once."""
+        if self._groups is None:
+            labels = np.asarray(self.labels).reshape(-1)[self.voxel_index]
+            self._groups = RegionGroups(self.roi_column[labels], self.n_regions)
+        return self._groups
+
+    def label_array(self, values, fill=np.nan):
+        """
+        Scatter region-ordered values into a dense array indexed by label id.
+
+        Returns:
+        - float array, shape (max label + 1,), `fill` where the id is not a region
+        """
+        out = np.full(len(self.roi_column), fill, dtype=np.float64)
+        out[self.region_ids] = values
+        return out
+
+    def __repr__(self):
+        return f"Atlas({self.name!r}, shape={self.shape}, n_regions={self.n_regions})"
+
+
+def resolve_atlas_path(atlas=None):
+    """Map a registry name, path or None (default atlas) to a file path."""
+    if atlas is None:
+        atlas = DEFAULT_ATLAS
+    if isinstance(atlas, str) and atlas in ATLASES:
+        return ATLAS_DIR / ATLASES[atlas]
+    return Path(atlas)
+
+
+def _cache_path(path):
+    stat = path.stat()
+    key = hashlib.sha1(
+        f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()[:12]
+    return CACHE_DIR / f"{path.name.split('.')[0]}_{key}.npy"
+
+
+def _load_labels(path):
+    cache_path = _cache_path(path)
+    if cache_path.exists():
+        return np.load(cache_path, mmap_mode="r")
+
+    data = np.asanyarray(nib.load(str(path)).dataobj)
+    labels = np.rint(data).astype(np.int16 if data.max() < 2 ** 15 else np.int32)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(cache_path, labels)
+    return np.load(cache_path, mmap_mode="r")
+
+
+def get_atlas(atlas=None):
+    """
+    Return a loaded atlas from the registry.
+
+    Parameters:
+    - atlas: registry name (see ATLASES), path to a label .nii(.gz), an
+      Atlas instance, or None for the default BN 218 atlas
+
+    Returns:
+    - Atlas
+    """
+    if isinstance(atlas, Atlas):
+        return atlas
+
+    path = resolve_atlas_path(atlas)
+    key = str(path.resolve())
+    with _lock:
+        if key not in _atlases:
+            if not path.exists():
+                raise FileNotFoundError(f"Atlas file not found at: {path}\n"
+                                        f"Please ensure the atlas file exists at the specified location.")
+            name = atlas if isinstance(atlas, str) and atlas in ATLASES else path.name.split(".")[0]
+            if atlas is None:
+                name = DEFAULT_ATLAS
+            affine = nib.load(str(path)).affine
+            _atlases[key] = Atlas(name, path, _load_labels(path), affine)
+        return _atlases[key]
+
+
+def list_atlases():
+    """Registry names of the atlases shipped with the repo."""
+    return list(ATLASES)
@@ -0,0 +1,100 @@
+"""
+Batch query mode.
+
+Runs a whole file of prompts through the encoder and `img_mod` on a process
+pool and writes one ROI JSON per prompt, for pre-generating show sequences.
+The model, atlas and projection operator are loaded in the parent before the
+pool is forked, so workers share them copy-on-write instead of each loading
+their own.
+"""
+from pathlib import Path
+import json
+import multiprocessing
+import os
+import re
+import time
+
+from threadpoolctl import threadpool_limits
+
+from . import encoder
+from .atlases import get_atlas
+from .light_minded import img_mod
+
+
+def read_prompts(path):
+    """One prompt per line; blank lines and lines starting with # are skipped."""
+    with open(path) as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _slug(prompt, max_length=40):
+    return re.sub(r"[^\w]+", "_", prompt.lower()).strip("_")[:max_length] or "prompt"
+
+
+def _init_worker():
+    # one BLAS thread per process, the pool provides the parallelism
+    threadpool_limits(1)
+
+
+def _process(task):
+    index, prompt, threshold, atlas = task
+    start = time.perf_counter()
+    result = encoder.encode_query(prompt)
+    processed = img_mod(result["z_map"], threshold=threshold, atlas_path=atlas)
+    return index, prompt, processed["roi_json"], time.perf_counter() - start
+
+
+def run_batch(prompts, output_dir, n_jobs=None, threshold=3.1, atlas=None):
+    """
+    Process a list of prompts in parallel.
+
+    Parameters:
+    - prompts: list of prompt strings
+    - output_dir: where `<index>_<slug>_roi_data.json` files and `batch.json` go
+    - n_jobs: worker processes (defaults to the number of CPUs)
+    - threshold: z threshold passed to img_mod
+    - atlas: atlas registry name or path (defaults to BN 218)
+
+    Returns:
+    - list of manifest entries (index, query, file, seconds) in prompt order
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    atlas = get_atlas(atlas)
+
+    # load everything shared before forking; the first prompt also builds
+    # (or loads) the projection operator for the model's output grid
+    encoder.load_encoder(warm_up=False)
+    # workers resolve the atlas by path from the inherited registry
+    tasks = [(i, prompt, threshold, str(atlas.path)) for i, prompt in enumerate(prompts)]
+    manifest = []
+
+    def save(result):
+        index, prompt, roi_json, seconds = result
+        filename = f"{index:04d}_{_slug(prompt)}_roi_data.json"
+        with open(output_dir / filename, "wb") as f:
+            f.write(roi_json)
+        manifest.append({"index": index, "query": prompt, "file": filename,
+                         "seconds": round(seconds, 3)})
+
+    start = time.perf_counter()
+    if tasks:
+        save(_process(tasks[0]))
+    if len(tasks) > 1:
+        if n_jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(n_jobs, initializer=_init_worker) as pool:
+                for result in pool.imap_unordered(_process, tasks[1:], chunksize=4):
+                    save(result)
+        else:
+            for task in tasks[1:]:
+                save(_process(task))
+
+    manifest.sort(key=lambda entry: entry["index"])
+    with open(output_dir / "batch.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Processed {len(manifest)} prompts with {n_jobs} workers in "
+          f"{time.perf_counter() - start:.1f}s, saved to {output_dir}")
+    return manifest
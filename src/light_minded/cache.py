@@ -0,0 +1,177 @@
+"""
+Query result cache.
+
+Visitors type the same handful of feelings over and over, so the final
+per-ROI z-score vector (and optionally the native z-map) is cached under the
+normalized query text plus the atlas/threshold/method/ROI statistic settings.
+Entries live in an in-memory LRU and in an on-disk directory trimmed to a
+byte budget, so a repeated prompt lights the brain without running the model.
+
+The directory is shared by every process (API server, CLI, batch workers):
+entries are written to a temporary file and renamed into place, and an entry
+that cannot be read (left by a crash, or evicted by another process) is a miss.
+"""
+from pathlib import Path
+import hashlib
+import os
+import re
+import threading
+import zipfile
+
+import cachetools
+import nibabel as nib
+import numpy as np
+
+from .atlases import PROJECT_ROOT
+
+
+CACHE_DIR = PROJECT_ROOT / "cache" / "queries"
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace: ' Happy! ' -> 'happy'."""
+    query = re.sub(r"[^\w\s']", " ", query.lower())
+    return " ".join(query.split())
+
+
+class QueryCache:
+    """
+    LRU + on-disk cache of per-ROI z-scores keyed on normalized query text.
+
+    Parameters:
+    - cache_dir: directory for the on-disk entries (.npz, one per key)
+    - max_items: entries kept in memory
+    - max_disk_bytes: on-disk budget, least recently used files are evicted
+    - store_z_map: also store the native z-map with each entry
+    """
+
+    def __init__(self, cache_dir=None, max_items=256, max_disk_bytes=512 * 2 ** 20,
+                 store_z_map=False):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+        self.max_disk_bytes = max_disk_bytes
+        self.store_z_map = store_z_map
+        self._memory = cachetools.LRUCache(maxsize=max_items)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # running size of the directory, resynced by a scan when over budget
+        self._disk_bytes = None
+
+    @staticmethod
+    def key(query, atlas, threshold, method="projection", statistic="mean"):
+        text = f"{normalize_query(query)}|{atlas}|{threshold}|{method}|{statistic}"
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, query, atlas, threshold, method="projection", statistic="mean"):
+        """
+        Look up a query.
+
+        Returns:
+        - dict with "roi_id", "z_score" and, if stored, "z_map"; None on a miss
+        """
+        key = self.key(query, atlas, threshold, method, statistic)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+            path = self._path(key)
+            try:
+                with np.load(path) as f:
+                    entry = {"roi_id": f["roi_id"], "z_score": f["z_score"]}
+                    if "z_map" in f:
+                        entry["z_map"] = nib.Nifti1Image(f["z_map"], f["z_map_affine"])
+                # mark as recently used for disk eviction
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                print(f"Dropping unreadable query cache entry {path.name}: {e}")
+                path.unlink(missing_ok=True)
+                self._disk_bytes = None
+                self.misses += 1
+                return None
+            self._memory[key] = entry
+            self.hits += 1
+            self.disk_hits += 1
+            return entry
+
+    def put(self, query, atlas, threshold, roi_ids, z_scores, z_map=None,
+            method="projection", statistic="mean"):
+        """
+        Store the ROI vector (and the z-map if store_z_map) for a query.
+
+        `statistic` is the ROI statistic the z_scores are (see roi_stats.py).
+        """
+        key = self.key(query, atlas, threshold, method, statistic)
+        entry = {
+            "roi_id": np.asarray(roi_ids, dtype=np.int32),
+            "z_score": np.asarray(z_scores, dtype=np.float32),
+        }
+        arrays = dict(entry, query=np.array(normalize_query(query)))
+        if self.store_z_map and z_map is not None:
+            entry["z_map"] = z_map
+            arrays["z_map"] = np.asarray(z_map.dataobj, dtype=np.float32)
+            arrays["z_map_affine"] = z_map.affine
+
+        with self._lock:
+            self._memory[key] = entry
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            if self._disk_bytes is None:
+                self._scan()
+            path = self._path(key)
+            # readers never see a partly written entry
+            tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+                size = f.tell()
+            try:
+                size -= path.stat().st_size
+            except FileNotFoundError:
+                pass
+            os.replace(tmp, path)
+            self._disk_bytes += size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _scan(self):
+        # (path, stat) of the on-disk entries; resyncs the running size
+        files = []
+        for path in self.cache_dir.glob("*.npz"):
+            try:
+                files.append((path, path.stat()))
+            except FileNotFoundError:
+                pass  # evicted by another process
+        self._disk_bytes = sum(st.st_size for _, st in files)
+        return files
+
+    def _evict(self):
+        files = self._scan()
+        for path, st in sorted(files, key=lambda f: f[1].st_mtime):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._memory.pop(path.stem, None)
+            self._disk_bytes -= st.st_size
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters and current sizes."""
+        with self._lock:
+            if self._disk_bytes is None:
+                self._scan()
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
@@ -1,5 +1,9 @@
 """Console script for light_minded."""
+from pathlib import Path
+from typing import List, Optional
+
 import light_minded
+from light_minded import atlases, batch, sweep as sweeps, vocab_table, zmap_stack
 
 import typer
 from rich.console import Console
@@ -16,6 +20,65 @@ def main():
     console.print("See Typer documentation at https://typer.tiangolo.com/")
     
 
+@app.command()
+def build_vocab_table(
+    atlas: str = typer.Option(atlases.DEFAULT_ATLAS, help="Atlas registry name or path."),
+    all_atlases: bool = typer.Option(False, "--all", help="Build for every registry atlas."),
+):
+    """Precompute the vocabulary-to-ROI table used by the instant query mode."""
+    for name in atlases.list_atlases() if all_atlases else [atlas]:
+        vocab_table.build_vocab_table(name)
+
+
+@app.command("batch")
+def run_batch(
+    prompts_file: Path = typer.Argument(..., help="Text file with one prompt per line."),
+    output_dir: Path = typer.Option(Path("hack/batch_outputs"), help="Where ROI JSON files are written."),
+    jobs: Optional[int] = typer.Option(None, help="Worker processes, defaults to the CPU count."),
+    threshold: float = typer.Option(3.1, help="Two-sided z threshold."),
+    atlas: str = typer.Option(atlases.DEFAULT_ATLAS, help="Atlas registry name or path."),
+):
+    """Run a file of prompts through the pipeline on a process pool."""
+    prompts = batch.read_prompts(prompts_file)
+    console.print(f"Processing {len(prompts)} prompts from {prompts_file}")
+    batch.run_batch(prompts, output_dir, n_jobs=jobs, threshold=threshold, atlas=atlas)
+
+
+@app.command()
+def reparcellate(
+    output: Path = typer.Argument(..., help="CSV file, one row per stored query."),
+    atlas: str = typer.Option(atlases.DEFAULT_ATLAS, help="Atlas registry name or path."),
+    threshold: float = typer.Option(3.1, help="Two-sided z threshold."),
+    stack_dir: Optional[Path] = typer.Option(None, help="Z-map stack directory."),
+):
+    """Re-score every query of the z-map stack for an atlas and threshold."""
+    import pandas as pd
+
+    stack = zmap_stack.ZMapStack(stack_dir)
+    queries, region_ids, roi_values = stack.parcellate(atlas, threshold=threshold)
+    pd.DataFrame(roi_values, index=pd.Index(queries, name="query"),
+                 columns=region_ids).to_csv(output)
+    console.print(f"Parcellated {len(queries)} stored maps with {atlas} at z > {threshold}, "
+                  f"saved to {output}")
+
+
+@app.command()
+def sweep(
+    z_map: Path = typer.Argument(..., help="NeuroQuery z-map (.nii/.nii.gz) on its native grid."),
+    output: Path = typer.Argument(..., help="CSV file for the long (atlas, threshold, statistic, roi_id) table."),
+    threshold: List[float] = typer.Option(list(sweeps.DEFAULT_THRESHOLDS), help="Z threshold, repeatable."),
+    atlas: List[str] = typer.Option([atlases.DEFAULT_ATLAS], help="Atlas registry name or path, repeatable."),
+    statistic: Optional[List[str]] = typer.Option(None, help="ROI statistic, repeatable (default: all)."),
+):
+    """Compare thresholds, atlases and ROI statistics for one z-map."""
+    import nibabel as nib
+
+    table = sweeps.sweep(nib.load(str(z_map)), thresholds=threshold, atlases=atlas,
+                         statistics=statistic or None)
+    table.to_csv(output, index=False)
+    console.print(sweeps.compare(table).to_string(index=False))
+    console.print(f"Saved {len(table)} rows to {output}")
+
 
 if __name__ == "__main__":
     app()
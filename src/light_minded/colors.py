@@ -0,0 +1,104 @@
+"""
+Vectorized ROI color mapping.
+
+Colormaps are sampled once into uint8 lookup tables, so turning a vector of
+ROI z-scores into LED colors is a single clip/index operation, and the
+payload is gathered straight from the NumPy arrays into pre-rendered JSON
+bytes.
+"""
+import functools
+
+import matplotlib
+import numpy as np
+import orjson
+
+
+@functools.lru_cache(maxsize=None)
+def color_lut(cmap_name="RdBu_r", n_colors=256):
+    """
+    Sample a matplotlib colormap into an RGB lookup table.
+
+    Parameters:
+    - cmap_name: name of matplotlib colormap (RdBu_r, coolwarm, seismic, etc)
+    - n_colors: number of entries; 256 matches matplotlib's own resolution
+
+    Returns:
+    - read-only uint8 array, shape (n_colors, 3)
+    """
+    cmap = matplotlib.colormaps[cmap_name].resampled(n_colors)
+    lut = np.rint(cmap(np.arange(n_colors))[:, :3] * 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def values_to_rgb8(values, cmap_name="RdBu_r", vmin=None, vmax=None, n_colors=256):
+    """
+    Map values to packed uint8 RGB through a cached lookup table.
+
+    Same binning as `map_to_colors` (matplotlib Normalize + colormap), with
+    the symmetric default range when vmin/vmax are not given.
+
+    Returns:
+    - uint8 array, shape (len(values), 3)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if vmin is None or vmax is None:
+        limit = np.max(np.abs(values)) if values.size else 1.0
+        vmin = -limit if vmin is None else vmin
+        vmax = limit if vmax is None else vmax
+    span = (vmax - vmin) or 1.0
+
+    index = np.nan_to_num((values - vmin) / span * n_colors, nan=0.0)
+    np.clip(index, 0, n_colors - 1, out=index)
+    return color_lut(cmap_name, n_colors)[index.astype(np.intp)]
+
+
+def _byte_table(texts):
+    # NUL-padded rows of a uint8 matrix; the padding is dropped after gathering
+    width = max(map(len, texts))
+    return np.frombuffer(b"".join(t.ljust(width, b"\0") for t in texts),
+                         dtype=np.uint8).reshape(len(texts), width)
+
+
+# text of every possible channel value (uint8 / 255) with the separator that follows it
+_CHANNEL_TEXT = [orjson.dumps(i / 255) for i in range(256)]
+_R_BYTES = _byte_table([t + b',"g":' for t in _CHANNEL_TEXT])
+_G_BYTES = _byte_table([t + b',"b":' for t in _CHANNEL_TEXT])
+_B_BYTES = _byte_table([t + b'},' for t in _CHANNEL_TEXT])
+_MAX_TABLE_ID = 2 ** 16
+
+
+@functools.lru_cache(maxsize=None)
+def _id_bytes(n_ids):
+    return _byte_table([b'{"roi_id":%d,"r":' % i for i in range(n_ids)])
+
+
+def roi_payload(roi_ids, rgb8):
+    """
+    Serialize ROI colors as JSON bytes in the documented ROI data format
+    (hack/data_format.json, same as prepare_roi_json):
+    {"data": [{"roi_id": 1, "r": 0.0, "g": 0.0, "b": 0.0}, ...]} with
+    channels in [0, 1].
+
+    A uint8 channel has 256 possible values, so every entry is gathered
+    from pre-rendered byte tables (one row per id / channel value) and the
+    payload is one array, without a Python object per ROI. The bytes are
+    the same as orjson.dumps of the entry dicts.
+    """
+    roi_ids = np.asarray(roi_ids, dtype=np.int64)
+    rgb8 = np.asarray(rgb8, dtype=np.uint8).reshape(-1, 3)
+    if not len(roi_ids):
+        return b'{"data":[]}'
+    if roi_ids.min() < 0 or roi_ids.max() >= _MAX_TABLE_ID:
+        # ids outside any atlas: not worth a table
+        channels = (rgb8 / 255).tolist()
+        return orjson.dumps({"data": [
+            {"roi_id": roi_id, "r": r, "g": g, "b": b}
+            for roi_id, (r, g, b) in zip(roi_ids.tolist(), channels)
+        ]})
+    # one table per power of two of the largest id, shared by later calls
+    id_bytes = _id_bytes(1 << max(int(roi_ids.max()).bit_length(), 8))
+    rows = np.concatenate([id_bytes[roi_ids], _R_BYTES[rgb8[:, 0]],
+                           _G_BYTES[rgb8[:, 1]], _B_BYTES[rgb8[:, 2]]], axis=1)
+    # drop the padding and the last entry's trailing comma
+    return b'{"data":[' + rows[rows != 0].tobytes()[:-1] + b']}'
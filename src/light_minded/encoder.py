@@ -0,0 +1,145 @@
+"""Process-wide NeuroQuery encoder.
+
+The NeuroQuery model (vocabulary, smoothing and regression matrices) is
+expensive to deserialize, so it is loaded once per process and shared by
+`light_minded.main`, `launch.run` and the API server.
+"""
+import threading
+import time
+
+import numpy as np
+from neuroquery import fetch_neuroquery_model, NeuroQueryModel
+from sklearn.preprocessing import normalize
+
+
+WARM_UP_QUERY = "brain"
+
+_encoder = None
+_load_lock = threading.Lock()
+# NeuroQueryModel.__call__ mutates the tokenizer, so queries are serialized
+_query_lock = threading.Lock()
+
+_stats = {
+    "load_count": 0,
+    "load_seconds": None,
+    "warm_up_seconds": None,
+    "query_seconds": [],
+}
+
+
+def load_encoder(warm_up=True, model_dir=None):
+    """
+    Load the NeuroQuery model, once per process.
+
+    Parameters:
+    - warm_up: run a dummy query after loading so the first visitor does not
+      pay for lazily built internals (masker, vocabulary sets)
+    - model_dir: optional NeuroQuery data directory, fetched if None
+
+    Returns:
+    - the shared NeuroQueryModel instance
+    """
+    global _encoder
+    with _load_lock:
+        if _encoder is None:
+            print("Loading NeuroQuery model...")
+            start = time.perf_counter()
+            if model_dir is None:
+                model_dir = fetch_neuroquery_model()
+            _encoder = NeuroQueryModel.from_data_dir(model_dir)
+            _stats["load_seconds"] = time.perf_counter() - start
+            _stats["load_count"] += 1
+            print(f"NeuroQuery model loaded in {_stats['load_seconds']:.2f}s")
+
+            if warm_up:
+                start = time.perf_counter()
+                with _query_lock:
+                    _encoder(WARM_UP_QUERY)
+                _stats["warm_up_seconds"] = time.perf_counter() - start
+    return _encoder
+
+
+def get_encoder():
+    """Return the shared encoder, loading it (without warm-up) if needed."""
+    if _encoder is None:
+        return load_encoder(warm_up=False)
+    return _encoder
+
+
+def is_loaded():
+    return _encoder is not None
+
+
+def encode_query(query):
+    """
+    Run a query through the shared encoder and record its latency.
+
+    Returns:
+    - NeuroQuery result dict (brain_map, z_map, similar_words, ...)
+    """
+    encoder = get_encoder()
+    start = time.perf_counter()
+    with _query_lock:
+        result = encoder(query)
+    _stats["query_seconds"].append(time.perf_counter() - start)
+    return result
+
+
+def encode_terms(query):
+    """
+    Encode a query into the model's term space, without building a brain map.
+
+    Mirrors NeuroQueryModel.transform up to the regression: tf-idf, semantic
+    smoothing and selection of the supervised terms.
+
+    Returns:
+    - (weights, norm): term weights over the supervised vocabulary and the
+      z-score normalization of the prediction, so that
+      z_map = (weights @ coef.T / sqrt(residual_var)) / norm
+    """
+    encoder = get_encoder()
+    smoothed_regression = encoder.smoothed_regression
+    regression = smoothed_regression.regression_
+    start = time.perf_counter()
+    with _query_lock:
+        raw_tfidf = normalize(encoder.vectorizer.transform([query]), copy=False)
+        smoothed = smoothed_regression.smoothing_.transform(raw_tfidf)
+    weights = np.asarray(smoothed)[0, regression.selected_features_]
+
+    norm = 1.0
+    if smoothed_regression.transform_to_z and regression.M_ is not None:
+        norm = max(float(np.linalg.norm(weights @ regression.M_)), 1e-24)
+    _stats["query_seconds"].append(time.perf_counter() - start)
+    return weights, norm
+
+
+def latency_report():
+    """
+    Summarize model load and per-query latency for this process.
+
+    Returns:
+    - dict with load count/time, warm-up time and query latency percentiles (ms)
+    """
+    query_ms = np.asarray(_stats["query_seconds"]) * 1000
+    report = {
+        "load_count": _stats["load_count"],
+        "load_seconds": _stats["load_seconds"],
+        "warm_up_seconds": _stats["warm_up_seconds"],
+        "query_count": int(query_ms.size),
+    }
+    if query_ms.size:
+        report.update({
+            "query_ms_mean": float(query_ms.mean()),
+            "query_ms_median": float(np.median(query_ms)),
+            "query_ms_max": float(query_ms.max()),
+        })
+    return report
+
+
+def print_latency_report():
+    report = latency_report()
+    print("\nNeuroQuery latency report:")
+    for key, value in report.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"  {key}: {value}")
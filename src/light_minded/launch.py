@@ -1,6 +1,7 @@
 import json
 from pathlib import Path
 from src.light_minded import light_minded as lm
+from src.light_minded import encoder
 
 def run():
     config_path = Path("config/settings.json")
@@ -13,6 +14,9 @@ def run():
 
     print(f"Launching with config:\n{json.dumps(config, indent=4)}")
 
+    # load the shared model up front, main() reuses it
+    encoder.load_encoder(warm_up=True)
+
     lm.main()
 
     #TODO: test for online/offline requirements, atlas and dataset files
@@ -1,18 +1,25 @@
 # Main module
-from neuroquery import fetch_neuroquery_model, NeuroQueryModel
 from nilearn.plotting import view_img
-from nilearn.image import threshold_img, resample_to_img, load_img
-import nibabel as nib
-from nilearn.maskers import NiftiLabelsMasker
+from nilearn.image import threshold_img, resample_to_img
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import matplotlib.cm as cm
 from pathlib import Path
-import json
 import datetime
 
+from . import encoder
+from .atlases import get_atlas
+from .cache import QueryCache
+from .colors import values_to_rgb8, roi_payload
+from .projection import get_projection
+from .roi_stats import STATISTICS, roi_statistics, threshold_values
+from .vocab_table import query_rois
+from .store import SessionStore
+from .writer import MapWriter
+from .zmap_stack import ZMapStack
+
 
 # The model used here is the same as the one deployed on the neuroquery website
 
@@ -22,11 +29,24 @@ def query_get_user_input():
 
 
 def query_run(query):
-    encoder = NeuroQueryModel.from_data_dir(fetch_neuroquery_model())
-    result = encoder(query)  # result is dict with various fields (niis, tables, etc.)
+    # the model is loaded once per process and shared, see encoder.py
+    result = encoder.encode_query(query)  # result is dict with various fields (niis, tables, etc.)
     return result
 
 
+def query_run_table(query, atlas_path=None):
+    """
+    Offline/instant mode: ROI values from the precomputed vocabulary table.
+
+    Skips brain map synthesis and resampling; values are unthresholded ROI
+    means (see vocab_table.py).
+
+    Returns:
+    - (roi_ids, z_scores) arrays
+    """
+    return query_rois(query, atlas_path)
+
+
 def query_view_result(result):
     view_img(result["brain_map"], threshold=3.1).open_in_browser()
     print(result["similar_words"].head(15))
@@ -34,39 +54,61 @@ def query_view_result(result):
     print(result["similar_documents"].head())
 
 
-def parcellate_map(z_map_thresh, atlas_path):
+def _parcellate(z_map_thresh, atlas, statistics, percentile):
+    # the maps of img_mod are on the atlas grid already
+    if z_map_thresh.shape[:3] != atlas.shape or not np.allclose(z_map_thresh.affine, atlas.affine):
+        z_map_thresh = resample_to_img(z_map_thresh, atlas.img, force_resample=True)
+    data = np.asanyarray(z_map_thresh.dataobj).reshape(-1)[atlas.voxel_index]
+
+    # one pass over the labelled voxels; rows follow atlas.region_ids by
+    # construction, whatever labels the map leaves empty
+    return roi_statistics(atlas.groups, data, thresholds=None,
+                          statistics=statistics, percentile=percentile)
+
+
+def parcellate_map(z_map_thresh, atlas_path=None, statistic="mean", statistics=None,
+                   percentile=95):
     """
     Parcellate thresholded z-map using provided atlas.
+
+    ROI statistics come from grouped reductions over the atlas label array
+    (see roi_stats.py) instead of a NiftiLabelsMasker per call; "mean"
+    matches the masker.
+
     Parameters:
     - z_map_thresh: thresholded z-map image
-    - atlas_path: path to atlas file
+    - atlas_path: atlas registry name, path to atlas file or Atlas
+    - statistic: ROI statistic used as z_score (see roi_stats.STATISTICS)
+    - statistics: extra statistics added as columns (None for all of them)
+    - percentile: percentile used by the "percentile" statistic
 
     Returns:
     - DataFrame with ROI values
     """
-    # load atlas
-    atlas_img = load_img(atlas_path)
-
-    # create masker object
-    masker = NiftiLabelsMasker(labels_img=atlas_img)
+    # loaded once per process by the registry
+    atlas = get_atlas(atlas_path)
+    names = list(STATISTICS) if statistics is None else [statistic, *statistics]
+    stats = _parcellate(z_map_thresh, atlas, dict.fromkeys(names), percentile)
+    return roi_stats_df(atlas.region_ids, stats, statistic)
 
-    # extract ROI values
-    roi_values = masker.fit_transform(z_map_thresh)
 
-    # get unique region IDs from atlas
-    atlas_data = atlas_img.get_fdata()
-    region_ids = sorted(np.unique(atlas_data))
-    if 0 in region_ids:  # remove 0 vals
-        region_ids = [id for id in region_ids if id != 0]
+def roi_stats_df(region_ids, stats, statistic="mean"):
+    """
+    ROI DataFrame from roi_statistics output (first threshold row).
 
-    # create df with region IDs and values
+    Returns:
+    - DataFrame with roi_id, z_score (the chosen statistic), abs_z_score and
+      one column per computed statistic
+    """
     roi_df = pd.DataFrame({
         'roi_id': region_ids,
-        'z_score': roi_values[0][:len(region_ids)]
+        'z_score': stats[statistic][0]
     })
 
-    # ddd absolute value for sorting
+    # add absolute value for sorting
     roi_df['abs_z_score'] = abs(roi_df['z_score'])
+    for name, values in stats.items():
+        roi_df[name] = values[0]
 
     return roi_df
 
@@ -124,157 +166,239 @@ def prepare_roi_json(roi_df, rgb_values):
     return {"data": roi_data}
 
 
-def img_mod(z_map, threshold=3.1, atlas_path=None):
+def img_mod(z_map, threshold=3.1, atlas_path=None, method="projection", statistic="mean",
+            statistics=()):
     """
     Modify z-map with resampling, thresholding, and atlas application
+
+    Parameters:
+    - z_map: NeuroQuery z-map on its native grid
+    - threshold: two-sided z threshold
+    - atlas_path: atlas registry name or path to atlas file (defaults to BN 218)
+    - method: "projection" uses the cached sparse resampling operator
+      (trilinear, maps restricted to atlas voxels), "resample" runs
+      resample_to_img + threshold_img + parcellate_map
+    - statistic: ROI statistic used as z_score and for the colors
+      ("mean", "mean_active", "max", "max_abs", "percentile",
+      "fraction_active", see roi_stats.py)
+    - statistics: extra statistics computed into "stats"
+
+    "projection" is not numerically identical to "resample": the operator
+    interpolates trilinearly where resample_to_img uses continuous (spline)
+    interpolation, so thresholded ROI means differ slightly, mostly in
+    regions that straddle the threshold (on smooth 4 mm maps: up to ~0.25 z
+    per region, ~0.05 z on average; see projection.compare_with_img_mod).
+
+    Returns:
+    - dict with the resampled/thresholded maps, the region-ordered "roi_id"
+      and "z_score" arrays, "roi_values" indexed by label id
+      (roi_values[roi_id], NaN for ids that are not regions), the "stats"
+      of roi_statistics, uint8 "rgb_values" and "roi_json" payload bytes
+      (see colors.roi_payload); roi_stats_df(roi_id, stats, statistic)
+      turns them into a table
     """
-    # set default atlas path relative to project root
-    if atlas_path is None:
-        atlas_path = Path(__file__).parent.parent.parent / "atlases" / "mni" / "bna" / "BN_218_combined_1mm.nii.gz"
+    # atlases are loaded once per process, BN 218 by default
+    atlas = get_atlas(atlas_path)
+    names = dict.fromkeys([statistic, *statistics])
+
+    if method == "projection":
+        # one sparse mat-vec onto the atlas voxels, then grouped reductions
+        print(f"Projecting z-map onto atlas: {atlas.path.name}")
+        projection = get_projection(z_map, atlas)
+        voxel_values = projection.resample(z_map)
+        z_map_resamp = projection.to_image(voxel_values)
+        z_map_thresh = projection.to_image(threshold_values(voxel_values, [threshold])[0][0])
+
+        stats = roi_statistics(projection.groups, voxel_values, [threshold],
+                               statistics=names)
+    elif method == "resample":
+        # resample z-map to atlas resolution
+        print("Resampling z-map to atlas resolution...")
+        z_map_resamp = resample_to_img(z_map, atlas.img, force_resample=True)
+
+        # threshold resampled z-map
+        print("Thresholding z-map...")
+        z_map_thresh = threshold_img(
+            z_map_resamp,
+            threshold=threshold,
+            cluster_threshold=0,
+            two_sided=True,
+            copy_header=True
+        )
+
+        # parcellate data into ROIs
+        print(f"Applying atlas: {atlas.path.name}")
+        stats = _parcellate(z_map_thresh, atlas, names, percentile=95)
     else:
-        atlas_path = Path(atlas_path)
-
-    if not atlas_path.exists():
-        raise FileNotFoundError(f"Atlas file not found at: {atlas_path}\n"
-                              f"Please ensure the atlas file exists at the specified location.")
-
-    # resample z-map to atlas resolution
-    print("Resampling z-map to atlas resolution...")
-    atlas = load_img(str(atlas_path))  # Convert Path to string for nilearn
-    z_map_resamp = resample_to_img(z_map, atlas, force_resample=True)
-
-
-    # threshold resampled z-map
-    print("Thresholding z-map...")
-    z_map_thresh = threshold_img(
-        z_map_resamp,
-        threshold=threshold,
-        cluster_threshold=0,
-        two_sided=True,
-        copy_header=True
-    )
+        raise ValueError(f"Unknown img_mod method: {method!r}")
+
+    # rows follow atlas.region_ids, so the dense label-indexed array is one scatter
+    z_scores = stats[statistic][0]
+    return {
+        "z_map_resamp.nii.gz": z_map_resamp,
+        "z_map_thresh.nii.gz": z_map_thresh,
+        "roi_id": atlas.region_ids,
+        "z_score": z_scores,
+        "roi_values": atlas.label_array(z_scores),
+        "stats": stats,
+        **colorize_rois(atlas.region_ids, z_scores)
+    }
 
-    # parcellate data into ROIs
-    print(f"Applying atlas: {Path(atlas_path).name}")
-    roi_df = parcellate_map(z_map_thresh, atlas_path)
 
-    # map values to colors
+def colorize_rois(roi_ids, z_scores):
+    """
+    Map ROI z-scores to colors and the ROI payload.
+
+    Returns:
+    - dict with uint8 "rgb_values" and "roi_json" payload bytes
+    """
+    # map values to colors through the cached lookup table (uint8 RGB)
     print("Mapping ROI values to colors...")
-    rgb_values = map_to_colors(
-        roi_df['z_score'].values,
+    rgb_values = values_to_rgb8(
+        z_scores,
         cmap_name='RdBu_r',
         vmin=-5,
         vmax=5
     )
 
-    # put roi data into json
-    roi_json = prepare_roi_json(roi_df, rgb_values)
+    # serialize roi colors straight from the arrays
+    roi_json = roi_payload(roi_ids, rgb_values)
 
     return {
-        "z_map_resamp.nii.gz": z_map_resamp,
-        "z_map_thresh.nii.gz": z_map_thresh,
-        "roi_df": roi_df,
         "rgb_values": rgb_values,
         "roi_json": roi_json
     }
 
 
-def main():
-    print("Light speed ahead!")
-
-    # set up results storage
-    all_maps = {}
-    all_roi_data = {}
-    all_metadata = []
-
-    while True:
-        query = query_get_user_input()
-        if query.lower() in ['quit', 'exit', 'q']:
-            break
-
-        print(f"Processing query: {query}")
-        result = query_run(query)
-
-        # view results - open browser window
-        query_view_result(result)
+def main(mode="image", output_dir="hack/test_outputs", map_format="nii",
+         skip_intermediate=False, stack_maps=False):
+    """
+    Interactive query loop.
 
-        #apply atlas and get maps
-        processed_results = img_mod(result["z_map"])
+    Parameters:
+    - mode: "image" runs NeuroQuery brain maps through img_mod, "table" reads
+      ROI values from the precomputed vocabulary table (no maps saved)
+    - output_dir: where maps, ROI data and results.jsonl (one line per
+      query, appended across sessions) are written
+    - map_format: "nii.gz", "nii" or "npy16" (see writer.MAP_FORMATS)
+    - skip_intermediate: do not save the resampled/thresholded maps
+    - stack_maps: also keep each new z-map in the memory-mapped stack
+      (see zmap_stack.ZMapStack) for later re-parcellation
+
+    Every query is also logged to <output_dir>/light_minded.sqlite
+    (see store.SessionStore).
+    """
+    print("Light speed ahead!")
 
-        # set query key for consistent naming
-        query_key = f"query_{len(all_metadata)}"
+    # pay the model load once, before the first visitor types anything
+    encoder.load_encoder(warm_up=True)
+
+    # repeated prompts are answered from the cache, without model inference
+    query_cache = QueryCache()
+    atlas_name = get_atlas().name
+    threshold = 3.1
+    statistic = "mean"
+    method = "table" if mode == "table" else "projection"
+
+    # outputs are persisted in the background as soon as each query is done
+    writer = MapWriter(output_dir, map_format=map_format,
+                       skip_intermediate=skip_intermediate)
+    # one visitor query per transaction: a crash loses nothing already answered
+    store = SessionStore(Path(output_dir) / "light_minded.sqlite", batch_size=1)
+    stack = ZMapStack() if stack_maps else None
+
+    try:
+        while True:
+            query = query_get_user_input()
+            if query.lower() in ['quit', 'exit', 'q']:
+                break
+
+            # timestamped keys: a later session in the same output_dir
+            # never overwrites earlier maps
+            timestamp = datetime.datetime.now()
+            query_key = timestamp.strftime("query_%Y%m%d_%H%M%S_%f")
+
+            result = None
+            maps = {}
+            cached = query_cache.get(query, atlas_name, threshold, method=method,
+                                     statistic=statistic)
+            if cached is not None:
+                print(f"Cached query: {query}")
+                roi_ids, z_scores = cached["roi_id"], cached["z_score"]
+                processed_results = colorize_rois(roi_ids, z_scores)
+            elif mode == "table":
+                print(f"Processing query from vocabulary table: {query}")
+                roi_ids, z_scores = query_run_table(query)
+                query_cache.put(query, atlas_name, threshold, roi_ids, z_scores,
+                                method=method, statistic=statistic)
+                processed_results = colorize_rois(roi_ids, z_scores)
+            else:
+                print(f"Processing query: {query}")
+                result = query_run(query)
+
+                # view results - open browser window
+                query_view_result(result)
+
+                #apply atlas and get maps
+                processed_results = img_mod(result["z_map"], threshold=threshold,
+                                            statistic=statistic)
+                roi_ids, z_scores = processed_results["roi_id"], processed_results["z_score"]
+                query_cache.put(query, atlas_name, threshold, roi_ids, z_scores,
+                                z_map=result["z_map"], method=method, statistic=statistic)
+                if stack is not None:
+                    stack.add(query, result["z_map"])
+
+                maps = {
+                    "brain_map": result["brain_map"],
+                    "z_map": result["z_map"],
+                    "z_map_resamp": processed_results["z_map_resamp.nii.gz"],
+                    "z_map_thresh": processed_results["z_map_thresh.nii.gz"]
+                }
+
+            # queue maps and ROI data for writing right away
+            output_files = writer.submit_query(query_key, maps, processed_results["roi_json"])
+
+            # store metadata
+            metadata = {
+                "query": query,
+                "timestamp": timestamp.isoformat(),
+                "cached": cached is not None,
+                "mode": mode,
+                "similar_words": result["similar_words"].head(15).to_dict() if result is not None else {},
+                "similar_documents": result["similar_documents"].head().to_dict() if result is not None else {},
+                "threshold_settings": {
+                    "z_score": threshold,
+                    "cluster_threshold": 0
+                },
+                "output_files": output_files
+            }
+            store.add_query(
+                query, roi_ids, z_scores,
+                rgb=processed_results["rgb_values"],
+                similar_words=result["similar_words"].head(15) if result is not None else None,
+                similar_documents=result["similar_documents"].head() if result is not None else None,
+                timestamp=metadata["timestamp"], mode=mode, cached=cached is not None,
+                atlas=atlas_name, threshold=threshold, output_files=output_files
+            )
 
-        # save maps for later
-        all_maps[query_key] = {
-            "brain_map.nii.gz": result["brain_map"],
-            "z_map.nii.gz": result["z_map"],
-            "z_map_resamp.nii.gz": processed_results["z_map_resamp.nii.gz"],
-            "z_map_thresh.nii.gz": processed_results["z_map_thresh.nii.gz"]
-        }
+            # one line per query: nothing is rewritten or kept for the session
+            writer.append_json("results.jsonl", metadata)
 
-        # store ROI data
-        all_roi_data[query_key] = processed_results["roi_json"]
-
-        # store metadata
-        metadata = {
-            "query": query,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "similar_words": result["similar_words"].head(15).to_dict(),
-            "similar_documents": result["similar_documents"].head().to_dict(),
-            "threshold_settings": {
-                "z_score": 3.1,
-                "cluster_threshold": 0
-            }
-        }
-        all_metadata.append(metadata)
-
-        if input("\nWould you like to enter another feeling? (y/n): ").lower() != 'y':
-            break
-
-    # save results at the end
-    output_dir = Path("hack/test_outputs")
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # paths to all saved files
-    saved_paths = {}
-
-    # save all brain maps
-    for query_key, maps in all_maps.items():
-        for map_name, img in maps.items():
-            filename = f"{query_key}_{map_name}"
-            output_path = output_dir / filename
-            nib.save(img, output_path)
-            saved_paths[filename] = str(output_path)
-            print(f"Saved {filename} to {output_path}")
-
-    # save all ROI data in JSON format
-    for query_key, roi_data in all_roi_data.items():
-        filename = f"{query_key}_roi_data.json"
-        output_path = output_dir / filename
-        with open(output_path, "w") as f:
-            json.dump(roi_data, f, indent=2)
-        saved_paths[filename] = str(output_path)
-        print(f"Saved {filename} to {output_path}")
-
-    # save paths in metadata
-    for i, metadata in enumerate(all_metadata):
-        query_key = f"query_{i}"
-        metadata["output_files"] = {
-            k: v for k, v in saved_paths.items() if k.startswith(query_key)
-        }
+            if input("\nWould you like to enter another feeling? (y/n): ").lower() != 'y':
+                break
+    finally:
+        writer.close()
+        store.close()
+        print(f"\nSaved all results to {Path(output_dir) / 'results.jsonl'}")
 
-    # save final results / metadata json
-    results_path = output_dir / "results.json"
-    with open(results_path, "w") as f:
-        json.dump(all_metadata, f, indent=2)
-    print(f"\nSaved all results to {results_path}")
+    encoder.print_latency_report()
+    print(f"Query cache: {query_cache.stats()}")
 
 
 if __name__ == "__main__":
     main()
 
     # TODO: build out user prompts, multiple prompts to create a series of outputs
-    #  (perhaps create SQLite db for long-term storage)
     # TODO: fine-tune threshold ?
     # TODO: output settings, integrate with setup/launch/ future config file
 
@@ -0,0 +1,274 @@
+"""
+Precomputed atlas projection operator.
+
+NeuroQuery always returns z-maps on the same grid and the atlases are fixed,
+so the resampling step of `img_mod` is a constant linear operator. It is built
+once per (source grid, atlas) pair as a sparse matrix mapping native z-map
+voxels onto the labelled voxels of the atlas (trilinear weights), cached on
+disk, and parcellating a query becomes one sparse matrix-vector product
+followed by a label-indexed mean.
+"""
+from pathlib import Path
+import hashlib
+import itertools
+import os
+import threading
+import time
+
+import nibabel as nib
+import numpy as np
+from scipy import sparse
+
+from .atlases import PROJECT_ROOT, get_atlas
+from .roi_stats import RegionGroups
+
+
+CACHE_DIR = PROJECT_ROOT / "cache" / "projection"
+
+# in-process memo, keyed like the on-disk cache; one lock per key so
+# concurrent callers (e.g. the server's query threads) build each operator once
+_operators = {}
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class AtlasProjection:
+    """
+    Sparse (labelled atlas voxel <- native voxel) resampling operator.
+
+    Attributes:
+    - matrix: CSR matrix, shape (n_labelled_voxels, n_source_voxels)
+    - voxel_index: flat indices of the labelled voxels in the atlas grid
+    - voxel_roi: column of each labelled voxel in `region_ids`
+    - region_ids: sorted non-zero atlas labels
+    - roi_counts: number of atlas voxels per region
+    """
+
+    def __init__(self, matrix, voxel_index, voxel_roi, region_ids,
+                 source_shape, atlas_shape, atlas_affine):
+        self.matrix = matrix
+        self.voxel_index = voxel_index
+        self.voxel_roi = voxel_roi
+        self.region_ids = region_ids
+        self.roi_counts = np.bincount(voxel_roi, minlength=len(region_ids))
+        self.source_shape = tuple(source_shape)
+        self.atlas_shape = tuple(atlas_shape)
+        self.atlas_affine = atlas_affine
+        self._groups = None
+
+    @property
+    def groups(self):
+        """Labelled voxels sorted by region (see roi_stats.RegionGroups), built once."""
+        if self._groups is None:
+            self._groups = RegionGroups(self.voxel_roi, len(self.region_ids))
+        return self._groups
+
+    def resample(self, z_map):
+        """Resample a native z-map (image or array) onto the labelled atlas voxels."""
+        if isinstance(z_map, nib.spatialimages.SpatialImage):
+            z_map = np.asanyarray(z_map.dataobj)
+        z_map = np.asarray(z_map, dtype=np.float32).reshape(-1)
+        if z_map.size != self.matrix.shape[1]:
+            raise ValueError(
+                f"z-map has {z_map.size} voxels, operator expects "
+                f"{self.matrix.shape[1]} (grid {self.source_shape})")
+        return self.matrix @ z_map
+
+    def parcellate(self, z_map, threshold=3.1, two_sided=True):
+        """
+        Mean z-score per region, matching resample -> threshold -> masker.
+
+        Parameters:
+        - z_map: native NeuroQuery z-map (image or array)
+        - threshold: voxels below this are zeroed (None to skip)
+        - two_sided: threshold on |z| instead of z
+
+        Returns:
+        - (voxel_values, roi_values): thresholded labelled-voxel values and
+          per-region means in `region_ids` order
+        """
+        values = self.resample(z_map)
+        if threshold is not None:
+            if two_sided:
+                values[np.abs(values) < threshold] = 0.0
+            else:
+                values[values < threshold] = 0.0
+        sums = np.bincount(self.voxel_roi, weights=values,
+                           minlength=len(self.region_ids))
+        return values, sums / self.roi_counts
+
+    def to_image(self, voxel_values):
+        """Scatter labelled-voxel values back into a full atlas-grid image."""
+        data = np.zeros(int(np.prod(self.atlas_shape)), dtype=np.float32)
+        data[self.voxel_index] = voxel_values
+        return nib.Nifti1Image(data.reshape(self.atlas_shape), self.atlas_affine)
+
+
+def _cache_key(source_shape, source_affine, atlas_path):
+    atlas_path = atlas_path.resolve()
+    stat = atlas_path.stat()
+    h = hashlib.sha1()
+    h.update(np.asarray(source_shape[:3], dtype=np.int64).tobytes())
+    h.update(np.round(np.asarray(source_affine, dtype=np.float64), 6).tobytes())
+    h.update(f"{atlas_path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+def resampling_matrix(source_shape, source_affine, voxel_index, target_shape, target_affine):
+    """
+    Trilinear weights taking a source-grid map onto chosen target voxels.
+
+    Parameters:
+    - source_shape, source_affine: grid of the maps being resampled
+    - voxel_index: flat indices of the target voxels
+    - target_shape, target_affine: grid the indices refer to
+
+    Returns:
+    - CSR matrix, shape (len(voxel_index), n_source_voxels)
+    """
+    source_shape = tuple(source_shape[:3])
+    # target voxel -> world -> fractional source voxel
+    ijk = np.column_stack(np.unravel_index(voxel_index, target_shape))
+    to_source = np.linalg.inv(source_affine) @ target_affine
+    coords = nib.affines.apply_affine(to_source, ijk)
+    base = np.floor(coords).astype(np.int64)
+    frac = coords - base
+
+    rows, cols, weights = [], [], []
+    row_ids = np.arange(len(voxel_index))
+    for corner in itertools.product((0, 1), repeat=3):
+        corner = np.asarray(corner)
+        idx = base + corner
+        w = np.prod(np.where(corner, frac, 1 - frac), axis=1)
+        valid = (np.all((idx >= 0) & (idx < source_shape), axis=1)) & (w > 0)
+        rows.append(row_ids[valid])
+        cols.append(np.ravel_multi_index(idx[valid].T, source_shape))
+        weights.append(w[valid])
+
+    return sparse.csr_matrix(
+        (np.concatenate(weights).astype(np.float32),
+         (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(voxel_index), int(np.prod(source_shape))),
+    )
+
+
+def build_projection(source_shape, source_affine, atlas=None):
+    """
+    Build the trilinear resampling operator from a source grid onto an atlas.
+
+    Parameters:
+    - source_shape, source_affine: grid of the NeuroQuery z-maps
+    - atlas: registry name, path or Atlas (see atlases.get_atlas)
+
+    Returns:
+    - AtlasProjection
+    """
+    source_shape = tuple(source_shape[:3])
+    atlas = get_atlas(atlas)
+    labels = np.asarray(atlas.labels).reshape(-1)
+    voxel_index = np.flatnonzero(labels)
+    voxel_roi = atlas.roi_column[labels[voxel_index]]
+
+    matrix = resampling_matrix(source_shape, source_affine, voxel_index,
+                               atlas.shape, atlas.affine)
+    return AtlasProjection(matrix, voxel_index, voxel_roi.astype(np.int32),
+                           atlas.region_ids, source_shape, atlas.shape,
+                           atlas.affine)
+
+
+def _save(projection, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write next to the target and rename, so readers never see a partial file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            data=projection.matrix.data,
+            indices=projection.matrix.indices,
+            indptr=projection.matrix.indptr,
+            shape=np.asarray(projection.matrix.shape),
+            voxel_index=projection.voxel_index,
+            voxel_roi=projection.voxel_roi,
+            region_ids=projection.region_ids,
+            source_shape=np.asarray(projection.source_shape),
+            atlas_shape=np.asarray(projection.atlas_shape),
+            atlas_affine=projection.atlas_affine,
+        )
+    os.replace(tmp, path)
+
+
+def _load(path):
+    f = np.load(path)
+    matrix = sparse.csr_matrix(
+        (f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+    return AtlasProjection(matrix, f["voxel_index"], f["voxel_roi"],
+                           f["region_ids"], f["source_shape"],
+                           f["atlas_shape"], f["atlas_affine"])
+
+
+def get_projection(z_map, atlas=None, cache_dir=None):
+    """
+    Return the projection operator for a z-map's grid, building it once.
+
+    Parameters:
+    - z_map: any image on the NeuroQuery output grid
+    - atlas: registry name, path or Atlas (see atlases.get_atlas)
+    - cache_dir: where operators are stored (defaults to <project>/cache/projection)
+
+    Returns:
+    - AtlasProjection
+    """
+    cache_dir = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+    atlas = get_atlas(atlas)
+    key = _cache_key(z_map.shape, z_map.affine, atlas.path)
+    if key in _operators:
+        return _operators[key]
+
+    with _locks_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        if key in _operators:
+            return _operators[key]
+        path = cache_dir / f"{atlas.path.name.split('.')[0]}_{key}.npz"
+        if path.exists():
+            projection = _load(path)
+        else:
+            print(f"Building projection operator for {atlas.path.name}...")
+            start = time.perf_counter()
+            projection = build_projection(z_map.shape, z_map.affine, atlas)
+            _save(projection, path)
+            print(f"Projection operator built in {time.perf_counter() - start:.1f}s, "
+                  f"cached at {path}")
+        _operators[key] = projection
+    return projection
+
+
+def compare_with_img_mod(z_map, threshold=3.1, atlas_path=None):
+    """
+    Verify the projection path against the resample/threshold/masker path.
+
+    Returns:
+    - dict with max and mean absolute difference of the ROI values,
+      correlation and timings of both paths
+    """
+    from .light_minded import img_mod
+
+    start = time.perf_counter()
+    reference = img_mod(z_map, threshold=threshold, atlas_path=atlas_path,
+                        method="resample")
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = img_mod(z_map, threshold=threshold, atlas_path=atlas_path,
+                   method="projection")
+    fast_seconds = time.perf_counter() - start
+
+    expected = reference["z_score"]
+    actual = fast["z_score"]
+    return {
+        "max_abs_diff": float(np.max(np.abs(expected - actual))),
+        "mean_abs_diff": float(np.mean(np.abs(expected - actual))),
+        "correlation": float(np.corrcoef(expected, actual)[0, 1]),
+        "resample_seconds": reference_seconds,
+        "projection_seconds": fast_seconds,
+    }
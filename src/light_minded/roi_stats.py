@@ -0,0 +1,206 @@
+"""
+Per-ROI statistics as grouped reductions.
+
+The labelled voxels of an atlas are sorted by region once; after that every
+statistic is a reduction over contiguous runs of one array, and several
+thresholds are handled at once as rows of a 2-D array. Sums and counts go
+through one np.bincount over (row, region) keys, maxima through
+ufunc.reduceat on the region runs, and percentiles through one sort of the
+unthresholded values (thresholding only zeroes values, which keeps their
+order, so the same sort serves every threshold).
+
+Statistics (all computed on the thresholded map):
+- mean: mean over every voxel of the region (what NiftiLabelsMasker gives)
+- mean_active: mean over the suprathreshold voxels only
+- max: largest value
+- max_abs: largest |z|
+- percentile: `percentile`-th percentile of |z| (of z when one-sided)
+- fraction_active: share of the region's voxels above threshold
+"""
+import numpy as np
+
+
+class RegionGroups:
+    """
+    Labelled voxels sorted by region, for grouped reductions.
+
+    Parameters:
+    - voxel_roi: column of each labelled voxel in `region_ids`
+    - n_regions: number of regions
+    """
+
+    def __init__(self, voxel_roi, n_regions):
+        voxel_roi = np.asarray(voxel_roi)
+        self.n_regions = n_regions
+        self.order = np.argsort(voxel_roi, kind="stable")
+        # small ints make the stable per-region sort of `quantile` a radix sort
+        self.roi = voxel_roi[self.order].astype(np.int16 if n_regions < 2 ** 15 else np.int32)
+        self.counts = np.bincount(voxel_roi, minlength=n_regions)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+        self._nonempty = self.counts > 0
+
+    def sort(self, values):
+        """Reorder labelled-voxel values (last axis) into region runs."""
+        return np.asarray(values)[..., self.order]
+
+    def sum(self, values):
+        """Per-region sums of region-sorted values, shape (..., n_regions)."""
+        values = np.atleast_2d(values)
+        n_rows = len(values)
+        keys = (np.arange(n_rows)[:, None] * self.n_regions + self.roi).reshape(-1)
+        sums = np.bincount(keys, weights=values.reshape(-1).astype(np.float64),
+                           minlength=n_rows * self.n_regions)
+        return sums.reshape(n_rows, self.n_regions)
+
+    def reduce(self, ufunc, values, empty=0.0):
+        """Per-region `ufunc.reduceat` of region-sorted values, `empty` for empty regions."""
+        values = np.atleast_2d(values)
+        out = np.full((len(values), self.n_regions), empty, dtype=np.float64)
+        out[:, self._nonempty] = ufunc.reduceat(values, self.starts[self._nonempty], axis=1)
+        return out
+
+    def quantile(self, values, q):
+        """
+        Per-region q-quantile (linear interpolation, as np.percentile) of one
+        row of region-sorted values.
+
+        Returns:
+        - (low, high, fraction): the two order statistics around the
+          quantile and the interpolation weight of `high`
+        """
+        # sort by value, then stably by region: sorted runs per region
+        order = np.argsort(values)
+        within = values[order[np.argsort(self.roi[order], kind="stable")]]
+        position = q * np.maximum(self.counts - 1, 0)
+        offset = np.floor(position).astype(np.int64)
+        low = self.starts + offset
+        high = self.starts + np.minimum(offset + 1, np.maximum(self.counts - 1, 0))
+        low, high = np.minimum(low, len(within) - 1), np.minimum(high, len(within) - 1)
+        empty = ~self._nonempty
+        low, high = within[low], within[high]
+        low[empty] = high[empty] = 0
+        return low, high, position - offset
+
+
+class ReductionPass:
+    """
+    One thresholded pass over the labelled voxels; intermediates shared by
+    several statistics (sums, active counts) are computed once.
+
+    Attributes:
+    - groups: RegionGroups of the atlas
+    - raw: region-sorted unthresholded values, shape (n_voxels,)
+    - thresholds: (n_rows,) thresholds, None for an already thresholded map
+    - values, active: (n_rows, n_voxels) thresholded values and mask
+    """
+
+    def __init__(self, groups, values, thresholds=(3.1,), two_sided=True, percentile=95):
+        self.groups = groups
+        self.raw = groups.sort(np.asarray(values, dtype=np.float32))
+        self.thresholds = None if thresholds is None else np.asarray(thresholds, dtype=np.float32)
+        self.two_sided = two_sided
+        self.percentile = percentile
+        if self.thresholds is None:
+            self.values, self.active = self.raw[None], self.raw[None] != 0
+        else:
+            self.values, self.active = threshold_values(self.raw, self.thresholds, two_sided)
+        self._sums = None
+        self._n_active = None
+
+    @property
+    def sums(self):
+        if self._sums is None:
+            self._sums = self.groups.sum(self.values)
+        return self._sums
+
+    @property
+    def n_active(self):
+        if self._n_active is None:
+            self._n_active = self.groups.sum(self.active)
+        return self._n_active
+
+    def apply_threshold(self, values):
+        """Threshold a (n_regions,) vector at every level, shape (n_rows, n_regions)."""
+        if self.thresholds is None:
+            return values[None]
+        return threshold_values(values, self.thresholds, self.two_sided)[0]
+
+
+def _mean(p):
+    # thresholded mean over every voxel of the region, as the masker does
+    return p.sums / np.maximum(p.groups.counts, 1)
+
+
+def _mean_active(p):
+    return np.divide(p.sums, p.n_active, out=np.zeros_like(p.sums), where=p.n_active > 0)
+
+
+def _max(p):
+    return p.groups.reduce(np.maximum, p.values)
+
+
+def _max_abs(p):
+    return p.groups.reduce(np.maximum, np.abs(p.values))
+
+
+def _percentile(p):
+    magnitude = np.abs(p.raw) if p.two_sided else p.raw
+    low, high, fraction = p.groups.quantile(magnitude, p.percentile / 100)
+    # thresholding is monotonic in the sort key, so threshold the order
+    # statistics instead of re-sorting every thresholded row
+    low, high = p.apply_threshold(low), p.apply_threshold(high)
+    return low + (high - low) * fraction
+
+
+def _fraction_active(p):
+    return p.n_active / np.maximum(p.groups.counts, 1)
+
+
+# name -> fn(ReductionPass) -> (n_rows, n_regions)
+STATISTICS = {
+    "mean": _mean,
+    "mean_active": _mean_active,
+    "max": _max,
+    "max_abs": _max_abs,
+    "percentile": _percentile,
+    "fraction_active": _fraction_active,
+}
+
+
+def threshold_values(values, thresholds, two_sided=True):
+    """
+    Threshold one vector of voxel values at several levels at once.
+
+    Returns:
+    - (values, active): (n_thresholds, n_voxels) thresholded copies and the
+      boolean mask of voxels at or above each threshold
+    """
+    values = np.asarray(values, dtype=np.float32)
+    levels = np.asarray(thresholds, dtype=np.float32)[:, None]
+    active = (np.abs(values) if two_sided else values) >= levels
+    return np.where(active, values, np.float32(0)), active
+
+
+def roi_statistics(groups, values, thresholds=(3.1,), statistics=None, two_sided=True,
+                   percentile=95):
+    """
+    Every requested statistic for every region and threshold.
+
+    Parameters:
+    - groups: RegionGroups of the atlas
+    - values: labelled-voxel values (atlas voxel order)
+    - thresholds: z thresholds, one output row each; None when `values`
+      are already thresholded (non-zero voxels count as active)
+    - statistics: names from STATISTICS (defaults to all)
+    - two_sided: threshold on |z| instead of z
+    - percentile: percentile used by the "percentile" statistic
+
+    Returns:
+    - dict statistic -> (n_thresholds, n_regions) float array
+    """
+    statistics = list(STATISTICS) if statistics is None else list(statistics)
+    unknown = [name for name in statistics if name not in STATISTICS]
+    if unknown:
+        raise ValueError(f"Unknown ROI statistics {unknown}, expected some of {list(STATISTICS)}")
+    reduction = ReductionPass(groups, values, thresholds, two_sided, percentile)
+    return {name: STATISTICS[name](reduction) for name in statistics}
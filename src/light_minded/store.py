@@ -0,0 +1,254 @@
+"""
+SQLite session store.
+
+Long-term record of every visitor query: the query itself, its per-ROI
+values as compact blobs and the similar words/documents NeuroQuery returned.
+The database runs in WAL mode and inserts are buffered and written in
+batches, so logging never stalls the query loop, and any past brain state
+can be replayed with one indexed lookup.
+"""
+from pathlib import Path
+import datetime
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+from .cache import normalize_query
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY,
+    session TEXT,
+    timestamp TEXT NOT NULL,
+    query TEXT NOT NULL,
+    normalized_query TEXT NOT NULL,
+    mode TEXT,
+    cached INTEGER,
+    atlas TEXT,
+    threshold REAL,
+    output_files TEXT
+);
+CREATE INDEX IF NOT EXISTS queries_timestamp ON queries (timestamp);
+CREATE INDEX IF NOT EXISTS queries_normalized ON queries (normalized_query);
+
+CREATE TABLE IF NOT EXISTS roi_values (
+    query_id INTEGER PRIMARY KEY REFERENCES queries (id),
+    n_rois INTEGER NOT NULL,
+    region_ids BLOB NOT NULL,
+    z_scores BLOB NOT NULL,
+    rgb BLOB
+);
+
+CREATE TABLE IF NOT EXISTS similar_words (
+    query_id INTEGER NOT NULL REFERENCES queries (id),
+    rank INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    similarity REAL,
+    weight_in_brain_map REAL,
+    weight_in_query REAL,
+    n_documents INTEGER
+);
+CREATE INDEX IF NOT EXISTS similar_words_query ON similar_words (query_id);
+CREATE INDEX IF NOT EXISTS similar_words_term ON similar_words (term);
+
+CREATE TABLE IF NOT EXISTS similar_documents (
+    query_id INTEGER NOT NULL REFERENCES queries (id),
+    rank INTEGER NOT NULL,
+    pmid INTEGER,
+    title TEXT,
+    similarity REAL
+);
+CREATE INDEX IF NOT EXISTS similar_documents_query ON similar_documents (query_id);
+"""
+
+
+def _float_or_none(value):
+    return None if value is None or value != value else float(value)
+
+
+class SessionStore:
+    """
+    Batched writer/reader for the session database.
+
+    Parameters:
+    - path: SQLite file, created if missing
+    - batch_size: queries buffered before an automatic flush
+    - session: label stored with every query (defaults to the start time)
+    """
+
+    def __init__(self, path, batch_size=16, session=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.session = session or datetime.datetime.now().isoformat(timespec="seconds")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._pending = {"queries": [], "roi_values": [], "similar_words": [],
+                         "similar_documents": []}
+        self._n_pending = 0
+
+    def add_query(self, query, roi_ids, z_scores, rgb=None, similar_words=None,
+                  similar_documents=None, timestamp=None, mode=None, cached=False,
+                  atlas=None, threshold=None, output_files=None):
+        """
+        Buffer one query and its results.
+
+        Query ids are assigned by SQLite when the batch is written, so
+        several processes can share one database.
+
+        Parameters:
+        - query: prompt text
+        - roi_ids, z_scores: per-ROI values (stored as int16/float32 blobs)
+        - rgb: optional (n_rois, 3) uint8 colors
+        - similar_words, similar_documents: NeuroQuery result DataFrames
+
+        Returns:
+        - id of the query row if this call wrote the batch, else None (see
+          `flush` for the ids of buffered queries)
+        """
+        roi_ids = np.asarray(roi_ids, dtype=np.int16)
+        with self._lock:
+            # child rows reference the query's position in the batch until
+            # SQLite assigns its id
+            query_id = len(self._pending["queries"])
+            self._pending["queries"].append((
+                self.session,
+                timestamp or datetime.datetime.now().isoformat(),
+                query, normalize_query(query), mode, int(bool(cached)), atlas,
+                threshold, json.dumps(output_files) if output_files else None,
+            ))
+            self._pending["roi_values"].append((
+                query_id, len(roi_ids), roi_ids.tobytes(),
+                np.asarray(z_scores, dtype=np.float32).tobytes(),
+                None if rgb is None else np.ascontiguousarray(rgb, dtype=np.uint8).tobytes(),
+            ))
+            if similar_words is not None:
+                for rank, (term, row) in enumerate(similar_words.iterrows()):
+                    n_documents = row.get("n_documents")
+                    self._pending["similar_words"].append((
+                        query_id, rank, str(term),
+                        _float_or_none(row.get("similarity")),
+                        _float_or_none(row.get("weight_in_brain_map")),
+                        _float_or_none(row.get("weight_in_query")),
+                        None if n_documents is None else int(n_documents),
+                    ))
+            if similar_documents is not None:
+                for rank, (_, row) in enumerate(similar_documents.iterrows()):
+                    pmid = row.get("pmid")
+                    self._pending["similar_documents"].append((
+                        query_id, rank, None if pmid is None else int(pmid),
+                        row.get("title"), _float_or_none(row.get("similarity")),
+                    ))
+            self._n_pending += 1
+            if self._n_pending >= self.batch_size:
+                return self._flush()[-1]
+        return None
+
+    def _flush(self):
+        if not self._n_pending:
+            return []
+        with self._conn:
+            # ids come from SQLite under the write lock, so concurrent
+            # writers never hand out the same id
+            self._conn.execute("BEGIN IMMEDIATE")
+            ids = [self._conn.execute(
+                "INSERT INTO queries (session, timestamp, query, normalized_query, mode, "
+                "cached, atlas, threshold, output_files) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row).lastrowid for row in self._pending["queries"]]
+
+            def with_ids(rows):
+                return [(ids[row[0]], *row[1:]) for row in rows]
+
+            self._conn.executemany(
+                "INSERT INTO roi_values VALUES (?, ?, ?, ?, ?)",
+                with_ids(self._pending["roi_values"]))
+            self._conn.executemany(
+                "INSERT INTO similar_words VALUES (?, ?, ?, ?, ?, ?, ?)",
+                with_ids(self._pending["similar_words"]))
+            self._conn.executemany(
+                "INSERT INTO similar_documents VALUES (?, ?, ?, ?, ?)",
+                with_ids(self._pending["similar_documents"]))
+        for rows in self._pending.values():
+            rows.clear()
+        self._n_pending = 0
+        return ids
+
+    def flush(self):
+        """
+        Write all buffered queries in one transaction.
+
+        Returns:
+        - ids of the written queries, in the order they were added
+        """
+        with self._lock:
+            return self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_state(self, query_id):
+        """
+        Replay a stored brain state.
+
+        Returns:
+        - dict with query, timestamp, region_ids, z_scores and rgb (or None)
+        """
+        self.flush()
+        row = self._conn.execute(
+            "SELECT q.query, q.timestamp, r.region_ids, r.z_scores, r.rgb "
+            "FROM queries q JOIN roi_values r ON r.query_id = q.id WHERE q.id = ?",
+            (query_id,)).fetchone()
+        if row is None:
+            return None
+        query, timestamp, region_ids, z_scores, rgb = row
+        return {
+            "query": query,
+            "timestamp": timestamp,
+            "region_ids": np.frombuffer(region_ids, dtype=np.int16),
+            "z_scores": np.frombuffer(z_scores, dtype=np.float32),
+            "rgb": None if rgb is None else np.frombuffer(rgb, dtype=np.uint8).reshape(-1, 3),
+        }
+
+    def roi_matrix(self, since=None):
+        """
+        Stack stored ROI vectors for analytics.
+
+        Returns:
+        - (query_ids, z_scores) with z_scores shaped (n_queries, n_rois); only
+          queries with the most common ROI count are included
+        """
+        self.flush()
+        sql = ("SELECT q.id, r.n_rois, r.z_scores FROM queries q "
+               "JOIN roi_values r ON r.query_id = q.id")
+        params = ()
+        if since is not None:
+            sql += " WHERE q.timestamp >= ?"
+            params = (since,)
+        rows = self._conn.execute(sql + " ORDER BY q.id", params).fetchall()
+        if not rows:
+            return np.array([], dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        n_rois = np.bincount([r[1] for r in rows]).argmax()
+        rows = [r for r in rows if r[1] == n_rois]
+        return (np.array([r[0] for r in rows]),
+                np.frombuffer(b"".join(r[2] for r in rows), dtype=np.float32).reshape(len(rows), -1))
+
+    def top_queries(self, limit=20):
+        """Most frequent normalized queries, as (query, count) pairs."""
+        self.flush()
+        return self._conn.execute(
+            "SELECT normalized_query, COUNT(*) AS n FROM queries "
+            "GROUP BY normalized_query ORDER BY n DESC LIMIT ?", (limit,)).fetchall()
@@ -0,0 +1,87 @@
+"""
+Threshold / atlas / statistic sweeps for one z-map.
+
+Tuning the threshold used to mean re-running resample -> threshold ->
+masker for every setting. Here the z-map is projected once per atlas, all
+thresholds are applied at once as rows of one array and every ROI statistic
+comes out of grouped reductions (see roi_stats.py). The result is a long
+table (atlas, threshold, statistic, roi_id, value) plus a per-setting
+comparison summary.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from .atlases import DEFAULT_ATLAS, get_atlas
+from .projection import get_projection
+from .roi_stats import STATISTICS, roi_statistics
+
+
+DEFAULT_THRESHOLDS = (1.96, 2.3, 3.1, 4.0)
+
+
+def sweep(z_map, thresholds=DEFAULT_THRESHOLDS, atlases=(DEFAULT_ATLAS,), statistics=None,
+          two_sided=True):
+    """
+    Evaluate every combination of threshold, atlas and ROI statistic.
+
+    Parameters:
+    - z_map: NeuroQuery z-map on its native grid
+    - thresholds: z thresholds
+    - atlases: registry names, paths or Atlas objects
+    - statistics: names from roi_stats.STATISTICS (defaults to all)
+    - two_sided: threshold on |z| instead of z
+
+    Returns:
+    - DataFrame with atlas, threshold, statistic, roi_id and value columns
+    """
+    statistics = list(STATISTICS) if statistics is None else list(statistics)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    frames = []
+    for atlas in atlases:
+        atlas = get_atlas(atlas)
+        start = time.perf_counter()
+        projection = get_projection(z_map, atlas)
+        results = roi_statistics(projection.groups, projection.resample(z_map),
+                                 thresholds, statistics, two_sided)
+        n_regions = len(projection.region_ids)
+        for name, values in results.items():
+            frames.append(pd.DataFrame({
+                "atlas": atlas.name,
+                "threshold": np.repeat(thresholds, n_regions),
+                "statistic": name,
+                "roi_id": np.tile(projection.region_ids, len(thresholds)),
+                "value": values.reshape(-1),
+            }))
+        print(f"Swept {len(thresholds)} thresholds x {len(statistics)} statistics on "
+              f"{atlas.name} in {time.perf_counter() - start:.2f}s")
+    return pd.concat(frames, ignore_index=True)
+
+
+def compare(table, vmin=-5, vmax=5):
+    """
+    Summarize a sweep table per (atlas, threshold, statistic).
+
+    Parameters:
+    - table: output of `sweep`
+    - vmin, vmax: color range of the LED mapping, to count saturated ROIs
+
+    Returns:
+    - DataFrame with n_rois, n_nonzero, min, max, mean_abs and the fraction
+      of ROIs clipped by the color range
+    """
+    value = table["value"]
+    summary = table.assign(
+        nonzero=value != 0,
+        abs_value=value.abs(),
+        clipped=(value <= vmin) | (value >= vmax),
+    ).groupby(["atlas", "threshold", "statistic"], sort=False).agg(
+        n_rois=("value", "size"),
+        n_nonzero=("nonzero", "sum"),
+        min=("value", "min"),
+        max=("value", "max"),
+        mean_abs=("abs_value", "mean"),
+        clipped=("clipped", "mean"),
+    )
+    return summary.reset_index()
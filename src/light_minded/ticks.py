@@ -0,0 +1,57 @@
+"""
+Fixed-rate tick schedule and frame-timing summaries.
+
+Shared by the server's animation loop (asyncio) and the LED frame scheduler
+(a thread): both run work at a fixed frame rate, skip ticks a slow frame
+overran instead of catching up in a burst, and report timings as
+mean/p95/max over a window of recent frames.
+"""
+import time
+
+import numpy as np
+
+
+class TickClock:
+    """
+    Deadlines of a fixed-rate loop.
+
+    Parameters:
+    - fps: tick rate
+    - clock: monotonic time source
+    """
+
+    def __init__(self, fps, clock=time.perf_counter):
+        self.period = 1.0 / fps
+        self.clock = clock
+        self.missed = 0
+        self.reset()
+
+    def reset(self):
+        """Restart the schedule with a tick due now (e.g. after idling)."""
+        self.next_tick = self.clock()
+
+    def advance(self):
+        """
+        Move to the next tick, skipping those the last frame overran.
+
+        Returns:
+        - seconds to wait before the next tick (0 when it is already due)
+        """
+        self.next_tick += self.period
+        delay = self.next_tick - self.clock()
+        if delay < -self.period:
+            missed = int(-delay // self.period)
+            self.missed += missed
+            self.next_tick += missed * self.period
+            delay += missed * self.period
+        return max(delay, 0)
+
+
+def timing_summary(values):
+    """mean/p95/max in ms of durations in seconds (None when empty)."""
+    values = np.asarray(values) * 1000
+    if not len(values):
+        return None
+    return {"mean": round(float(values.mean()), 3),
+            "p95": round(float(np.percentile(values, 95)), 3),
+            "max": round(float(values.max()), 3)}
@@ -0,0 +1,145 @@
+"""
+Precomputed vocabulary-to-ROI table.
+
+A NeuroQuery z-map is a linear function of the query's term weights (up to
+one scalar normalization), and resampling + ROI averaging is linear too, so
+the unthresholded per-ROI value of every supervised term can be computed
+once per atlas. At query time the prompt is encoded into term weights and a
+single (n_terms,) @ (n_terms, n_rois) product gives the ROI vector, with no
+brain image synthesis or resampling.
+"""
+import json
+import time
+
+import numpy as np
+from scipy import sparse
+
+from . import encoder
+from .atlases import PROJECT_ROOT, get_atlas
+from .projection import get_projection
+
+
+CACHE_DIR = PROJECT_ROOT / "cache" / "vocab_table"
+
+_tables = {}
+
+
+class VocabTable:
+    """
+    Memory-mapped (n_terms, n_rois) float32 table for one atlas.
+
+    Attributes:
+    - table: per-term ROI activation, rows follow the supervised vocabulary
+    - region_ids: atlas labels of the table columns
+    - terms: supervised vocabulary
+    """
+
+    def __init__(self, table, region_ids, terms):
+        self.table = table
+        self.region_ids = region_ids
+        self.terms = terms
+
+    def project(self, weights, norm=1.0):
+        """ROI values for encoded term weights (see encoder.encode_terms)."""
+        return (weights @ self.table) / norm
+
+
+def _table_dir(atlas, cache_dir=None):
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    return cache_dir / atlas.name
+
+
+def build_vocab_table(atlas=None, model=None, cache_dir=None):
+    """
+    Build and store the vocabulary-to-ROI table for an atlas.
+
+    Parameters:
+    - atlas: registry name, path or Atlas (defaults to BN 218)
+    - model: NeuroQueryModel, the shared encoder if None
+    - cache_dir: output directory (defaults to <project>/cache/vocab_table)
+
+    Returns:
+    - path of the table directory
+    """
+    atlas = get_atlas(atlas)
+    model = model if model is not None else encoder.get_encoder()
+    smoothed_regression = model.smoothed_regression
+    regression = smoothed_regression.regression_
+    start = time.perf_counter()
+
+    # native masked voxels -> labelled atlas voxels -> ROI means
+    mask_img = model.get_masker().mask_img_
+    mask_index = np.flatnonzero(np.asarray(mask_img.dataobj).reshape(-1))
+    projection = get_projection(mask_img, atlas)
+    n_rois = len(projection.region_ids)
+    roi_mean = sparse.csr_matrix(
+        (1.0 / projection.roi_counts[projection.voxel_roi],
+         (projection.voxel_roi, np.arange(len(projection.voxel_roi)))),
+        shape=(n_rois, len(projection.voxel_roi)),
+    )
+    roi_operator = roi_mean @ projection.matrix[:, mask_index]
+
+    # coef_ is (n_voxels, n_terms); z-maps divide each voxel by its residual std
+    coef = np.asarray(regression.coef_)
+    if smoothed_regression.transform_to_z and regression.M_ is not None:
+        coef = coef / np.maximum(np.sqrt(regression.residual_var), 1e-24)[:, None]
+    table = np.asarray(roi_operator @ coef, dtype=np.float32).T
+
+    table_dir = _table_dir(atlas, cache_dir)
+    table_dir.mkdir(parents=True, exist_ok=True)
+    np.save(table_dir / "table.npy", np.ascontiguousarray(table))
+    np.save(table_dir / "region_ids.npy", projection.region_ids)
+    with open(table_dir / "meta.json", "w") as f:
+        json.dump({
+            "atlas": atlas.name,
+            "atlas_path": str(atlas.path),
+            "n_terms": table.shape[0],
+            "n_rois": table.shape[1],
+            "terms": list(model.supervised_vocabulary()),
+        }, f)
+    _tables.pop(str(table_dir), None)
+    print(f"Built {table.shape[0]} x {table.shape[1]} vocabulary table for "
+          f"{atlas.name} in {time.perf_counter() - start:.1f}s: {table_dir}")
+    return table_dir
+
+
+def load_vocab_table(atlas=None, cache_dir=None, build=True):
+    """
+    Memory-map the vocabulary table of an atlas, building it if missing.
+
+    Returns:
+    - VocabTable
+    """
+    atlas = get_atlas(atlas)
+    table_dir = _table_dir(atlas, cache_dir)
+    key = str(table_dir)
+    if key not in _tables:
+        if not (table_dir / "table.npy").exists():
+            if not build:
+                raise FileNotFoundError(
+                    f"No vocabulary table for {atlas.name} at {table_dir}, "
+                    f"run build_vocab_table first")
+            build_vocab_table(atlas, cache_dir=cache_dir)
+        with open(table_dir / "meta.json") as f:
+            terms = json.load(f)["terms"]
+        _tables[key] = VocabTable(
+            np.load(table_dir / "table.npy", mmap_mode="r"),
+            np.load(table_dir / "region_ids.npy"),
+            terms,
+        )
+    return _tables[key]
+
+
+def query_rois(query, atlas=None, cache_dir=None):
+    """
+    Per-ROI values of a query straight from the vocabulary table.
+
+    Values are the unthresholded ROI means of the z-map, resampled with the
+    same trilinear operator as img_mod's projection path.
+
+    Returns:
+    - (region_ids, roi_values)
+    """
+    vocab = load_vocab_table(atlas, cache_dir=cache_dir)
+    weights, norm = encoder.encode_terms(query)
+    return vocab.region_ids, vocab.project(weights, norm)
@@ -0,0 +1,148 @@
+"""
+Background persistence of query outputs.
+
+Each query's maps, ROI payload and results line are handed to a
+writer thread as soon as they are ready, so nothing accumulates in RAM over
+a day-long exhibit and a crash only loses what is still in the queue.
+"""
+from pathlib import Path
+import json
+import queue
+import threading
+
+import nibabel as nib
+import numpy as np
+
+
+MAP_FORMATS = {
+    "nii.gz": ".nii.gz",  # compressed, slowest
+    "nii": ".nii",        # uncompressed NIfTI
+    "npy16": ".npy",      # float16 array, grid recorded in grids.json
+}
+INTERMEDIATE_MAPS = ("z_map_resamp", "z_map_thresh")
+
+_STOP = object()
+
+
+class MapWriter:
+    """
+    Writer thread with a bounded job queue.
+
+    Parameters:
+    - output_dir: directory for all outputs
+    - map_format: one of MAP_FORMATS
+    - skip_intermediate: do not write the resampled/thresholded maps
+    - max_queue: jobs buffered before `submit` blocks
+    """
+
+    def __init__(self, output_dir, map_format="nii", skip_intermediate=False, max_queue=64):
+        if map_format not in MAP_FORMATS:
+            raise ValueError(f"Unknown map format {map_format!r}, "
+                             f"expected one of {list(MAP_FORMATS)}")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.map_format = map_format
+        self.skip_intermediate = skip_intermediate
+        self.errors = []
+        self._grids = {}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="map-writer", daemon=True)
+        self._thread.start()
+
+    def submit_query(self, query_key, maps=None, roi_json=None):
+        """
+        Queue one query's outputs.
+
+        Parameters:
+        - query_key: filename prefix, e.g. "query_3"
+        - maps: dict of map name -> nibabel image (e.g. "z_map")
+        - roi_json: ROI payload bytes
+
+        Returns:
+        - dict of filename -> path that will be written
+        """
+        paths = {}
+        for name, img in (maps or {}).items():
+            if img is None or (self.skip_intermediate and name in INTERMEDIATE_MAPS):
+                continue
+            filename = f"{query_key}_{name}{MAP_FORMATS[self.map_format]}"
+            self._put(("map", self.output_dir / filename, name, img))
+            paths[filename] = str(self.output_dir / filename)
+        if roi_json is not None:
+            filename = f"{query_key}_roi_data.json"
+            self._put(("bytes", self.output_dir / filename, roi_json))
+            paths[filename] = str(self.output_dir / filename)
+        return paths
+
+    def submit_json(self, filename, obj):
+        """Queue a JSON document, replacing the file."""
+        self._put(("json", self.output_dir / filename, json.dumps(obj, indent=2)))
+        return str(self.output_dir / filename)
+
+    def append_json(self, filename, obj):
+        """Queue one JSON line appended to a .jsonl file (e.g. results.jsonl)."""
+        self._put(("append", self.output_dir / filename, json.dumps(obj) + "\n"))
+        return str(self.output_dir / filename)
+
+    def _put(self, job):
+        if not self._thread.is_alive():
+            raise RuntimeError("MapWriter is closed")
+        self._queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._write(job)
+            except Exception as e:
+                self.errors.append((str(job[1]), e))
+                print(f"Error writing {job[1]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, job):
+        kind, path = job[0], job[1]
+        if kind == "map":
+            name, img = job[2], job[3]
+            if self.map_format == "npy16":
+                np.save(path, np.asarray(img.dataobj, dtype=np.float16))
+                self._record_grid(name, img)
+            else:
+                nib.save(img, path)
+        elif kind == "bytes":
+            with open(path, "wb") as f:
+                f.write(job[2])
+        elif kind == "json":
+            # write-then-rename so a crash never leaves a truncated file
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(job[2])
+            tmp_path.replace(path)
+        elif kind == "append":
+            with open(path, "a") as f:
+                f.write(job[2])
+
+    def _record_grid(self, name, img):
+        grid = {"shape": list(img.shape), "affine": np.asarray(img.affine).tolist()}
+        if self._grids.get(name) != grid:
+            self._grids[name] = grid
+            with open(self.output_dir / "grids.json", "w") as f:
+                json.dump(self._grids, f, indent=2)
+
+    def flush(self):
+        """Block until every queued job is written."""
+        self._queue.join()
+
+    def close(self):
+        """Write everything still queued and stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
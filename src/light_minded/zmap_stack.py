@@ -0,0 +1,243 @@
+"""
+Memory-mapped stack of resampled z-maps.
+
+Replaying or re-scoring past queries used to mean loading every z-map and
+resampling it onto the 1 mm atlas grid again. Here each query's map is
+resampled once (with the trilinear operator of projection.py) and stored as
+one float16 row holding only the voxels labelled by at least one registry
+atlas. An index file maps normalized query -> row, and re-parcellating the
+whole stack for another atlas or threshold is a chunked sparse product over
+the memory-map instead of per-image NIfTI work.
+
+Maps are stored unthresholded, so any threshold can be applied when reading.
+Atlases on coarser grids whose voxel centres fall on the stack grid
+(e.g. the 2 mm BN atlas) read the same values they would get from their own
+projection operator.
+"""
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+import nibabel as nib
+import numpy as np
+from scipy import sparse
+
+from .atlases import DEFAULT_ATLAS, PROJECT_ROOT, get_atlas, list_atlases
+from .cache import normalize_query
+from .projection import resampling_matrix
+
+
+STACK_DIR = PROJECT_ROOT / "cache" / "zmap_stack"
+
+
+def atlas_voxels_on_grid(atlas, shape, affine):
+    """
+    Flat indices on a grid of every labelled voxel of an atlas.
+
+    Returns:
+    - (grid_index, labels): grid voxel and label of each atlas voxel
+
+    Raises ValueError when the atlas voxel centres do not fall on the grid.
+    """
+    atlas = get_atlas(atlas)
+    labels = np.asarray(atlas.labels).reshape(-1)
+    voxel_index = np.flatnonzero(labels)
+    ijk = np.column_stack(np.unravel_index(voxel_index, atlas.shape))
+    coords = nib.affines.apply_affine(np.linalg.inv(affine) @ atlas.affine, ijk)
+    grid_ijk = np.rint(coords).astype(np.int64)
+    if (np.abs(coords - grid_ijk).max() > 1e-3
+            or np.any(grid_ijk < 0) or np.any(grid_ijk >= shape)):
+        raise ValueError(f"Voxels of atlas {atlas.name!r} do not fall on the stack grid")
+    return np.ravel_multi_index(grid_ijk.T, shape), labels[voxel_index]
+
+
+class ZMapStack:
+    """
+    float16 memory-mapped stack of resampled z-maps, one row per query.
+
+    Parameters:
+    - path: stack directory (index.json, mask.npy, maps.f16, operator.npz)
+    - grid_atlas: atlas whose grid the maps are stored on (new stacks only)
+    - atlases: atlases whose labelled voxels form the stored mask (new
+      stacks only, defaults to every registry atlas that fits the grid)
+    """
+
+    def __init__(self, path=None, grid_atlas=DEFAULT_ATLAS, atlases=None):
+        self.path = Path(path) if path is not None else STACK_DIR
+        self._lock = threading.Lock()
+        self._operator = None
+        self._reducers = {}
+        self._maps = None
+        if (self.path / "index.json").exists():
+            with open(self.path / "index.json") as f:
+                self._index = json.load(f)
+            self.mask_index = np.load(self.path / "mask.npy")
+        else:
+            self._create(grid_atlas, atlases)
+        self.shape = tuple(self._index["shape"])
+        self.affine = np.asarray(self._index["affine"])
+        self.rows = {query: row for row, query in enumerate(self._index["queries"])}
+
+    def _create(self, grid_atlas, atlases):
+        grid = get_atlas(grid_atlas)
+        masks = []
+        for atlas in atlases or list_atlases():
+            try:
+                masks.append(atlas_voxels_on_grid(atlas, grid.shape, grid.affine)[0])
+            except ValueError:
+                if atlases is not None:
+                    raise
+        self.mask_index = np.unique(np.concatenate(masks)).astype(np.int32)
+        self._index = {
+            "shape": list(grid.shape),
+            "affine": grid.affine.tolist(),
+            "n_voxels": len(self.mask_index),
+            "dtype": "float16",
+            "source": None,
+            "queries": [],
+        }
+        self.path.mkdir(parents=True, exist_ok=True)
+        np.save(self.path / "mask.npy", self.mask_index)
+        open(self.path / "maps.f16", "wb").close()
+        self._write_index()
+        print(f"Created z-map stack at {self.path} ({len(self.mask_index)} voxels, "
+              f"{2 * len(self.mask_index) / 2 ** 20:.1f} MiB per map)")
+
+    def _write_index(self):
+        tmp = self.path / "index.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self.path / "index.json")
+
+    def __len__(self):
+        return len(self._index["queries"])
+
+    def __contains__(self, query):
+        return normalize_query(query) in self.rows
+
+    @property
+    def queries(self):
+        """Stored (normalized) queries in row order."""
+        return list(self._index["queries"])
+
+    @property
+    def maps(self):
+        """(n_queries, n_voxels) float16 read-only memory-map of the stored maps."""
+        if not len(self):
+            # an empty file cannot be memory-mapped
+            return np.empty((0, self._index["n_voxels"]), dtype=np.float16)
+        if self._maps is None or len(self._maps) != len(self):
+            self._maps = np.memmap(self.path / "maps.f16", dtype=np.float16, mode="r",
+                                   shape=(len(self), self._index["n_voxels"]))
+        return self._maps
+
+    def _get_operator(self, z_map):
+        source = {"shape": list(z_map.shape[:3]),
+                  "affine": np.round(z_map.affine, 6).tolist()}
+        if self._index["source"] is None:
+            self._index["source"] = source
+        elif self._index["source"] != source:
+            raise ValueError(f"z-map grid {source['shape']} does not match the stack's "
+                             f"source grid {self._index['source']['shape']}")
+        if self._operator is None:
+            path = self.path / "operator.npz"
+            if path.exists():
+                self._operator = sparse.load_npz(path)
+            else:
+                print("Building z-map stack resampling operator...")
+                start = time.perf_counter()
+                self._operator = resampling_matrix(z_map.shape, z_map.affine, self.mask_index,
+                                                   self.shape, self.affine)
+                sparse.save_npz(path, self._operator, compressed=False)
+                print(f"Operator built in {time.perf_counter() - start:.1f}s")
+        return self._operator
+
+    def add(self, query, z_map, replace=False):
+        """
+        Resample a native z-map onto the stack and append it.
+
+        Parameters:
+        - query: prompt text (stored normalized)
+        - z_map: NeuroQuery z-map image
+        - replace: overwrite the row if the query is already stored
+
+        Returns:
+        - row of the query
+        """
+        key = normalize_query(query)
+        with self._lock:
+            row = self.rows.get(key)
+            if row is not None and not replace:
+                return row
+            values = self._get_operator(z_map) @ np.asarray(
+                z_map.dataobj, dtype=np.float32).reshape(-1)
+            data = values.astype(np.float16).tobytes()
+            with open(self.path / "maps.f16", "r+b") as f:
+                if row is None:
+                    row = len(self)
+                f.seek(row * len(data))
+                f.write(data)
+            if row == len(self):
+                self._index["queries"].append(key)
+                self.rows[key] = row
+            self._write_index()
+            self._maps = None
+            return row
+
+    def get(self, query):
+        """float32 masked values of a stored query (None if missing)."""
+        row = self.rows.get(normalize_query(query))
+        return None if row is None else self.maps[row].astype(np.float32)
+
+    def _reducer(self, atlas):
+        # sparse (region <- stack voxel) indicator matrix and region sizes
+        atlas = get_atlas(atlas)
+        if atlas.name not in self._reducers:
+            grid_index, labels = atlas_voxels_on_grid(atlas, self.shape, self.affine)
+            columns = np.searchsorted(self.mask_index, grid_index)
+            columns = np.minimum(columns, len(self.mask_index) - 1)
+            if np.any(self.mask_index[columns] != grid_index):
+                raise ValueError(f"Atlas {atlas.name!r} covers voxels outside the stack mask, "
+                                 f"create the stack with it in `atlases`")
+            rois = atlas.roi_column[labels]
+            matrix = sparse.csr_matrix(
+                (np.ones(len(columns), dtype=np.float32), (rois, columns)),
+                shape=(len(atlas.region_ids), len(self.mask_index)))
+            self._reducers[atlas.name] = (atlas.region_ids, matrix,
+                                          np.bincount(rois, minlength=len(atlas.region_ids)))
+        return self._reducers[atlas.name]
+
+    def parcellate(self, atlas=None, threshold=3.1, two_sided=True, queries=None, chunk_rows=64):
+        """
+        Mean z-score per region for stored queries, like projection.parcellate.
+
+        Parameters:
+        - atlas: registry name, path or Atlas
+        - threshold: voxels below this are zeroed (None to skip)
+        - two_sided: threshold on |z| instead of z
+        - queries: subset of stored queries (defaults to all, in row order)
+        - chunk_rows: maps converted to float32 at a time
+
+        Returns:
+        - (queries, region_ids, roi_values) with roi_values shaped
+          (n_queries, n_regions)
+        """
+        region_ids, matrix, counts = self._reducer(atlas)
+        if queries is None:
+            queries = self.queries
+            rows = np.arange(len(queries))
+        else:
+            queries = [normalize_query(q) for q in queries]
+            rows = np.array([self.rows[q] for q in queries], dtype=np.int64)
+
+        maps = self.maps
+        roi_values = np.empty((len(rows), len(region_ids)), dtype=np.float32)
+        for start in range(0, len(rows), chunk_rows):
+            block = np.asarray(maps[rows[start:start + chunk_rows]], dtype=np.float32)
+            if threshold is not None:
+                below = np.abs(block) < threshold if two_sided else block < threshold
+                block[below] = 0.0
+            roi_values[start:start + len(block)] = (matrix @ block.T).T / counts
+        return queries, region_ids, roi_values
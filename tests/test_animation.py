@@ -0,0 +1,55 @@
+"""Tests for the ROI color animation engine."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from api_server.animation import Animator
+
+
+def test_crossfade():
+    animator = Animator()
+    current = np.zeros((4, 3), dtype=np.uint8)
+    target = np.full((4, 3), 200, dtype=np.uint8)
+    out = np.empty_like(current)
+    animator.start(current, target, duration=2.0, easing="linear", now=10.0)
+    assert animator.render(11.0, out) and (out == 100).all()
+    np.testing.assert_array_equal(animator.target, target)
+    assert not animator.render(12.5, out)
+    np.testing.assert_array_equal(out, target)
+
+    animator.start(current, target, duration=2.0, easing="ease_in_out", now=0.0)
+    animator.render(0.5, out)
+    assert (out < 50).all()
+    with pytest.raises(ValueError):
+        animator.start(current, target, easing="bounce")
+
+
+def test_pulse_by_z_score():
+    animator = Animator(pulse_hz=1.0, pulse_depth=0.5)
+    target = np.full((2, 3), 100, dtype=np.uint8)
+    out = np.empty_like(target)
+    animator.start(target, target, duration=0, z_scores=[0.0, 10.0], now=0.0)
+    # a quarter period in: the strongest ROI is at full swing, the other unchanged
+    assert animator.render(0.25, out)
+    assert out[:, 0].tolist() == [100, 150]
+
+
+def test_run_emits_frames_and_metrics():
+    async def run():
+        animator = Animator(fps=200)
+        buffer = np.zeros((3, 3), dtype=np.uint8)
+        frames = []
+        task = asyncio.create_task(animator.run(lambda: frames.append(buffer.copy()), lambda: buffer))
+        animator.start(buffer, np.full((3, 3), 90, dtype=np.uint8), duration=0.05, easing="linear")
+        await asyncio.sleep(0.2)
+        task.cancel()
+        return animator, frames
+
+    animator, frames = asyncio.run(run())
+    assert len(frames) > 3 and not animator.active
+    assert (frames[-1] == 90).all()
+    metrics = animator.metrics()
+    assert metrics["frames"] == len(frames)
+    assert metrics["jitter_ms"]["max"] >= 0 and metrics["cpu_ms"]["mean"] >= 0
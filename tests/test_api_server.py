@@ -0,0 +1,141 @@
+"""Endpoint tests for the API server (no model loaded)."""
+
+import asyncio
+import importlib
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from api_server.frames import FULL, decode_frame
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # the app mounts web/webgl_output relative to the working directory
+    root = tmp_path_factory.mktemp("server")
+    (root / "web" / "webgl_output").mkdir(parents=True)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(root)
+        mp.setenv("LIGHT_MINDED_LOAD_MODEL", "0")
+        main = importlib.import_module("api_server.main")
+        with TestClient(main.app) as test_client:
+            yield test_client
+
+
+def colors(n, value):
+    return {"data": [{"id": i, "r": value, "g": 0, "b": 255 - value} for i in range(1, n + 1)]}
+
+
+def test_websocket_frames(client):
+    client.post("/set", json=colors(246, 10))
+    with client.websocket_connect("/ws") as websocket:
+        assert len(websocket.receive_json()["ids"]) == 246
+        frame = websocket.receive_bytes()
+        assert len(frame) < 1024
+        frame_type, _, _, rgb = decode_frame(frame)
+        assert frame_type == FULL and rgb[0].tolist() == [10, 0, 245]
+
+        update = colors(246, 10)
+        update["data"][3]["r"] = 200
+        client.post("/set", json=update)
+        _, _, ids, rgb = decode_frame(websocket.receive_bytes())
+        assert ids.tolist() == [4] and rgb.tolist() == [[200, 0, 245]]
+
+
+def test_packed_set(client):
+    import api_server.main as main
+
+    roi_ids = main.atlas_ids()
+    n = len(roi_ids)
+    rgb = np.arange(3 * n, dtype=np.int64) % 256
+    response = client.post("/set/packed", content=rgb.astype(np.uint8).tobytes(),
+                           headers={"content-type": "application/octet-stream"})
+    assert response.status_code == 200
+    data = client.get("/get").json()["data"]
+    assert [d["id"] for d in data] == roi_ids.tolist()
+    assert [data[1]["r"], data[1]["g"], data[1]["b"]] == rgb[3:6].tolist()
+    state = main.gRgb
+
+    # partial JSON update lands in the same preallocated array
+    response = client.post("/set/packed", json={"ids": [int(roi_ids[2])], "rgb": [1, 2, 3]})
+    assert response.status_code == 200
+    assert main.gRgb is state and main.gRgb[2].tolist() == [1, 2, 3]
+    assert client.post("/set/packed", json=rgb.tolist()).status_code == 200
+
+
+@pytest.mark.parametrize("payload", [
+    [0, 0],                                 # not a multiple of 3 / wrong ROI count
+    {"ids": [1], "rgb": [0, 0, 256]},       # out of range
+    {"ids": [1], "rgb": [0.5, 0, 0]},       # not integers
+    {"ids": [9999], "rgb": [0, 0, 0]},      # unknown ROI
+    {"ids": [1, 2], "rgb": [0, 0, 0]},      # ids/colors mismatch
+])
+def test_packed_set_rejects(client, payload):
+    assert client.post("/set/packed", json=payload).status_code == 422
+
+
+def test_transition(client):
+    client.post("/set", json=colors(5, 0))
+    client.post("/set?transition=0.1&easing=linear", json=colors(5, 200))
+    time.sleep(0.4)
+    assert client.get("/get").json()["data"][0]["r"] == 200
+    metrics = client.get("/stats/animation").json()
+    assert metrics["frames"] > 0 and not metrics["active"]
+    assert client.post("/set?easing=bounce", json=colors(5, 0)).status_code == 422
+
+
+def fake_pipeline(calls, delay=0.0):
+    def pipeline(query, atlas=None, threshold=3.1, query_cache=None):
+        calls.append(query)
+        time.sleep(delay)
+        return {"roi_id": np.array([3, 1, 2]), "z_score": np.array([4.0, -4.0, 0.0]),
+                "rgb": np.array([[200, 0, 0], [0, 0, 200], [128, 128, 128]], dtype=np.uint8),
+                "cached": False}
+    return pipeline
+
+
+def test_query_runner_single_flight():
+    from api_server.queries import QueryRunner
+
+    calls = []
+    runner = QueryRunner(max_workers=4, pipeline=fake_pipeline(calls, delay=0.1))
+
+    async def run():
+        return await asyncio.gather(runner.submit("Memory"), runner.submit(" memory "),
+                                    runner.submit("vision"))
+
+    results = asyncio.run(run())
+    runner.close()
+    assert sorted(calls) == ["Memory", "vision"]
+    assert [shared for _, shared in results] == [False, True, False]
+    assert runner.stats() == {"runs": 2, "shared": 1, "errors": 0, "in_flight": 0}
+
+
+def test_query_endpoint(client, monkeypatch):
+    import api_server.main as main
+
+    calls = []
+    monkeypatch.setattr(main.query_runner, "_pipeline", fake_pipeline(calls))
+    response = client.post("/query", json={"query": "memory"})
+    assert response.status_code == 200
+    assert response.json()["roi_id"] == [3, 1, 2]
+    # published in ROI id order
+    data = client.get("/get").json()["data"]
+    assert [(d["id"], d["r"], d["b"]) for d in data] == [(1, 0, 200), (2, 128, 128), (3, 200, 0)]
+    assert client.post("/query", json={"query": "  "}).status_code == 422
+
+
+def test_get_not_modified(client):
+    client.post("/set", json=colors(3, 50))
+    response = client.get("/get")
+    etag, version = response.headers["etag"], int(response.headers["x-state-version"])
+    assert client.get("/get", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/get?since={version}").status_code == 304
+
+    client.post("/set", json=colors(3, 60))
+    response = client.get("/get", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert response.json()["data"][0]["r"] == 60
+    assert client.get(f"/get?since={version}").status_code == 200
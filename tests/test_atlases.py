@@ -0,0 +1,38 @@
+"""Tests for the atlas registry."""
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from light_minded import atlases
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(atlases, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(atlases, "_atlases", {})
+    return tmp_path
+
+
+@pytest.mark.parametrize("name", atlases.list_atlases())
+def test_registry_matches_nifti(name):
+    atlas = atlases.get_atlas(name)
+    data = nib.load(str(atlases.resolve_atlas_path(name))).get_fdata()
+    region_ids, counts = np.unique(data[data != 0], return_counts=True)
+
+    assert isinstance(atlas.labels, np.memmap)
+    np.testing.assert_array_equal(atlas.region_ids, region_ids)
+    np.testing.assert_array_equal(atlas.label_counts, counts)
+
+
+def test_atlas_loaded_once(cache_dir):
+    first = atlases.get_atlas()
+    assert first.name == atlases.DEFAULT_ATLAS
+    assert atlases.get_atlas("bna_218") is first
+    assert atlases.get_atlas(first.path) is first
+    assert len(list(cache_dir.glob("*.npy"))) == 1
+
+
+def test_missing_atlas():
+    with pytest.raises(FileNotFoundError):
+        atlases.get_atlas("no_such_atlas.nii.gz")
@@ -0,0 +1,33 @@
+"""Tests for the batch query mode."""
+
+import json
+
+import nibabel as nib
+import numpy as np
+import orjson
+
+from light_minded import batch, encoder, projection
+
+
+def fake_encode_query(prompt):
+    rng = np.random.default_rng(len(prompt))
+    affine = np.array([[-4., 0, 0, 90], [0, 4, 0, -126], [0, 0, 4, -72], [0, 0, 0, 1]])
+    data = rng.normal(scale=4, size=(46, 55, 46)).astype(np.float32)
+    return {"z_map": nib.Nifti1Image(data, affine)}
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(encoder, "load_encoder", lambda warm_up=True: None)
+    monkeypatch.setattr(encoder, "encode_query", fake_encode_query)
+    monkeypatch.setattr(projection, "CACHE_DIR", tmp_path / "projection")
+    prompts_file = tmp_path / "prompts.txt"
+    prompts_file.write_text("# show one\nhappy\n\nanxious\ntired today\nsleepy\ncalm\n")
+
+    prompts = batch.read_prompts(prompts_file)
+    manifest = batch.run_batch(prompts, tmp_path / "out", n_jobs=2, atlas="bna_246_3mm")
+
+    assert [entry["query"] for entry in manifest] == prompts
+    saved = json.loads((tmp_path / "out" / "batch.json").read_text())
+    assert saved[2]["file"] == "0002_tired_today_roi_data.json"
+    payload = orjson.loads((tmp_path / "out" / saved[2]["file"]).read_bytes())
+    assert len(payload["data"]) == 246
@@ -0,0 +1,66 @@
+"""Tests for the query result cache."""
+
+import numpy as np
+
+from light_minded.cache import QueryCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  Happy!  ") == "happy"
+    assert normalize_query("so   TIRED, today") == "so tired today"
+
+
+def test_hit_miss_and_disk(tmp_path):
+    cache = QueryCache(cache_dir=tmp_path)
+    assert cache.get("happy", "bna_218", 3.1) is None
+
+    cache.put("happy", "bna_218", 3.1, [1, 2, 3], [0.5, -1.0, 2.0])
+    entry = cache.get("Happy!", "bna_218", 3.1)
+    np.testing.assert_array_equal(entry["roi_id"], [1, 2, 3])
+    assert cache.get("happy", "bna_218", 2.3) is None
+
+    # a fresh process only has the disk copy
+    reloaded = QueryCache(cache_dir=tmp_path)
+    assert reloaded.get("happy", "bna_218", 3.1) is not None
+    assert reloaded.stats()["disk_hits"] == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_size_based_eviction(tmp_path):
+    cache = QueryCache(cache_dir=tmp_path, max_disk_bytes=4000)
+    for i in range(20):
+        cache.put(f"feeling {i}", "bna_218", 3.1, np.arange(218), np.zeros(218))
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 4000
+    assert stats["evictions"] > 0
+    assert cache.get("feeling 19", "bna_218", 3.1) is not None
+
+
+def test_statistic_in_key(tmp_path):
+    cache = QueryCache(cache_dir=tmp_path)
+    cache.put("happy", "bna_218", 3.1, [1, 2], [0.5, -1.0])
+    assert cache.get("happy", "bna_218", 3.1, statistic="max_abs") is None
+    cache.put("happy", "bna_218", 3.1, [1, 2], [4.0, 3.5], statistic="max_abs")
+    np.testing.assert_allclose(cache.get("happy", "bna_218", 3.1)["z_score"], [0.5, -1.0])
+    np.testing.assert_allclose(
+        cache.get("happy", "bna_218", 3.1, statistic="max_abs")["z_score"], [4.0, 3.5])
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = QueryCache(cache_dir=tmp_path)
+    cache.put("happy", "bna_218", 3.1, [1, 2], [0.5, -1.0])
+    assert [p.suffix for p in tmp_path.iterdir()] == [".npz"]
+
+    # a writer that crashed mid-file under the old in-place scheme
+    path = next(tmp_path.glob("*.npz"))
+    path.write_bytes(path.read_bytes()[:40])
+    reloaded = QueryCache(cache_dir=tmp_path)
+    assert reloaded.get("happy", "bna_218", 3.1) is None
+    assert not path.exists()
+
+    # evicted by another process after the entry was looked up
+    cache.put("sad", "bna_218", 3.1, [1, 2], [0.5, -1.0])
+    for p in tmp_path.glob("*.npz"):
+        p.unlink()
+    assert QueryCache(cache_dir=tmp_path).get("sad", "bna_218", 3.1) is None
@@ -0,0 +1,40 @@
+"""Tests for the vectorized ROI color mapping."""
+
+import numpy as np
+import orjson
+import pandas as pd
+import pytest
+
+from light_minded.colors import values_to_rgb8, roi_payload
+from light_minded.light_minded import map_to_colors, prepare_roi_json
+
+
+@pytest.mark.parametrize("cmap_name, vmin, vmax", [
+    ("RdBu_r", -5, 5),
+    ("Spectral", None, None),
+])
+def test_lut_matches_scalar_mappable(cmap_name, vmin, vmax):
+    values = np.random.default_rng(0).normal(scale=4, size=368)
+    expected = np.rint(map_to_colors(values, cmap_name, vmin, vmax) * 255)
+    np.testing.assert_array_equal(values_to_rgb8(values, cmap_name, vmin, vmax), expected)
+
+
+def test_roi_payload():
+    rgb = values_to_rgb8(np.array([-5.0, 0.0, 5.0]), vmin=-5, vmax=5)
+    payload = orjson.loads(roi_payload(np.array([1, 2, 3]), rgb))
+    assert [entry["roi_id"] for entry in payload["data"]] == [1, 2, 3]
+    channels = [[entry["r"], entry["g"], entry["b"]] for entry in payload["data"]]
+    np.testing.assert_allclose(np.array(channels) * 255, rgb)
+
+    # same schema as the per-row prepare_roi_json path
+    roi_df = pd.DataFrame({"roi_id": [1, 2, 3], "z_score": [-5.0, 0.0, 5.0]})
+    expected = prepare_roi_json(roi_df, map_to_colors(roi_df["z_score"].values, "RdBu_r", -5, 5))
+    assert [list(entry) for entry in payload["data"]] == [list(entry) for entry in expected["data"]]
+
+
+@pytest.mark.parametrize("roi_ids", [np.arange(1, 247), np.array([7, 300, 5]), np.array([70000, 1]), np.array([], int)])
+def test_roi_payload_bytes_match_entry_dicts(roi_ids):
+    rgb = np.random.default_rng(1).integers(0, 256, size=(len(roi_ids), 3), dtype=np.uint8)
+    entries = [{"roi_id": int(i), "r": r / 255, "g": g / 255, "b": b / 255}
+               for i, (r, g, b) in zip(roi_ids, rgb.tolist())]
+    assert roi_payload(roi_ids, rgb) == orjson.dumps({"data": entries})
@@ -0,0 +1,39 @@
+"""Tests for the shared NeuroQuery encoder."""
+
+import pytest
+
+from light_minded import encoder
+
+
+class FakeModel:
+    loads = 0
+
+    @classmethod
+    def from_data_dir(cls, model_dir):
+        cls.loads += 1
+        return cls()
+
+    def __call__(self, query):
+        return {"query": query}
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    FakeModel.loads = 0
+    monkeypatch.setattr(encoder, "NeuroQueryModel", FakeModel)
+    monkeypatch.setattr(encoder, "fetch_neuroquery_model", lambda: "model_dir")
+    monkeypatch.setattr(encoder, "_encoder", None)
+    monkeypatch.setitem(encoder._stats, "load_count", 0)
+    monkeypatch.setitem(encoder._stats, "query_seconds", [])
+    return FakeModel
+
+
+def test_model_loaded_once(fake_model):
+    encoder.load_encoder(warm_up=True)
+    for query in ["happy", "anxious", "tired"]:
+        assert encoder.encode_query(query) == {"query": query}
+
+    report = encoder.latency_report()
+    assert fake_model.loads == 1
+    assert report["load_count"] == 1
+    assert report["query_count"] == 3
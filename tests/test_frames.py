@@ -0,0 +1,38 @@
+"""Tests for the binary WebSocket color frames."""
+
+import numpy as np
+
+from api_server.frames import DELTA, FULL, FrameEncoder, decode_frame
+
+
+def test_full_then_delta():
+    ids = np.arange(1, 247)
+    rgb = np.random.default_rng(0).integers(0, 256, size=(246, 3)).astype(np.uint8)
+    frame_encoder = FrameEncoder()
+
+    ids_message, frame = frame_encoder.encode(1, ids, rgb)
+    assert ids_message == {"type": "roi_ids", "ids": ids.tolist()}
+    assert len(frame) < 1024
+    frame_type, version, _, decoded = decode_frame(frame)
+    assert (frame_type, version) == (FULL, 1)
+    np.testing.assert_array_equal(decoded, rgb)
+
+    rgb = rgb.copy()
+    rgb[[4, 100]] = [255, 0, 0]
+    (frame,) = frame_encoder.encode(2, ids, rgb)
+    frame_type, version, changed_ids, decoded = decode_frame(frame)
+    assert (frame_type, version) == (DELTA, 2)
+    np.testing.assert_array_equal(changed_ids, [5, 101])
+    np.testing.assert_array_equal(decoded, [[255, 0, 0]] * 2)
+
+    # everything changed: a full frame is smaller than the delta
+    (frame,) = frame_encoder.encode(3, ids, 255 - rgb)
+    assert decode_frame(frame)[0] == FULL
+
+
+def test_new_roi_set_resends_ids():
+    frame_encoder = FrameEncoder()
+    frame_encoder.encode(1, [1, 2], np.zeros((2, 3)))
+    messages = frame_encoder.encode(2, [1, 2, 3], np.zeros((3, 3)))
+    assert messages[0]["ids"] == [1, 2, 3]
+    assert decode_frame(messages[1])[0] == FULL
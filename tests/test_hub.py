@@ -0,0 +1,43 @@
+"""Tests for the SSE broadcast hub."""
+
+import asyncio
+
+from api_server.hub import HEARTBEAT, BroadcastHub, format_sse
+
+
+def test_format_sse():
+    assert format_sse("x") == "data: x\n\n"
+    assert format_sse("a\nb", event="colors", event_id=3) == "id: 3\nevent: colors\ndata: a\ndata: b\n\n"
+
+
+def test_fan_out_and_latest_wins():
+    async def run():
+        hub = BroadcastHub(max_queue=2)
+        fast, slow = hub.subscribe(), hub.subscribe()
+        for i in range(5):
+            assert hub.publish(i) == 2
+            assert await fast.get() == format_sse(i)
+        # the slow client only keeps the two latest updates
+        assert [slow.get_nowait() for _ in range(slow.qsize())] == [format_sse(3), format_sse(4)]
+        assert hub.stats() == {"clients": 2, "published": 5, "dropped": 3}
+        hub.unsubscribe(slow)
+        assert hub.publish(5) == 1
+
+    asyncio.run(run())
+
+
+def test_stream_initial_heartbeat_and_unsubscribe():
+    async def run():
+        hub = BroadcastHub()
+        stream = hub.stream(hub.subscribe(), initial="initial", heartbeat=0.01)
+        # published after subscribing but before the stream is iterated
+        hub.publish("early")
+        assert await stream.__anext__() == "initial"
+        assert await stream.__anext__() == format_sse("early")
+        assert await stream.__anext__() == HEARTBEAT
+        hub.publish("update")
+        assert await stream.__anext__() == format_sse("update")
+        await stream.aclose()
+        assert hub.stats()["clients"] == 0
+
+    asyncio.run(run())
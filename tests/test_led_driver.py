@@ -0,0 +1,76 @@
+"""Tests for the LED output driver."""
+
+import time
+
+import numpy as np
+import pytest
+
+from led_driver import (ArtNetTransport, FrameScheduler, LedMap, SacnTransport, UdpReceiver,
+                        parse_packet)
+from led_driver.transports import UdpTransport
+
+
+def test_pack_color_order_and_gamma():
+    regions = [{"roi_id": 7, "universe": 0, "start": 0, "count": 2},
+               {"roi_id": 3, "universe": 1, "start": 5, "count": 1}]
+    led_map = LedMap(regions, color_order="GRB")
+    rgb = np.array([[10, 20, 30], [40, 50, 60]], dtype=np.uint8)  # ROI 3, ROI 7
+    buffer = led_map.pack(rgb)
+    assert buffer.shape == (2, 512)
+    assert buffer[0, :6].tolist() == [50, 40, 60, 50, 40, 60]
+    assert buffer[1, 15:18].tolist() == [20, 10, 30]
+
+    dimmed = LedMap(regions, gamma=2.0, brightness=0.5)
+    assert dimmed.pack(np.full((2, 3), 255, dtype=np.uint8))[0, 0] == 128
+    with pytest.raises(ValueError):
+        LedMap(regions + [{"roi_id": 8, "universe": 0, "start": 1, "count": 1}])
+
+
+def test_align_any_roi_set():
+    led_map = LedMap.sequential([1, 2, 3], leds_per_roi=4)
+    aligned = led_map.align([3, 9, 1], [[3, 3, 3], [9, 9, 9], [1, 1, 1]])
+    assert aligned[:, 0].tolist() == [1, 0, 3]
+
+
+@pytest.mark.parametrize("transport_class", [ArtNetTransport, SacnTransport])
+def test_udp_round_trip(transport_class):
+    led_map = LedMap.sequential(np.arange(1, 40), leds_per_roi=10)
+    assert led_map.n_universes == 3
+    frame = np.random.default_rng(0).integers(0, 256, size=(39, 3)).astype(np.uint8)
+    with UdpReceiver() as receiver:
+        transport = transport_class(host="127.0.0.1", port=receiver.port,
+                                    n_universes=led_map.n_universes,
+                                    universe_size=led_map.universe_size)
+        transport.send(led_map.pack(frame))
+        transport.send(led_map.pack(frame))
+        deadline = time.time() + 2
+        while receiver.packets < 6 and time.time() < deadline:
+            time.sleep(0.01)
+        transport.close()
+    assert receiver.packets == 6 and receiver.lost == 0
+    first = min(receiver.last_data)
+    assert receiver.last_data[first][:30] == led_map.buffer[0, :30].tobytes()
+    assert parse_packet(b"not a dmx packet") is None
+
+
+def test_udp_transport_hooks_are_abstract():
+    class NoSequence(UdpTransport):
+        def _packet(self, universe):
+            return bytearray(512)
+
+    with pytest.raises(TypeError):
+        NoSequence("127.0.0.1", 6454, 1)
+
+
+def test_scheduler_drops_superseded_frames():
+    led_map = LedMap.sequential([1, 2], leds_per_roi=1)
+    with UdpReceiver() as receiver:
+        transport = ArtNetTransport(port=receiver.port, universe_size=led_map.universe_size)
+        with FrameScheduler(led_map, transport, fps=50) as scheduler:
+            for value in range(100):
+                scheduler.submit([1, 2], np.full((2, 3), value, dtype=np.uint8))
+            time.sleep(0.2)
+        metrics = scheduler.metrics()
+    assert metrics["frames_dropped"] > 0
+    assert metrics["frames_sent"] + metrics["frames_dropped"] >= 100
+    assert receiver.last_data[0][:6] == bytes([99] * 6)
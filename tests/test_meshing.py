@@ -0,0 +1,43 @@
+"""Tests for the bounding-box marching-cubes helpers of the mesh scripts."""
+
+from pathlib import Path
+import sys
+
+import numpy as np
+import pytest
+from skimage import measure
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+from meshing import mesh_labels  # noqa: E402
+
+
+@pytest.fixture
+def labels():
+    labels = np.zeros((20, 18, 16), dtype=np.int16)
+    labels[2:9, 3:10, 4:12] = 1
+    labels[11:19, 1:6, 0:5] = 2  # touches the volume border
+    labels[5:7, 12:17, 9:15] = 3
+    return labels
+
+
+def test_cropped_meshes_match_full_volume(labels):
+    for label_id, meshes, error in mesh_labels(labels, n_jobs=1):
+        assert error is None
+        verts, faces, normals = meshes[0]
+        full_verts, full_faces, _, _ = measure.marching_cubes(
+            (labels == label_id).astype(np.uint8), 0)
+        np.testing.assert_array_equal(verts, full_verts)
+        np.testing.assert_array_equal(faces, full_faces)
+
+
+def test_unknown_labels_rejected_up_front(labels):
+    with pytest.raises(ValueError, match=r"\[7\]"):
+        mesh_labels(labels, [1, 7], n_jobs=1)
+
+
+def test_crop_can_be_disabled(labels):
+    cropped = list(mesh_labels(labels, [2, 3], n_jobs=1))
+    full = list(mesh_labels(labels, [2, 3], n_jobs=1, crop=False))
+    for (label_id, meshes, _), (full_id, full_meshes, _) in zip(cropped, full):
+        assert label_id == full_id
+        np.testing.assert_array_equal(meshes[0][0], full_meshes[0][0])
@@ -0,0 +1,30 @@
+"""Regression tests for ROI-id alignment of the parcellation."""
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from light_minded.atlases import get_atlas
+from light_minded.light_minded import parcellate_map
+
+
+@pytest.mark.parametrize("name", ["bna_218", "shen_368"])
+def test_values_follow_label_ids(name):
+    atlas = get_atlas(name)
+    labels = np.asarray(atlas.labels)
+    # every region holds its own id, except a few emptied by thresholding
+    dropped = atlas.region_ids[::7]
+    data = np.where(np.isin(labels, dropped), 0, labels).astype(np.float32)
+    z_map_thresh = nib.Nifti1Image(data, atlas.affine)
+
+    roi_df = parcellate_map(z_map_thresh, atlas, statistics=[])
+    assert len(roi_df) == atlas.n_regions
+    np.testing.assert_array_equal(roi_df["roi_id"], atlas.region_ids)
+
+    values = atlas.label_array(roi_df["z_score"])
+    assert len(values) == atlas.region_ids.max() + 1
+    kept = np.setdiff1d(atlas.region_ids, dropped)
+    np.testing.assert_allclose(values[kept], kept)
+    np.testing.assert_array_equal(values[dropped], 0)
+    assert np.isnan(values[0])
+    np.testing.assert_array_equal(atlas.region_ids[atlas.roi_column[kept]], kept)
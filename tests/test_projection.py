@@ -0,0 +1,75 @@
+"""Tests for the precomputed atlas projection operator."""
+
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from light_minded import projection
+
+ATLAS_DIR = Path(__file__).parent.parent / "atlases" / "mni"
+
+
+@pytest.fixture
+def z_map():
+    # smooth random map on a 4mm grid, similar to NeuroQuery's output
+    affine = np.array([[-4., 0, 0, 90], [0, 4, 0, -126], [0, 0, 4, -72], [0, 0, 0, 1]])
+    rng = np.random.default_rng(0)
+    data = gaussian_filter(rng.normal(size=(46, 55, 46)), 2) * 40
+    return nib.Nifti1Image(data.astype(np.float32), affine)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(projection, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(projection, "_operators", {})
+    return tmp_path
+
+
+def test_projection_matches_img_mod(z_map):
+    report = projection.compare_with_img_mod(z_map)
+    # trilinear vs spline interpolation: thresholded ROI means stay within
+    # a quarter z of the resample path, a twentieth of a z on average
+    assert report["max_abs_diff"] < 0.25
+    assert report["mean_abs_diff"] < 0.06
+
+
+def test_projection_cached_on_disk(z_map, cache_dir):
+    atlas_path = ATLAS_DIR / "bna" / "BN_Atlas_246_3mm.nii.gz"
+    built = projection.get_projection(z_map, atlas_path)
+    assert len(list(cache_dir.glob("*.npz"))) == 1
+
+    projection._operators.clear()
+    loaded = projection.get_projection(z_map, atlas_path)
+    np.testing.assert_array_equal(loaded.region_ids, built.region_ids)
+    np.testing.assert_allclose(loaded.parcellate(z_map)[1], built.parcellate(z_map)[1])
+
+
+def test_concurrent_cold_builds_once(z_map, cache_dir, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    builds = []
+    build = projection.build_projection
+
+    def counting_build(*args, **kwargs):
+        builds.append(1)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(projection, "build_projection", counting_build)
+    atlas_path = ATLAS_DIR / "bna" / "BN_Atlas_246_3mm.nii.gz"
+    with ThreadPoolExecutor(4) as pool:
+        operators = list(pool.map(lambda _: projection.get_projection(z_map, atlas_path), range(4)))
+    assert len(builds) == 1
+    assert all(operator is operators[0] for operator in operators)
+    assert [p.suffix for p in cache_dir.iterdir()] == [".npz"]
+
+
+def test_img_mod_indexes_values_by_label(z_map):
+    from light_minded.light_minded import img_mod
+
+    result = img_mod(z_map, atlas_path=ATLAS_DIR / "bna" / "BN_Atlas_246_3mm.nii.gz")
+    values = result["roi_values"]
+    np.testing.assert_array_equal(values[result["roi_id"]], result["z_score"])
+    assert np.isnan(values[0]) and "roi_df" not in result
@@ -0,0 +1,47 @@
+"""Tests for the grouped ROI statistics."""
+
+import nibabel as nib
+import numpy as np
+from nilearn.maskers import NiftiLabelsMasker
+
+from light_minded.atlases import get_atlas
+from light_minded.light_minded import parcellate_map
+from light_minded.roi_stats import RegionGroups, roi_statistics
+
+
+def test_statistics_match_numpy():
+    rng = np.random.default_rng(0)
+    voxel_roi = rng.integers(0, 5, size=500)
+    values = rng.normal(scale=3, size=500).astype(np.float32)
+    stats = roi_statistics(RegionGroups(voxel_roi, 6), values, thresholds=[0.0, 2.5], percentile=90)
+
+    for row, threshold in enumerate([0.0, 2.5]):
+        thresholded = np.where(np.abs(values) >= threshold, values, 0)
+        for roi in range(5):
+            region = thresholded[voxel_roi == roi]
+            active = region[region != 0]
+            assert np.isclose(stats["mean"][row, roi], region.mean())
+            assert np.isclose(stats["mean_active"][row, roi], active.mean() if len(active) else 0)
+            assert np.isclose(stats["max_abs"][row, roi], np.abs(region).max())
+            assert np.isclose(stats["percentile"][row, roi], np.percentile(np.abs(region), 90))
+            assert np.isclose(stats["fraction_active"][row, roi], len(active) / len(region))
+    # region without voxels
+    assert (stats["mean"][:, 5] == 0).all() and (stats["percentile"][:, 5] == 0).all()
+
+
+def test_parcellate_map_matches_masker():
+    atlas = get_atlas("bna_246_3mm")
+    rng = np.random.default_rng(1)
+    data = rng.normal(scale=3, size=atlas.shape).astype(np.float32)
+    data[np.abs(data) < 3.1] = 0
+    z_map_thresh = nib.Nifti1Image(data, atlas.affine)
+
+    roi_df = parcellate_map(z_map_thresh, atlas)
+    expected = NiftiLabelsMasker(labels_img=atlas.img).fit_transform(z_map_thresh)[0]
+    np.testing.assert_allclose(roi_df["z_score"], expected, rtol=1e-5, atol=1e-6)
+    np.testing.assert_array_equal(roi_df["roi_id"], atlas.region_ids)
+    assert {"mean_active", "max_abs", "percentile", "fraction_active"} <= set(roi_df.columns)
+
+    peak = parcellate_map(z_map_thresh, atlas, statistic="max_abs", statistics=[])
+    assert list(peak.columns) == ["roi_id", "z_score", "abs_z_score", "max_abs"]
+    assert (peak["z_score"] >= np.abs(roi_df["z_score"])).all()
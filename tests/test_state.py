@@ -0,0 +1,28 @@
+"""Tests for the immutable color snapshots."""
+
+import json
+
+import numpy as np
+import pytest
+
+from api_server.state import Snapshot
+
+
+def test_snapshot_is_an_immutable_copy():
+    rgb = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8)
+    snapshot = Snapshot(7, [1, 2], rgb)
+    rgb[0] = 0
+    assert snapshot.rgb[0].tolist() == [1, 2, 3]
+    with pytest.raises(ValueError):
+        snapshot.rgb[0] = 0
+    assert json.loads(snapshot.json())["data"][1] == {"id": 2, "r": 4, "g": 5, "b": 6}
+    assert json.loads(Snapshot(0, [], np.zeros((0, 3))).json()) is None
+
+
+def test_matches_if_none_match():
+    snapshot = Snapshot(3, [1], [[0, 0, 0]])
+    assert snapshot.matches(snapshot.etag)
+    assert snapshot.matches(f'"other", W/{snapshot.etag}')
+    assert snapshot.matches("*")
+    assert not snapshot.matches(None)
+    assert not snapshot.matches(Snapshot(4, [1], [[0, 0, 0]]).etag)
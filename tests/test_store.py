@@ -0,0 +1,55 @@
+"""Tests for the SQLite session store."""
+
+import numpy as np
+import pandas as pd
+
+from light_minded.store import SessionStore
+
+
+def test_store_and_replay(tmp_path):
+    similar_words = pd.DataFrame(
+        {"similarity": [0.9, 0.5], "weight_in_brain_map": [1.2, 0.0],
+         "weight_in_query": [1.0, 0.0], "n_documents": [120, 40]},
+        index=["happy", "reward"])
+    rgb = np.arange(9, dtype=np.uint8).reshape(3, 3)
+
+    with SessionStore(tmp_path / "db.sqlite", batch_size=2) as store:
+        assert store.add_query("Happy!", [1, 2, 3], [0.5, -1.0, 2.0], rgb=rgb,
+                               similar_words=similar_words) is None
+        store.add_query("happy", [1, 2, 3], [0.0, 0.0, 1.0])
+        store.add_query("tired", [1, 2, 3], [1.0, 1.0, 1.0])
+        first, = store._conn.execute("SELECT MIN(id) FROM queries").fetchone()
+
+    store = SessionStore(tmp_path / "db.sqlite")
+    state = store.get_state(first)
+    np.testing.assert_array_equal(state["region_ids"], [1, 2, 3])
+    np.testing.assert_allclose(state["z_scores"], [0.5, -1.0, 2.0])
+    np.testing.assert_array_equal(state["rgb"], rgb)
+
+    assert store.top_queries(1) == [("happy", 2)]
+    ids, z_scores = store.roi_matrix()
+    assert z_scores.shape == (3, 3)
+    terms = store._conn.execute(
+        "SELECT term FROM similar_words WHERE query_id = ? ORDER BY rank", (first,)).fetchall()
+    assert terms == [("happy",), ("reward",)]
+    store.add_query("calm", [1], [0.0])
+    assert store.flush() == [4]
+    store.close()
+
+
+def test_two_writers_share_a_database(tmp_path):
+    # two processes' stores opened on the same file, writing interleaved batches
+    a = SessionStore(tmp_path / "db.sqlite", batch_size=2, session="a")
+    b = SessionStore(tmp_path / "db.sqlite", batch_size=1, session="b")
+    a.add_query("happy", [1, 2], [1.0, 2.0])
+    b_id = b.add_query("sad", [1, 2], [-1.0, -2.0])
+    a_id = a.add_query("calm", [1, 2], [0.5, 0.5])
+    a.close()
+    b.close()
+
+    store = SessionStore(tmp_path / "db.sqlite")
+    ids = [row[0] for row in store._conn.execute("SELECT id FROM queries ORDER BY id")]
+    assert ids == [1, 2, 3] and b_id == 1 and a_id == 3
+    np.testing.assert_allclose(store.get_state(b_id)["z_scores"], [-1.0, -2.0])
+    np.testing.assert_allclose(store.get_state(a_id)["z_scores"], [0.5, 0.5])
+    store.close()
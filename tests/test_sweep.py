@@ -0,0 +1,52 @@
+"""Tests for the threshold/atlas/statistic sweep."""
+
+import nibabel as nib
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from light_minded import projection
+from light_minded.roi_stats import RegionGroups, roi_statistics
+from light_minded.sweep import compare, sweep
+
+
+@pytest.fixture
+def z_map():
+    affine = np.array([[-4., 0, 0, 90], [0, 4, 0, -126], [0, 0, 4, -72], [0, 0, 0, 1]])
+    rng = np.random.default_rng(0)
+    data = gaussian_filter(rng.normal(size=(46, 55, 46)), 2) * 40
+    return nib.Nifti1Image(data.astype(np.float32), affine)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(projection, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(projection, "_operators", {})
+
+
+def test_grouped_statistics():
+    groups = RegionGroups([1, 0, 1, 2, 1], 4)
+    stats = roi_statistics(groups, [5.0, -1.0, 2.0, -4.0, 0.5], thresholds=[0.0, 3.0])
+    np.testing.assert_allclose(stats["mean"], [[-1, 2.5, -4, 0], [0, 5 / 3, -4, 0]])
+    np.testing.assert_allclose(stats["max"], [[-1, 5, -4, 0], [0, 5, -4, 0]])
+    np.testing.assert_allclose(stats["fraction_active"], [[1, 1, 1, 0], [0, 1 / 3, 1, 0]])
+    with pytest.raises(ValueError):
+        roi_statistics(groups, np.zeros(5), statistics=["median"])
+
+
+def test_sweep_matches_parcellate(z_map):
+    table = sweep(z_map, thresholds=[2.3, 3.1], atlases=["bna_246_3mm", "bna_246_2mm"],
+                  statistics=["mean", "max", "fraction_active"])
+    assert len(table) == 2 * 246 * 2 * 3
+
+    operator = projection.get_projection(z_map, "bna_246_2mm")
+    for threshold in (2.3, 3.1):
+        rows = table[(table.atlas == "bna_246_2mm") & (table.threshold == threshold)
+                     & (table.statistic == "mean")]
+        np.testing.assert_array_equal(rows.roi_id, operator.region_ids)
+        np.testing.assert_allclose(rows.value, operator.parcellate(z_map, threshold)[1],
+                                   rtol=1e-5, atol=1e-6)
+
+    summary = compare(table)
+    assert len(summary) == 2 * 2 * 3
+    assert (summary.n_rois == 246).all()
@@ -0,0 +1,20 @@
+"""Tests for the shared fixed-rate tick schedule."""
+
+from light_minded.ticks import TickClock, timing_summary
+
+
+def test_overrun_ticks_are_skipped():
+    now = [0.0]
+    ticks = TickClock(fps=10, clock=lambda: now[0])
+    now[0] = 0.05
+    assert abs(ticks.advance() - 0.05) < 1e-9
+    # a slow frame overran the ticks at 0.2 and 0.3: they are skipped and
+    # the one at 0.4 runs right away
+    now[0] = 0.45
+    assert ticks.advance() == 0 and ticks.missed == 2
+    assert abs(ticks.advance() - 0.05) < 1e-9 and ticks.missed == 2
+
+
+def test_timing_summary():
+    assert timing_summary([]) is None
+    assert timing_summary([0.001, 0.003]) == {"mean": 2.0, "p95": 2.9, "max": 3.0}
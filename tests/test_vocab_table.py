@@ -0,0 +1,50 @@
+"""Tests for the precomputed vocabulary-to-ROI table."""
+
+from types import SimpleNamespace
+
+import nibabel as nib
+import numpy as np
+import pytest
+from neuroquery.ridge import FittedLinearModel
+from nilearn.maskers import NiftiMasker
+
+from light_minded import projection, vocab_table
+
+
+@pytest.fixture
+def model():
+    # NeuroQuery-like model on a small 4mm mask with random coefficients
+    rng = np.random.default_rng(0)
+    affine = np.array([[-4., 0, 0, 90], [0, 4, 0, -126], [0, 0, 4, -72], [0, 0, 0, 1]])
+    mask = np.zeros((46, 55, 46), dtype=np.uint8)
+    mask[10:36, 12:44, 10:36] = 1
+    masker = NiftiMasker(nib.Nifti1Image(mask, affine)).fit()
+    n_voxels, n_terms = int(mask.sum()), 12
+    regression = FittedLinearModel(
+        coef=rng.normal(size=(n_voxels, n_terms)),
+        intercept=0.0,
+        M=rng.normal(size=(n_terms, 30)),
+        residual_var=rng.uniform(0.5, 2.0, size=n_voxels),
+    )
+    return SimpleNamespace(
+        smoothed_regression=SimpleNamespace(transform_to_z=True, regression_=regression),
+        get_masker=lambda: masker,
+        supervised_vocabulary=lambda: [f"term_{i}" for i in range(n_terms)],
+    )
+
+
+def test_table_matches_brain_map_path(model, tmp_path, monkeypatch):
+    monkeypatch.setattr(projection, "CACHE_DIR", tmp_path / "projection")
+    vocab_table.build_vocab_table("bna_246_3mm", model=model, cache_dir=tmp_path)
+    table = vocab_table.load_vocab_table("bna_246_3mm", cache_dir=tmp_path, build=False)
+
+    regression = model.smoothed_regression.regression_
+    weights = np.random.default_rng(1).uniform(size=(1, 12))
+    norm = np.linalg.norm(weights @ regression.M_)
+
+    z_map = model.get_masker().inverse_transform(regression.transform_to_z_maps(weights))
+    operator = projection.get_projection(z_map, "bna_246_3mm")
+    _, expected = operator.parcellate(z_map, threshold=None)
+
+    np.testing.assert_array_equal(table.region_ids, operator.region_ids)
+    np.testing.assert_allclose(table.project(weights[0], norm), expected, rtol=1e-4, atol=1e-5)
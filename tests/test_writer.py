@@ -0,0 +1,44 @@
+"""Tests for the background output writer."""
+
+import json
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from light_minded.writer import MapWriter
+
+
+@pytest.fixture
+def maps():
+    img = nib.Nifti1Image(np.random.default_rng(0).normal(size=(4, 5, 6)).astype(np.float32), np.eye(4))
+    return {"z_map": img, "z_map_resamp": img, "z_map_thresh": img}
+
+
+@pytest.mark.parametrize("map_format, suffix", [("nii.gz", ".nii.gz"), ("nii", ".nii"), ("npy16", ".npy")])
+def test_formats(tmp_path, maps, map_format, suffix):
+    with MapWriter(tmp_path, map_format=map_format) as writer:
+        paths = writer.submit_query("query_0", maps, b'{"roi_id":[1]}')
+    assert sorted(paths) == sorted([f"query_0_{name}{suffix}" for name in maps] + ["query_0_roi_data.json"])
+    for path in paths.values():
+        assert Path(path).exists()
+    if map_format == "npy16":
+        data = np.load(tmp_path / "query_0_z_map.npy")
+        assert data.dtype == np.float16
+        assert json.loads((tmp_path / "grids.json").read_text())["z_map"]["shape"] == [4, 5, 6]
+
+
+def test_skip_intermediate_and_json(tmp_path, maps):
+    writer = MapWriter(tmp_path, skip_intermediate=True)
+    paths = writer.submit_query("query_0", maps)
+    writer.submit_json("results.json", [{"query": "happy"}])
+    writer.append_json("results.jsonl", {"query": "happy"})
+    writer.append_json("results.jsonl", {"query": "sad"})
+    writer.flush()
+    assert list(paths) == ["query_0_z_map.nii"]
+    assert json.loads((tmp_path / "results.json").read_text()) == [{"query": "happy"}]
+    lines = (tmp_path / "results.jsonl").read_text().splitlines()
+    assert [json.loads(line)["query"] for line in lines] == ["happy", "sad"]
+    writer.close()
+    assert not writer.errors
@@ -0,0 +1,55 @@
+"""Tests for the memory-mapped z-map stack."""
+
+import nibabel as nib
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from light_minded.projection import build_projection
+from light_minded.zmap_stack import ZMapStack
+
+AFFINE = np.array([[-4., 0, 0, 90], [0, 4, 0, -126], [0, 0, 4, -72], [0, 0, 0, 1]])
+
+
+@pytest.fixture
+def z_maps():
+    rng = np.random.default_rng(0)
+    return [nib.Nifti1Image((gaussian_filter(rng.normal(size=(46, 55, 46)), 2) * 40)
+                            .astype(np.float32), AFFINE) for _ in range(3)]
+
+
+def test_parcellate_matches_projection(tmp_path, z_maps):
+    stack = ZMapStack(tmp_path, grid_atlas="bna_246_2mm", atlases=["bna_246_2mm"])
+    for i, z_map in enumerate(z_maps):
+        assert stack.add(f"query {i}", z_map) == i
+    assert stack.add("Query 0!", z_maps[1]) == 0
+    assert stack.maps.dtype == np.float16 and stack.maps.shape == (3, len(stack.mask_index))
+
+    projection = build_projection(z_maps[0].shape, AFFINE, "bna_246_2mm")
+    for threshold in (3.1, 1.0):
+        queries, region_ids, values = stack.parcellate("bna_246_2mm", threshold=threshold)
+        expected = [projection.parcellate(z_map, threshold=threshold)[1] for z_map in z_maps]
+        assert queries == ["query 0", "query 1", "query 2"]
+        np.testing.assert_array_equal(region_ids, projection.region_ids)
+        np.testing.assert_allclose(values, expected, atol=0.05)
+
+    # a fresh process reads the same rows back from the index
+    reloaded = ZMapStack(tmp_path)
+    assert len(reloaded) == 3 and "query 2" in reloaded
+    np.testing.assert_array_equal(reloaded.get("query 1"), stack.get("query 1"))
+
+
+def test_atlas_off_the_grid(tmp_path, z_maps):
+    stack = ZMapStack(tmp_path, grid_atlas="bna_246_2mm", atlases=["bna_246_2mm"])
+    stack.add("happy", z_maps[0])
+    with pytest.raises(ValueError):
+        stack.parcellate("bna_246_3mm")
+    with pytest.raises(ValueError):
+        stack.add("sad", nib.Nifti1Image(np.zeros((10, 10, 10), np.float32), AFFINE))
+
+
+def test_empty_stack(tmp_path):
+    stack = ZMapStack(tmp_path, grid_atlas="bna_246_2mm", atlases=["bna_246_2mm"])
+    assert stack.maps.shape == (0, len(stack.mask_index))
+    queries, region_ids, values = stack.parcellate("bna_246_2mm")
+    assert queries == [] and values.shape == (0, len(region_ids))